@@ -0,0 +1,68 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+from unittest import mock
+
+from varc_core.capture import CAPTURE_INDEX_MEMBER, CaptureReader
+from varc_core.utils.page_store import PAGE_SIZE, PAGE_STORE_MEMBER, page_table
+
+
+class TestCaptureReader(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.capture_path = os.path.join(self.tmp_dir.name, "capture.zip")
+        index = {
+            "format": "VarcCaptureIndex", "version": 1, "members": [],
+            "processes": {"42": {"Name": "python", "Dumps": ["process_dumps/python_42.mem"]}},
+            "dumps": [{"Process ID": 42, "Name": "python", "Member": "process_dumps/python_42.mem",
+                       "Regions": [[0x2000, 4096, 4096], [0x1000, 0, 4096]]}],
+            "files": {"ab" * 32: ["collected_files/bin/sh"]},
+        }
+        with zipfile.ZipFile(self.capture_path, "w") as capture:
+            capture.writestr("process_dumps/python_42.mem", b"A" * 4096 + b"B" * 4096, compress_type=zipfile.ZIP_STORED)
+            capture.writestr("processes.json", json.dumps({"format": "CadoJsonTable", "rows": [{"Process ID": 42}]}),
+                             compress_type=zipfile.ZIP_DEFLATED)
+            capture.writestr(CAPTURE_INDEX_MEMBER, json.dumps(index))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_regions_and_memory(self) -> None:
+        with CaptureReader(self.capture_path) as reader:
+            self.assertEqual(reader.regions_containing(42, 0x2010)[0]["Offset"], 4096)
+            self.assertEqual(reader.regions_containing(42, 0x3000), [])
+            self.assertEqual(reader.read_memory(42, 0x1ffe, 4), b"AA")
+            self.assertEqual(reader.read_memory(42, 0x2000, 2), b"BB")
+            self.assertIsNone(reader.read_memory(7, 0x1000, 2))
+
+    def test_tables_and_hashes(self) -> None:
+        with CaptureReader(self.capture_path) as reader:
+            self.assertEqual(reader.table("processes"), [{"Process ID": 42}])
+            self.assertEqual(reader.files_with_hash("AB" * 32), ["collected_files/bin/sh"])
+            with reader.member_view("processes.json") as view:
+                self.assertTrue(bytes(view).startswith(b"{"))
+
+    def test_compressed_page_store(self) -> None:
+        with zipfile.ZipFile(self.capture_path, "a") as capture:
+            capture.writestr(PAGE_STORE_MEMBER, b"C" * PAGE_SIZE + b"D" * PAGE_SIZE, compress_type=zipfile.ZIP_DEFLATED)
+            capture.writestr("process_dumps/nginx_7.mem.pages", page_table([1, 0, 1], 3 * PAGE_SIZE))
+        with CaptureReader(self.capture_path) as reader:
+            self.assertIn("process_dumps/nginx_7.mem", reader.dump_members())
+            with reader.member_view("process_dumps/nginx_7.mem") as view:
+                self.assertEqual(bytes(view), b"D" * PAGE_SIZE + b"C" * PAGE_SIZE + b"D" * PAGE_SIZE)
+
+    def test_iter_member_without_spilling(self) -> None:
+        with zipfile.ZipFile(self.capture_path, "a") as capture:
+            capture.writestr("process_dumps/bash_3.mem", b"E" * 10000, compress_type=zipfile.ZIP_DEFLATED)
+            capture.writestr(PAGE_STORE_MEMBER, b"C" * PAGE_SIZE + b"D" * PAGE_SIZE, compress_type=zipfile.ZIP_STORED)
+            capture.writestr("process_dumps/nginx_7.mem.pages", page_table([1, 0, 1], 3 * PAGE_SIZE - 10))
+        with CaptureReader(self.capture_path) as reader, \
+                mock.patch.object(reader, "_spill_path", side_effect=AssertionError("spilled to disk")):
+            self.assertEqual([len(chunk) for chunk in reader.iter_member("process_dumps/bash_3.mem", 4096)],
+                             [4096, 4096, 1808])
+            self.assertEqual(b"".join(reader.iter_member("process_dumps/nginx_7.mem", 5000)),
+                             (b"D" * PAGE_SIZE + b"C" * PAGE_SIZE + b"D" * PAGE_SIZE)[:-10])
+
@@ -0,0 +1,90 @@
+import os
+import tempfile
+import unittest
+import zipfile
+
+from varc_core.utils.checkpoint import CheckpointJournal, read_journal, recover_archive, resume
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.archive_path = os.path.join(self.temp_dir.name, "capture.zip")
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _write_unfinished(self, members: int) -> int:
+        """Writes members then cuts the archive part way through the next, returning where the last complete one ends"""
+        with zipfile.ZipFile(self.archive_path, "w", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            for number in range(members):
+                zip_file.writestr(f"files/{number}.txt", os.urandom(1000) + b"a" * number * 1000)
+            complete_end = zip_file.start_dir
+            zip_file.writestr("process_dumps/bash_1.mem", os.urandom(200000))
+        # As if killed while writing the dump, before the central directory was written
+        with open(self.archive_path, "r+b") as archive_file:
+            archive_file.truncate(complete_end + 100000)
+        return complete_end
+
+    def test_recover_unfinished_archive(self) -> None:
+        complete_end = self._write_unfinished(3)
+        self.assertEqual(recover_archive(self.archive_path), 3)
+        self.assertGreater(os.path.getsize(self.archive_path), complete_end)
+        with zipfile.ZipFile(self.archive_path) as recovered:
+            self.assertEqual(recovered.namelist(), ["files/0.txt", "files/1.txt", "files/2.txt"])
+            self.assertIsNone(recovered.testzip())
+        # Can be appended to as usual
+        with zipfile.ZipFile(self.archive_path, "a") as recovered:
+            recovered.writestr("files/3.txt", b"more")
+        with zipfile.ZipFile(self.archive_path) as recovered:
+            self.assertEqual(recovered.read("files/3.txt"), b"more")
+
+    def test_recover_to_checkpoint(self) -> None:
+        with zipfile.ZipFile(self.archive_path, "w") as zip_file:
+            zip_file.writestr("a.txt", b"a" * 100)
+            checkpoint_end = zip_file.start_dir
+            zip_file.writestr("b.txt", b"b" * 100)
+        self.assertEqual(recover_archive(self.archive_path, checkpoint_end), 1)
+        with zipfile.ZipFile(self.archive_path) as recovered:
+            self.assertEqual(recovered.namelist(), ["a.txt"])
+            self.assertEqual(recovered.read("a.txt"), b"a" * 100)
+
+    def test_resume_from_journal(self) -> None:
+        journal = CheckpointJournal(self.archive_path)
+        with zipfile.ZipFile(self.archive_path, "a") as zip_file:
+            zip_file.writestr("processes.json", b"[]")
+        journal.stage("volatile")
+        with zipfile.ZipFile(self.archive_path, "a") as zip_file:
+            zip_file.writestr("process_dumps/bash_1.mem", b"\x00" * 4096)
+            journal.record(zip_file, "dump", Dump={"Process ID": 1, "Name": "bash", "Member": "process_dumps/bash_1.mem"})
+            journal.record(zip_file, "file", File="/etc/passwd", Hashes=[{"File": "/etc/passwd", "SHA256": "00"}])
+            journal._write_pending()
+            zip_file.writestr("process_dumps/sshd_2.mem", b"\x00" * 4096)
+            unfinished_end = zip_file.start_dir
+        journal.close()
+        # Killed before the central directory was written
+        with open(self.archive_path, "r+b") as archive_file:
+            archive_file.truncate(unfinished_end)
+        with open(self.archive_path + ".journal", "a") as journal_file:
+            journal_file.write('{"Type": "dump", "End"')
+
+        self.assertEqual(len(read_journal(self.archive_path + ".journal")), 3)
+        state = resume(self.archive_path)
+        assert state is not None
+        self.assertEqual(list(state.stages), ["volatile"])
+        self.assertEqual(state.files, {"/etc/passwd"})
+        self.assertEqual([dump["Member"] for dump in state.dumps], ["process_dumps/bash_1.mem"])
+        self.assertEqual(state.hashes, [{"File": "/etc/passwd", "SHA256": "00"}])
+        with zipfile.ZipFile(self.archive_path) as recovered:
+            self.assertEqual(recovered.namelist(), ["processes.json", "process_dumps/bash_1.mem"])
+
+    def test_nothing_to_resume(self) -> None:
+        self.assertIsNone(resume(self.archive_path))
+        with zipfile.ZipFile(self.archive_path, "w") as zip_file:
+            zip_file.writestr("a.txt", b"a")
+        self.assertIsNone(resume(self.archive_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import hashlib
+import os
+import tempfile
+import unittest
+import zipfile
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+from varc_core.capture import CaptureReader
+from varc_core.utils import dumpfile_extraction
+
+
+class TestClassifyWindows(unittest.TestCase):
+
+    def test_classify_windows(self) -> None:
+        window = dumpfile_extraction.READ_AMOUNT
+        dump = os.urandom(window) + b"GET /index.html HTTP/1.1 " * (window // 25 + 1)
+        dump = dump[:window * 2] + bytes(window) + b"tail"
+        empty_windows, string_lengths = dumpfile_extraction.classify_windows(memoryview(dump))
+        self.assertEqual(empty_windows, [False, False, True, False])
+        self.assertLess(string_lengths[0], dumpfile_extraction.TEXT_THRESHOLD)
+        self.assertGreaterEqual(string_lengths[1], dumpfile_extraction.TEXT_THRESHOLD)
+
+
+    @unittest.skipUnless(dumpfile_extraction._NUMPY_AVAILABLE, "NumPy isn't installed")
+    def test_classify_windows_without_numpy(self) -> None:
+        # Strings crossing windows and batches, UTF-16 strings, short runs and a short zeroed last window
+        window = 100
+        dump = (os.urandom(window * 399 + 50) + b"a string across two batches" + "wide string".encode("utf-16-le")
+                + b"ab\x01cd\x02" * 50 + os.urandom(window * 3) + bytes(30))
+        with mock.patch.object(dumpfile_extraction, "_NUMPY_AVAILABLE", False):
+            fallback = dumpfile_extraction.classify_windows(memoryview(dump), window)
+        self.assertEqual(fallback, dumpfile_extraction.classify_windows(memoryview(dump), window))
+        self.assertTrue(fallback[0][-1])
+
+
+class TestCarving(unittest.TestCase):
+
+    def test_detect_extension(self) -> None:
+        self.assertEqual(dumpfile_extraction.detect_extension(bytes.fromhex("89504e470d0a1a0a") + os.urandom(64)), ".png")
+        self.assertEqual(dumpfile_extraction.detect_extension(b"MZ\x90\x00\x03" + os.urandom(64)), ".exe")
+        self.assertEqual(dumpfile_extraction.detect_extension(b"plain text\n", True), ".txt")
+        with mock.patch.object(dumpfile_extraction, "_MAGIC_AVAILABLE", False):
+            self.assertEqual(dumpfile_extraction.detect_extension(b"\x00\x01\x02" + os.urandom(64)), ".bin")
+
+    def test_split_log_entries(self) -> None:
+        text = "header 2022-01-01 first 2021-12-31 second 2022-01-02 third"
+        self.assertEqual(dumpfile_extraction.split_log_entries(text, ("2022", "2021")),
+                         ["header ", "2022-01-01 first ", "2021-12-31 second ", "2022-01-02 third"])
+
+    def test_extract_dumps_into_archive(self) -> None:
+        year = datetime.utcnow().year
+        log = "".join(f"{year}-01-0{day} 12:00:00 service started on port 808{day}\n" for day in range(1, 10))
+        window = dumpfile_extraction.READ_AMOUNT
+        dump = os.urandom(window) + (log.encode() * (window // len(log) + 1))[:window] + os.urandom(window)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            capture_path = os.path.join(tmp_dir, "capture.zip")
+            with zipfile.ZipFile(capture_path, "w") as capture:
+                capture.writestr("process_dumps/python_42.mem", dump, compress_type=zipfile.ZIP_DEFLATED)
+            # Compressed dumps are carved as they're decompressed, without a temporary copy
+            with mock.patch.object(CaptureReader, "_spill_path", side_effect=AssertionError("spilled to disk")):
+                carved_hashes = dumpfile_extraction.extract_dumps(Path(capture_path))
+            with zipfile.ZipFile(capture_path) as capture:
+                carved = {name: capture.read(name) for name in capture.namelist() if "_carved/" in name}
+            with CaptureReader(capture_path) as reader:
+                string_hits = reader.search_strings("8083")
+        self.assertEqual(sorted(carved_hash["Member"] for carved_hash in carved_hashes), sorted(carved))
+        for carved_hash in carved_hashes:
+            self.assertEqual(hashlib.sha256(carved[carved_hash["Member"]]).hexdigest(), carved_hash["SHA256"])
+        log_entries = [content for name, content in carved.items() if name.endswith(".log")]
+        self.assertIn(f"{year}-01-03 12:00:00 service started on port 8083\n".encode(), log_entries)
+        self.assertTrue(string_hits)
+        for hit in string_hits:
+            self.assertEqual(dump[hit["Offset"]:hit["Offset"] + 4], b"8083")
+            # No capture index yet, so the process id comes from the dump's name
+            self.assertEqual(hit["Process ID"], 42)
@@ -0,0 +1,54 @@
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+
+from varc_core.fleet import FleetCoordinator
+
+# Agent which streams a minimal capture back over stdout
+_AGENT_SCRIPT = (
+    "import io, json, sys, zipfile\n"
+    "buffer = io.BytesIO()\n"
+    "with zipfile.ZipFile(buffer, 'w') as capture:\n"
+    "    capture.writestr('processes.json', json.dumps({'format': 'CadoJsonTable', 'rows': [{'Process ID': 1}]}))\n"
+    "    capture.writestr('collected_files/bin/sh', b'binary')\n"
+    "sys.stdout.buffer.write(buffer.getvalue())\n"
+)
+
+
+class TestFleet(unittest.TestCase):
+
+    def test_collect_and_index(self) -> None:
+        targets = [
+            {"name": "agent-1", "command": [sys.executable, "-c", _AGENT_SCRIPT]},
+            {"name": "agent-2", "command": [sys.executable, "-c", _AGENT_SCRIPT]},
+            {"name": "broken", "command": [sys.executable, "-c", "raise SystemExit(1)"]},
+        ]
+        with tempfile.TemporaryDirectory() as output_dir:
+            results = FleetCoordinator(targets, output_dir, max_workers=2, retries=1).run()
+            self.assertEqual([result["Status"] for result in results], ["collected", "collected", "failed"])
+            self.assertEqual(results[2]["Attempts"], 2)
+            with open(os.path.join(output_dir, "fleet_processes.json")) as processes_in:
+                processes = json.load(processes_in)["rows"]
+            self.assertEqual(sorted(row["Target"] for row in processes), ["agent1", "agent2"])
+            with open(os.path.join(output_dir, "fleet_hashes.json")) as hashes_in:
+                hashes = json.load(hashes_in)["rows"]
+            self.assertEqual(len({row["SHA256"] for row in hashes}), 1)
+
+    def test_hung_agent_times_out(self) -> None:
+        # Never writes or closes stdout, so streaming alone would wait forever
+        targets = [{"name": "hung", "command": [sys.executable, "-c", "import time; time.sleep(60)"]}]
+        with tempfile.TemporaryDirectory() as output_dir:
+            started = time.time()
+            results = FleetCoordinator(targets, output_dir, retries=0, timeout=0.5).run()
+        self.assertLess(time.time() - started, 10)
+        self.assertEqual(results[0]["Status"], "failed")
+        self.assertEqual(results[0]["Error"], "Timed out after 0.5 seconds")
+
+    def test_duplicate_capture_names(self) -> None:
+        targets = [{"name": "web-1", "command": ["true"]}, {"name": "web1", "command": ["true"]}]
+        with tempfile.TemporaryDirectory() as output_dir:
+            with self.assertRaises(ValueError):
+                FleetCoordinator(targets, output_dir)
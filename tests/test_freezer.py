@@ -0,0 +1,69 @@
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from varc_core.utils.freezer import FREEZE_SIGNAL, ProcessFreezer, ancestor_pids
+
+
+def _state(pid: int) -> str:
+    with open(f"/proc/{pid}/stat", "r") as stat_file:
+        return stat_file.read().rsplit(")", 1)[1].split()[0]
+
+
+@unittest.skipUnless(sys.platform.startswith("linux"), "Freezing is only supported on Linux")
+class TestProcessFreezer(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.cgroup_root = tempfile.TemporaryDirectory()
+        self.freezer = ProcessFreezer(os.getpid(), cgroup_root=self.cgroup_root.name)
+
+    def tearDown(self) -> None:
+        self.cgroup_root.cleanup()
+
+    def test_freezes_and_thaws(self) -> None:
+        # Processes sharing the runner's stdio pipes are never frozen
+        child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"], start_new_session=True,
+                                 stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            with self.freezer.frozen(child.pid) as method:
+                self.assertEqual(method, FREEZE_SIGNAL)
+                self.assertEqual(_state(child.pid), "T")
+            self.assertNotEqual(_state(child.pid), "T")
+        finally:
+            child.kill()
+            child.wait()
+
+    def test_never_freezes_own_process_group(self) -> None:
+        self.assertIn(os.getppid(), ancestor_pids(os.getpid()))
+        child = subprocess.Popen([sys.executable, "-c", "import time; time.sleep(30)"])
+        try:
+            for pid in (os.getpid(), os.getppid(), child.pid):
+                with self.freezer.frozen(pid) as method:
+                    self.assertIsNone(method)
+        finally:
+            child.kill()
+            child.wait()
+
+    def test_cgroup_freezer_only_for_lone_process(self) -> None:
+        with tempfile.TemporaryDirectory() as procfs_root:
+            cgroups = {100: ("/system.slice/lone.service", "100"), 101: ("/system.slice/shared.service", "101\n102"),
+                       103: ("/init.scope", "103"), 104: ("/user.slice", "104"), 105: ("/pod", "105")}
+            for pid, (cgroup, procs) in cgroups.items():
+                os.makedirs(os.path.join(procfs_root, str(pid)))
+                with open(os.path.join(procfs_root, str(pid), "cgroup"), "w") as cgroup_file:
+                    cgroup_file.write(f"0::{cgroup}\n")
+                cgroup_dir = os.path.join(self.cgroup_root.name, cgroup.lstrip("/"))
+                os.makedirs(cgroup_dir, exist_ok=True)
+                for name, content in (("cgroup.freeze", "0"), ("cgroup.procs", procs)):
+                    with open(os.path.join(cgroup_dir, name), "w") as cgroup_out:
+                        cgroup_out.write(content)
+            # A cgroup below the pod has processes, which freezing the pod would freeze too
+            os.makedirs(os.path.join(self.cgroup_root.name, "pod", "sidecar"))
+            with open(os.path.join(self.cgroup_root.name, "pod", "sidecar", "cgroup.events"), "w") as events:
+                events.write("populated 1\nfrozen 0\n")
+            freezer = ProcessFreezer(os.getpid(), procfs_root, self.cgroup_root.name)
+            self.assertEqual(freezer._freezable_cgroup(100), os.path.join(self.cgroup_root.name, "system.slice/lone.service"))
+            for pid in (101, 103, 104, 105):
+                self.assertIsNone(freezer._freezable_cgroup(pid))
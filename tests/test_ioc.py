@@ -0,0 +1,28 @@
+import hashlib
+import os
+import tempfile
+import unittest
+
+from varc_core.utils.ioc import IocIndex
+
+
+class TestIocIndex(unittest.TestCase):
+
+    def test_lookup(self) -> None:
+        hashes = [hashlib.sha256(str(count).encode()).hexdigest() for count in range(1000)]
+        index = IocIndex(hashes[::2])
+        self.assertEqual(len(index), 500)
+        self.assertTrue(all(sha256 in index for sha256 in hashes[::2]))
+        self.assertFalse(any(sha256 in index for sha256 in hashes[1::2]))
+        self.assertIn(hashes[0].upper(), index)
+        self.assertNotIn("not a hash", index)
+
+    def test_from_file(self) -> None:
+        sha256 = hashlib.sha256(b"malware").hexdigest()
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ioc_path = os.path.join(tmp_dir, "iocs.csv")
+            with open(ioc_path, "w") as ioc_out:
+                ioc_out.write(f"# sha256,description\n{sha256},dropper\n{hashlib.md5(b'x').hexdigest()},md5\n")
+            index = IocIndex.from_file(ioc_path)
+        self.assertEqual(len(index), 1)
+        self.assertIn(sha256, index)
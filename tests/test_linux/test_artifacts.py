@@ -0,0 +1,78 @@
+import asyncio
+import os
+import threading
+import unittest
+from typing import List
+
+from varc_core.artifacts import Artifact, CarvedFile, MemoryChunk, OpenFile, ProcessRow
+from varc_core.systems.linux import LinuxSystem
+
+_MARKER = b"varc artifact stream marker " * 4
+
+
+class TestArtifacts(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.system = LinuxSystem(include_memory=True, include_open=True, extract_dumps=False, yara_file=None,
+                                  process_id=os.getpid(), take_screenshot=False, collect=False)
+
+    def test_iter_artifacts(self) -> None:
+        marker = bytearray(_MARKER)
+        found_marker = False
+        kinds = set()
+        for artifact in self.system.iter_artifacts():
+            kinds.add(type(artifact))
+            if isinstance(artifact, ProcessRow):
+                self.assertEqual(artifact.row["Process ID"], os.getpid())
+            elif isinstance(artifact, MemoryChunk):
+                found_marker = found_marker or bytes(marker) in artifact.data
+        self.assertTrue({ProcessRow, OpenFile, MemoryChunk} <= kinds)
+        self.assertTrue(found_marker)
+        self.assertFalse(os.path.exists(self.system.output_path))
+
+    def test_iter_volatile_yields_as_collectors_finish(self) -> None:
+        release = threading.Event()
+        copied = threading.Event()
+        dump_loaded_files = self.system.dump_loaded_files
+
+        def slow_dump_loaded_files() -> List[str]:
+            release.wait(5)
+            copied.set()
+            return dump_loaded_files()
+
+        self.system.dump_loaded_files = slow_dump_loaded_files  # type: ignore
+        artifacts = self.system.iter_volatile()
+        # Process rows come out while open files are still being copied
+        self.assertIsInstance(next(artifacts), ProcessRow)
+        self.assertFalse(copied.is_set())
+        release.set()
+        self.assertIn(OpenFile, {type(artifact) for artifact in artifacts})
+
+    def test_iter_artifacts_carves_memory(self) -> None:
+        marker = bytearray(_MARKER)
+        self.system.extract_dumps = True
+        kinds = []
+        carved_marker = False
+        for artifact in self.system.iter_artifacts():
+            kinds.append(type(artifact))
+            if isinstance(artifact, CarvedFile):
+                self.assertEqual(artifact.pid, os.getpid())
+                self.assertTrue(artifact.file_name.startswith(f"{artifact.name}_{os.getpid()}"))
+                carved_marker = carved_marker or bytes(marker) in artifact.data
+        # Carved files are yielded as the memory they're carved from is read, rather than after it all
+        self.assertIn(CarvedFile, kinds)
+        self.assertLess(kinds.index(CarvedFile), len(kinds) - 1 - kinds[::-1].index(MemoryChunk))
+        self.assertTrue(carved_marker)
+
+    def test_aiter_artifacts(self) -> None:
+        async def first_artifacts() -> List[Artifact]:
+            artifacts = []
+            async for artifact in self.system.aiter_artifacts():
+                artifacts.append(artifact)
+                if len(artifacts) == 2:
+                    break
+            return artifacts
+
+        artifacts = asyncio.run(first_artifacts())
+        self.assertIsInstance(artifacts[0], ProcessRow)
+        self.assertFalse(os.path.exists(self.system.output_path))
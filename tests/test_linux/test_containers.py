@@ -0,0 +1,76 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import unittest
+import zipfile
+from typing import Any, List
+
+from varc_core.artifacts import OpenFile
+from varc_core.systems.linux import LinuxSystem
+from varc_core.utils import containers
+
+_CONTAINER_ID = "3f4e8a9b" * 8
+
+
+class TestContainers(unittest.TestCase):
+
+    def test_container_id_from_cgroup(self) -> None:
+        self.assertEqual(containers.container_id_from_cgroup(f"/system.slice/docker-{_CONTAINER_ID}.scope"), _CONTAINER_ID)
+        self.assertEqual(containers.container_id_from_cgroup(f"/kubepods/burstable/pod1234/{_CONTAINER_ID}"), _CONTAINER_ID)
+        self.assertIsNone(containers.container_id_from_cgroup("/user.slice/user-0.slice"))
+
+    def test_container_info_from_procfs(self) -> None:
+        with tempfile.TemporaryDirectory() as procfs_root:
+            os.makedirs(os.path.join(procfs_root, "42"))
+            with open(os.path.join(procfs_root, "42", "cgroup"), "w") as cgroup_file:
+                cgroup_file.write(f"0::/kubepods/pod1234/{_CONTAINER_ID}\n")
+            info = containers.get_container_info(42, procfs_root)
+            self.assertEqual(info["Container ID"], _CONTAINER_ID)
+
+    def test_resolve_container_files_dedupes(self) -> None:
+        with tempfile.TemporaryDirectory() as procfs_root:
+            root = os.path.join(procfs_root, "42", "root")
+            os.makedirs(os.path.join(root, "bin"))
+            with open(os.path.join(root, "bin", "sh"), "wb") as binary:
+                binary.write(b"\x7fELF")
+            os.symlink("bin", os.path.join(root, "usrbin"))
+            resolved = containers.resolve_container_files(
+                [(42, "/bin/sh"), (42, "/bin/sh"), (42, "/usrbin/sh"), (42, "/missing")], procfs_root
+            )
+            self.assertEqual(resolved, [(os.path.join(root, "bin/sh"), "/bin/sh")])
+
+
+class TestContainerFiles(unittest.TestCase):
+
+    def test_files_read_ahead_on_workers(self) -> None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            capture_path = os.path.join(tmp_dir, "capture.zip")
+            system = LinuxSystem(include_memory=False, include_open=True, extract_dumps=False, yara_file=None,
+                                 take_screenshot=False, container_mode=True, container_workers=2,
+                                 output_path=capture_path, collect=False)
+            reading_threads: List[str] = []
+            read_whole = system._read_whole
+
+            def recording_read_whole(file_path: str, listed_path: str) -> Any:
+                reading_threads.append(threading.current_thread().name)
+                return read_whole(file_path, listed_path)
+
+            system._read_whole = recording_read_whole  # type: ignore
+            artifacts = []
+            for number in range(10):
+                path = os.path.join(tmp_dir, f"{number}.txt")
+                with open(path, "wb") as file_out:
+                    file_out.write(str(number).encode() * 1000)
+                artifacts.append(OpenFile(path, f"/data/{number}.txt", f"./containers/{number}/collected_files/data.txt"))
+            system.write_artifacts(artifacts)
+            with zipfile.ZipFile(capture_path) as capture:
+                open_files = json.loads(capture.read("open_files.json"))["rows"]
+                contents = [capture.read(f"containers/{number}/collected_files/data.txt") for number in range(10)]
+        self.assertEqual(len(reading_threads), 10)
+        self.assertTrue(all(name.startswith("varc_read_ahead") for name in reading_threads))
+        self.assertEqual([row["Open File"] for row in open_files], [artifact.listed_path for artifact in artifacts])
+        self.assertEqual(contents, [str(number).encode() * 1000 for number in range(10)])
+        self.assertEqual([file_hash["SHA256"] for file_hash in system.file_hashes],
+                         [hashlib.sha256(content).hexdigest() for content in contents])
@@ -0,0 +1,69 @@
+import os
+import struct
+import tempfile
+import time
+import unittest
+
+from varc_core.utils.proc_events import (EVENT_EXEC, EVENT_EXIT, EVENT_FORK, EVENT_START, ProcessEvent,
+                                         ProcPollMonitor, describe_process, parse_events)
+
+
+def _message(what: int, *fields: int) -> bytes:
+    event = struct.pack("=IIQ", what, 0, 123456789) + struct.pack(f"={len(fields)}I", *fields)
+    connector = struct.pack("=IIIIHH", 1, 1, 0, 0, len(event), 0) + event
+    return struct.pack("=IHHII", 16 + len(connector), 3, 0, 0, 0) + connector
+
+
+class TestProcEvents(unittest.TestCase):
+
+    def test_parse_events(self) -> None:
+        data = (_message(0x1, 10, 10, 11, 11)
+                # A thread of process 11, ignored
+                + _message(0x1, 11, 11, 12, 11)
+                + _message(0x2, 11, 11)
+                + _message(0x80000000, 11, 11, 3 << 8, 17)
+                + _message(0x80000000, 13, 13, 9, 17))
+        self.assertEqual(list(parse_events(data, 1.0)), [
+            ProcessEvent(1.0, EVENT_FORK, 11, 10),
+            ProcessEvent(1.0, EVENT_EXEC, 11),
+            ProcessEvent(1.0, EVENT_EXIT, 11, exit_code=3),
+            ProcessEvent(1.0, EVENT_EXIT, 13, exit_code=-9),
+        ])
+
+    def test_describe_process(self) -> None:
+        description = describe_process(os.getpid())
+        self.assertEqual(description["Parent ID"], os.getppid())
+        self.assertIn("python", description["Executable Path"])
+        # Nothing can be read for a process that has exited
+        self.assertEqual(describe_process(2 ** 22 + 1), {"Parent ID": 0})
+
+    def test_poll_monitor(self) -> None:
+        with tempfile.TemporaryDirectory() as procfs_root:
+            os.mkdir(os.path.join(procfs_root, "1"))
+            monitor = ProcPollMonitor(procfs_root, interval=0.01).start()
+            time.sleep(0.05)
+            # Written elsewhere then moved into place, so it appears complete
+            staging_dir = os.path.join(procfs_root, "staging")
+            os.mkdir(staging_dir)
+            with open(os.path.join(staging_dir, "stat"), "w") as stat_file:
+                stat_file.write("42 (evil miner) S 1 42 42")
+            with open(os.path.join(staging_dir, "cmdline"), "wb") as cmdline_file:
+                cmdline_file.write(b"./miner\0--pool\0")
+            process_dir = os.path.join(procfs_root, "42")
+            os.rename(staging_dir, process_dir)
+            time.sleep(0.05)
+            for name in os.listdir(process_dir):
+                os.remove(os.path.join(process_dir, name))
+            os.rmdir(process_dir)
+            time.sleep(0.05)
+            monitor.stop()
+        self.assertEqual([(event.event, event.pid, event.ppid) for event in monitor.events],
+                         [(EVENT_START, 42, 1), (EVENT_EXIT, 42, 0)])
+        self.assertEqual(monitor.started.get_nowait(), 42)
+        rows = monitor.rows()
+        self.assertEqual(rows[0]["Command"], "./miner --pool")
+        self.assertEqual(rows[0]["Parent ID"], 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,48 @@
+import os
+import tempfile
+import unittest
+
+from varc_core.utils.proc_maps import mapped_files, parse_maps
+
+_MAPS = b"""55d0c8a00000-55d0c8a28000 r--p 00000000 fd:01 1311013                    /usr/bin/python3.11
+55d0c8a28000-55d0c8cf8000 r-xp 00028000 fd:01 1311013                    /usr/bin/python3.11
+55d0ca1f3000-55d0ca2a4000 rw-p 00000000 00:00 0                          [heap]
+7f1c2a000000-7f1c2a021000 rw-p 00000000 00:00 0 
+7f1c2b400000-7f1c2b401000 ---p 00000000 00:00 0 
+7f1c2b5c0000-7f1c2b5e8000 r--p 00000000 fd:01 1312450                    /usr/lib/x86_64-linux-gnu/libc.so.6
+7f1c2b800000-7f1c2b900000 rw-s 00000000 00:05 32768                      /dev/shm/my segment (deleted)
+ffffffffff600000-ffffffffff601000 --xp 00000000 00:00 0                  [vsyscall]
+"""
+
+
+class TestProcMaps(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.procfs_root = tempfile.TemporaryDirectory()
+        os.makedirs(os.path.join(self.procfs_root.name, "42"))
+        with open(os.path.join(self.procfs_root.name, "42", "maps"), "wb") as maps_file:
+            maps_file.write(_MAPS)
+
+    def tearDown(self) -> None:
+        self.procfs_root.cleanup()
+
+    def test_parse_maps(self) -> None:
+        regions = parse_maps(42, self.procfs_root.name)
+        self.assertEqual(len(regions), 8)
+        self.assertEqual(regions[1].start, 0x55d0c8a28000)
+        self.assertEqual(regions[1].offset, 0x28000)
+        self.assertEqual(regions[1].device, "fd:01")
+        self.assertEqual(regions[1].inode, 1311013)
+        self.assertEqual(regions[3].path, "")
+        self.assertFalse(regions[4].readable)
+        self.assertEqual(regions[6].path, "/dev/shm/my segment (deleted)")
+        self.assertEqual(regions[7].end, 0xffffffffff601000)
+
+    def test_mapped_files(self) -> None:
+        self.assertEqual(mapped_files(parse_maps(42, self.procfs_root.name)), [
+            "/usr/bin/python3.11", "/usr/lib/x86_64-linux-gnu/libc.so.6", "/dev/shm/my segment (deleted)"
+        ])
+
+    def test_missing_process(self) -> None:
+        with self.assertRaises(FileNotFoundError):
+            parse_maps(43, self.procfs_root.name)
@@ -0,0 +1,74 @@
+import os
+import tempfile
+import unittest
+from array import array
+from collections import Counter
+from typing import Optional
+
+from varc_core.systems.linux import LinuxSystem
+from varc_core.utils.page_store import PAGE_SIZE
+
+_BASE = 0x10000
+
+
+class _FakeMemory(LinuxSystem):
+    """LinuxSystem reading from an in memory address space, without running collection"""
+
+    def __init__(self, pages: int, unreadable: set, mem_readable: set) -> None:
+        memory = bytearray(pages * PAGE_SIZE)
+        memory[::PAGE_SIZE] = bytes(page % 251 for page in range(pages))
+        self.memory = bytes(memory)
+        self.unreadable = unreadable
+        self.mem_readable = mem_readable
+        self.reads = 0
+
+    def _read(self, address: int, byte: int, readable: set) -> Optional[bytes]:
+        self.reads += 1
+        end = address
+        while end < address + byte and (end - _BASE) // PAGE_SIZE not in readable:
+            end += PAGE_SIZE
+        if end == address:
+            return None
+        return self.memory[address - _BASE:end - _BASE]
+
+    def read_bytes(self, pid: int, address: int, byte: int) -> Optional[bytes]:
+        return self._read(address, byte, self.unreadable)
+
+    def _pread_mem(self, mem_fd: Optional[int], address: int, byte: int) -> Optional[bytes]:  # type: ignore
+        return self._read(address, byte, self.unreadable - self.mem_readable)
+
+
+class TestReadRange(unittest.TestCase):
+
+    def test_reads_around_unreadable_pages(self) -> None:
+        system = _FakeMemory(64, unreadable={5, 6, 40}, mem_readable={40})
+        segments, holes = system.read_range(1, _BASE, 64 * PAGE_SIZE, mem_fd=0)
+        self.assertEqual(holes, [(_BASE + 5 * PAGE_SIZE, 2 * PAGE_SIZE)])
+        recovered = b"".join(content for _, content in segments)
+        self.assertEqual(recovered, system.memory[:5 * PAGE_SIZE] + system.memory[7 * PAGE_SIZE:])
+        self.assertEqual([address for address, _ in segments], sorted(address for address, _ in segments))
+
+    def test_bad_page_costs_few_reads(self) -> None:
+        system = _FakeMemory(65536, unreadable={30000}, mem_readable=set())
+        segments, holes = system.read_range(1, _BASE, 65536 * PAGE_SIZE)
+        self.assertEqual(holes, [(_BASE + 30000 * PAGE_SIZE, PAGE_SIZE)])
+        self.assertEqual(sum(len(content) for _, content in segments), 65535 * PAGE_SIZE)
+        self.assertLess(system.reads, 100)
+
+    def test_unreadable_page_map_reads_rest_of_region(self) -> None:
+        system = _FakeMemory(16, unreadable=set(), mem_readable=set())
+        system.resident_only = True
+        system._MAX_VIRTUAL_PAGE_CHUNK = 256 * PAGE_SIZE
+        with tempfile.TemporaryDirectory() as procfs_root:
+            system.procfs_root = procfs_root
+            os.mkdir(os.path.join(procfs_root, "1"))
+            # Covers the first 4 pages of the region only, the second not present
+            present = 1 << 63
+            entries = array("Q", [0] * (_BASE // PAGE_SIZE) + [present, 0, present, present])
+            with open(os.path.join(procfs_root, "1", "pagemap"), "wb") as pagemap:
+                pagemap.write(entries.tobytes())
+            skipped: Counter = Counter()
+            ranges = list(system.read_ranges(1, _BASE, _BASE + 10 * PAGE_SIZE, skipped))
+        self.assertEqual(ranges, [(_BASE, PAGE_SIZE), (_BASE + 2 * PAGE_SIZE, 2 * PAGE_SIZE),
+                                  (_BASE + 4 * PAGE_SIZE, 6 * PAGE_SIZE)])
+        self.assertEqual(skipped["not_present"], 1)
@@ -0,0 +1,35 @@
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from varc_core.capture import CaptureReader
+from varc_core.systems.linux import LinuxSystem
+
+_MARKER = "varcstringsmarker"
+
+
+class TestStringsSearch(unittest.TestCase):
+
+    def test_search_finds_dumped_process(self) -> None:
+        holder = subprocess.Popen([sys.executable, "-c", f"import time; text = '{_MARKER} ' * 20000; time.sleep(60)"])
+        try:
+            time.sleep(0.5)
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                output_path = os.path.join(tmp_dir, "capture.zip")
+                LinuxSystem(include_memory=True, include_open=False, extract_dumps=True, yara_file=None,
+                            process_id=holder.pid, take_screenshot=False, output_path=output_path)
+                with CaptureReader(output_path) as reader:
+                    hits = reader.search_strings(_MARKER)
+        finally:
+            holder.kill()
+            holder.wait()
+        self.assertTrue(hits)
+        # Dumps are carved before the capture index is written, so the process id comes from the dump manifest
+        self.assertEqual({hit["Process ID"] for hit in hits}, {holder.pid})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import hashlib
+import os
+import subprocess
+import tarfile
+import tempfile
+import unittest
+import zipfile
+from typing import List, Tuple
+
+import lz4.frame  # type: ignore
+
+from varc_core.systems.linux import LinuxSystem
+
+
+def _members(capture_path: str) -> Tuple[List[str], List[str]]:
+    """Returns the members of the tar of a tar.lz4 capture, and of the zip appended to it, if any"""
+    with lz4.frame.open(capture_path, "rb") as lz4_in, tarfile.open(fileobj=lz4_in) as tar:
+        tar_members = tar.getnames()
+    zip_members = zipfile.ZipFile(capture_path).namelist() if zipfile.is_zipfile(capture_path) else []
+    return tar_members, zip_members
+
+
+class TestTarOutput(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.capture_path = os.path.join(self.tmp_dir.name, "capture.tar.lz4")
+        self.sleeper = subprocess.Popen(["sleep", "60"])
+
+    def tearDown(self) -> None:
+        self.sleeper.kill()
+        self.sleeper.wait()
+        self.tmp_dir.cleanup()
+
+    def test_process_events_keep_capture(self) -> None:
+        LinuxSystem(include_memory=True, include_open=False, extract_dumps=False, yara_file=None,
+                    process_id=self.sleeper.pid, take_screenshot=False, output_path=self.capture_path,
+                    process_events=True)
+        tar_members, zip_members = _members(self.capture_path)
+        self.assertEqual(sorted(tar_members), ["netstat.log", "open_files.json", "processes.json"])
+        self.assertEqual(sorted(zip_members), [f"process_dumps/sleep_{self.sleeper.pid}.mem", "process_events.json"])
+
+    def test_triage_verdict_kept(self) -> None:
+        ioc_path = os.path.join(self.tmp_dir.name, "iocs.csv")
+        with open(os.readlink(f"/proc/{self.sleeper.pid}/exe"), "rb") as exe_in:
+            sleep_sha256 = hashlib.sha256(exe_in.read()).hexdigest()
+        for iocs, expected in (([], ["triage.json"]),
+                               ([sleep_sha256], ["netstat.log", "open_files.json", "processes.json", "triage.json"])):
+            with open(ioc_path, "w") as ioc_out:
+                ioc_out.write("".join(f"{sha256}\n" for sha256 in iocs or [hashlib.sha256(b"x").hexdigest()]))
+            LinuxSystem(include_memory=False, include_open=False, extract_dumps=False, yara_file=None,
+                        process_id=self.sleeper.pid, take_screenshot=False, output_path=self.capture_path,
+                        triage=True, ioc_file=ioc_path)
+            self.assertEqual(sorted(_members(self.capture_path)[0]), expected)
+
+    def test_triage_without_checks_collects_everything(self) -> None:
+        with self.assertLogs(level="ERROR"):
+            LinuxSystem(include_memory=False, include_open=False, extract_dumps=False, yara_file=None,
+                        process_id=self.sleeper.pid, take_screenshot=False, output_path=self.capture_path,
+                        triage=True)
+        self.assertEqual(sorted(_members(self.capture_path)[0]), ["netstat.log", "open_files.json", "processes.json"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,141 @@
+import json
+import os
+import subprocess
+import tempfile
+import time
+import unittest
+import zipfile
+
+from varc_core.watch import (CHANGE_CONNECTION, CHANGE_OPEN_FILE, CHANGE_PROCESS_EXEC, CHANGE_PROCESS_EXIT,
+                             CHANGE_PROCESS_START, RollingJournal, Snapshot, Watcher, diff_snapshots, read_sockets,
+                             read_watch_journal, rule_matches)
+
+
+class TestWatch(unittest.TestCase):
+
+    def test_read_sockets(self) -> None:
+        with tempfile.TemporaryDirectory() as procfs_root:
+            os.mkdir(os.path.join(procfs_root, "net"))
+            with open(os.path.join(procfs_root, "net", "tcp"), "w") as tcp_table:
+                tcp_table.write("  sl  local_address rem_address   st tx_queue rx_queue tr tm->when retrnsmt   uid  timeout inode\n"
+                                "   0: 0100007F:0050 00000000:0000 0A 00000000:00000000 00:00000000 00000000     0        0 4242 1\n"
+                                "   1: 0100007F:9C40 0200000A:115C 01 00000000:00000000 00:00000000 00000000     0        0 4343 1\n"
+                                "   2: 0100007F:9C41 0200000A:115C 06 00000000:00000000 00:00000000 00000000     0        0 0 1\n")
+            sockets = read_sockets(procfs_root)
+        self.assertEqual(sorted(sockets), [4242, 4343])
+        self.assertEqual(sockets[4242]["State"], "LISTEN")
+        self.assertEqual((sockets[4343]["Remote Address"], sockets[4343]["Remote Port"]), ("10.0.0.2", 4444))
+
+    def test_diff_and_rules(self) -> None:
+        old = Snapshot({1: {"Name": "init"}, 2: {"Name": "cron"}}, {}, {1: {"/var/log/syslog"}})
+        sock = {"Protocol": "tcp", "Remote Address": "10.0.0.2", "Remote Port": 4444, "Process ID": 3}
+        new = Snapshot({1: {"Name": "init"}, 3: {"Name": "bash", "Command": "bash -i"}}, {7: sock},
+                       {1: {"/var/log/syslog", "/tmp/x"}, 3: set()})
+        changes = diff_snapshots(old, new)
+        self.assertEqual([(change["Type"], change["Process ID"]) for change in changes], [
+            (CHANGE_PROCESS_START, 3), (CHANGE_PROCESS_EXIT, 2), (CHANGE_CONNECTION, 3), (CHANGE_OPEN_FILE, 1)])
+        self.assertEqual(changes[2]["Name"], "bash")
+        self.assertEqual(changes[3]["Path"], "/tmp/x")
+        rule = {"name": "reverse shell", "type": CHANGE_CONNECTION, "match": {"Name": "*sh", "Remote Port": "4444"}}
+        self.assertEqual([change["Type"] for change in changes if rule_matches(rule, change)], [CHANGE_CONNECTION])
+
+    def test_watch_notices_exec(self) -> None:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            watcher = Watcher(journal_dir)
+            shell = subprocess.Popen(["sh", "-c", "read line; exec sleep 31.7"], stdin=subprocess.PIPE)
+            try:
+                time.sleep(0.05)
+                watcher.step()
+                assert watcher.snapshot is not None and shell.stdin is not None
+                self.assertEqual(watcher.snapshot.processes[shell.pid]["Name"], "sh")
+                shell.stdin.write(b"\n")
+                shell.stdin.flush()
+                time.sleep(0.1)
+                changes = watcher.step()
+                watcher.close()
+            finally:
+                shell.kill()
+                shell.wait()
+        execs = [change for change in changes if change["Process ID"] == shell.pid]
+        self.assertEqual([(change["Type"], change["Command"]) for change in execs],
+                         [(CHANGE_PROCESS_EXEC, "sleep 31.7")])
+
+    def test_rolling_journal(self) -> None:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            journal = RollingJournal(journal_dir, segment_size=100, max_segments=2)
+            for number in range(10):
+                journal.write([{"Type": "change", "Number": number, "Padding": "x" * 20}], lambda: {"Type": "snapshot"})
+            journal.close()
+            self.assertEqual(sorted(os.listdir(journal_dir)), ["watch-000004.jsonl.lz4", "watch-000005.jsonl.lz4"])
+            records = list(read_watch_journal(journal_dir))
+        # Every segment starts with a snapshot, so kept segments can be read without the removed ones
+        self.assertEqual([record["Type"] for record in records], ["snapshot", "change", "change"] * 2)
+        self.assertEqual([record["Number"] for record in records if "Number" in record], [6, 7, 8, 9])
+
+    def test_failed_collection_is_logged(self) -> None:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            watcher = Watcher(journal_dir, collect_options={"not_an_option": True})
+            with self.assertLogs(level="ERROR") as logs:
+                watcher.collect(os.getpid(), "bad options")
+                watcher.close()
+        self.assertIn(f"Collecting pid {os.getpid()} failed", logs.output[0])
+
+    def test_keyframe_precedes_changes(self) -> None:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            # Every step starts a new segment
+            watcher = Watcher(journal_dir, segment_size=1)
+            watcher.step()
+            sleeper = subprocess.Popen(["sleep", "31.9"])
+            try:
+                time.sleep(0.05)
+                watcher.step()
+                watcher.close()
+            finally:
+                sleeper.kill()
+                sleeper.wait()
+            segments = sorted(os.listdir(journal_dir))
+            records = list(read_watch_journal(journal_dir))
+        self.assertEqual(len(segments), 2)
+        keyframe = [record for record in records if record["Type"] == "snapshot"][-1]
+        # The last segment is the snapshot before the step and its changes, so replaying it starts the sleeper once
+        self.assertNotIn(sleeper.pid, [process["Process ID"] for process in keyframe["Processes"]])
+        started = records[records.index(keyframe) + 1:]
+        self.assertIn((CHANGE_PROCESS_START, sleeper.pid), [(record["Type"], record.get("Process ID")) for record in started])
+
+    def test_watch_triggers_collection(self) -> None:
+        with tempfile.TemporaryDirectory() as journal_dir:
+            rules = [{"name": "sleeper", "type": CHANGE_PROCESS_START, "match": {"Command": "sleep 31*"}}]
+            watcher = Watcher(journal_dir, interval=0.01, rules=rules,
+                              collect_options={"include_memory": False, "include_open": False})
+            watcher.step()
+            sleeper = subprocess.Popen(["sleep", "31.5"])
+            try:
+                time.sleep(0.05)
+                changes = watcher.step()
+                # The process is collected once, however many changes match
+                watcher.collect(sleeper.pid, "again")
+                self.assertEqual([pid for pid, _ in watcher.collections], [sleeper.pid])
+                for collection in watcher.collections.values():
+                    collection.result()
+            finally:
+                sleeper.kill()
+                sleeper.wait()
+            # Once it exits it's forgotten, so a process reusing the pid would be collected
+            watcher.step()
+            watcher.close()
+            self.assertEqual(watcher.collections, {})
+            started = [change for change in changes if change["Type"] == CHANGE_PROCESS_START]
+            self.assertEqual([change["Process ID"] for change in started], [sleeper.pid])
+            triggered = [change for change in changes if change["Type"] == "rule"]
+            self.assertEqual(len(triggered), 1)
+            with zipfile.ZipFile(triggered[0]["Capture"]) as capture:
+                # Only the process that triggered the rule is collected
+                processes = json.loads(capture.read("processes.json"))["rows"]
+            self.assertEqual([process["Process ID"] for process in processes], [sleeper.pid])
+            records = list(read_watch_journal(journal_dir))
+            self.assertEqual(records[0]["Type"], "snapshot")
+            self.assertIn(sleeper.pid, [record.get("Process ID") for record in records])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,28 @@
+import io
+import os
+import unittest
+
+from varc_core.utils.page_store import PAGE_SIZE, ZERO_PAGE, PageStore, page_table, reconstruct_dump
+
+
+class TestPageStore(unittest.TestCase):
+
+    def test_dedupe_and_reconstruct(self) -> None:
+        shared = os.urandom(PAGE_SIZE * 8)
+        dumps = [shared + bytes(PAGE_SIZE) + os.urandom(100) for _ in range(3)]
+        store_file = io.BytesIO()
+        page_store = PageStore(store_file)
+        tables = []
+        for dump in dumps:
+            indexes = page_store.add(dump)
+            self.assertEqual(indexes[8], ZERO_PAGE)
+            tables.append(page_table(list(indexes), len(dump)))
+        # 8 shared pages, plus one unique padded tail page per dump
+        self.assertEqual(page_store.unique_pages, 8 + 3)
+        self.assertEqual(page_store.total_pages, 10 * 3)
+
+        store = memoryview(store_file.getvalue())
+        for dump, table in zip(dumps, tables):
+            flat = io.BytesIO()
+            self.assertEqual(reconstruct_dump(table, store, flat), len(dump))
+            self.assertEqual(flat.getvalue(), dump)
@@ -0,0 +1,40 @@
+import unittest
+from collections import namedtuple
+
+from varc_core.utils.process_records import PathTable, ProcessRecord
+
+_Path = namedtuple("_Path", ["path"])
+_Address = namedtuple("_Address", ["ip", "port"])
+_Connection = namedtuple("_Connection", ["laddr", "raddr"])
+
+
+def _proc_dict(pid: int, **values: object) -> dict:
+    proc_dict = {"pid": pid, "ppid": 1, "name": "nginx", "username": "www-data", "status": "sleeping",
+                 "exe": "/usr/sbin/nginx", "cmdline": ["nginx", "-g", "daemon off;"], "create_time": 0.0,
+                 "open_files": [], "connections": [], "memory_maps": []}
+    proc_dict.update(values)
+    return proc_dict
+
+
+class TestProcessRecords(unittest.TestCase):
+
+    def test_paths_are_shared(self) -> None:
+        paths = PathTable()
+        libc = _Path("/usr/lib/libc.so.6")
+        first = ProcessRecord(_proc_dict(10, memory_maps=[libc, _Path("/usr/sbin/nginx"), libc]), paths)
+        second = ProcessRecord(_proc_dict(11, memory_maps=[libc], open_files=[_Path("/var/log/nginx/access.log")]), paths)
+        self.assertEqual(first.mapped_files, ["/usr/lib/libc.so.6", "/usr/sbin/nginx"])
+        self.assertEqual(second.mapped_files, ["/usr/lib/libc.so.6"])
+        self.assertEqual(second.open_files, ["/var/log/nginx/access.log"])
+        self.assertEqual(len(paths), 3)
+        self.assertIs(first.name, second.name)
+
+    def test_to_row(self) -> None:
+        connections = [_Connection(_Address("10.0.0.1", 443), _Address("10.0.0.2", 51000)), _Connection(_Address("0.0.0.0", 80), ())]
+        record = ProcessRecord(_proc_dict(10, connections=connections, username=None), PathTable())
+        row = record.to_row(1.5)
+        self.assertEqual(row["Command"], "nginx -g daemon off;")
+        self.assertEqual(row["Username"], "")
+        self.assertEqual(row["Connections"], "1.5 10.0.0.1 443 10.0.0.2 51000")
+        self.assertEqual(record.connection_count, 2)
+        self.assertEqual(row["Creation Time"], "1970-01-01 00:00:00")
@@ -0,0 +1,72 @@
+import hashlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from typing import List
+
+from varc_core.utils.sampling import (DEFAULT_POLICIES, SampledReader, SamplePolicy, load_policies, policy_for,
+                                      sample_ranges)
+
+
+def _read_all(reader: SampledReader, size: int) -> bytes:
+    return b"".join(iter(lambda: reader.read(size), b""))
+
+
+def _policy(path: str, policies: List[SamplePolicy]) -> SamplePolicy:
+    policy = policy_for(path, policies)
+    if policy is None:
+        raise AssertionError(f"No policy for {path}")
+    return policy
+
+
+class TestSampling(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.data = os.urandom(3 * 1024 * 1024 + 17)
+
+    def test_sample_ranges(self) -> None:
+        self.assertEqual(sample_ranges(1000, SamplePolicy(head=100, tail=200)), [(0, 100), (800, 200)])
+        # Overlapping head and tail cover the whole file
+        self.assertEqual(sample_ranges(1000, SamplePolicy(head=600, tail=600)), [(0, 1000)])
+        self.assertEqual(sample_ranges(1000, SamplePolicy(head=10, tail=10, stride=300, stride_size=20)),
+                         [(0, 10), (300, 20), (600, 20), (900, 20), (990, 10)])
+
+    def test_reader_samples_and_hashes(self) -> None:
+        ranges = sample_ranges(len(self.data), SamplePolicy(head=1000, tail=5000, stride=1024 * 1024, stride_size=300))
+        expected = b"".join(self.data[offset:offset + length] for offset, length in ranges)
+        for read_size in (7, 64 * 1024, 4 * 1024 * 1024):
+            reader = SampledReader(io.BytesIO(self.data), len(self.data), ranges, hash_all=True)
+            self.assertEqual(_read_all(reader, read_size), expected)
+            self.assertEqual(reader.hexdigest(), hashlib.sha256(self.data).hexdigest())
+            self.assertEqual(reader.bytes_read, len(self.data))
+
+    def test_reader_without_hash_reads_only_samples(self) -> None:
+        ranges = sample_ranges(len(self.data), SamplePolicy(head=1000, tail=5000, hash=False))
+        reader = SampledReader(io.BytesIO(self.data), len(self.data), ranges)
+        self.assertEqual(_read_all(reader, 64 * 1024), self.data[:1000] + self.data[-5000:])
+        self.assertIsNone(reader.hexdigest())
+        self.assertEqual(reader.bytes_read, 6000)
+
+    def test_reader_truncated_file(self) -> None:
+        ranges = sample_ranges(len(self.data), SamplePolicy(head=1000, tail=1000))
+        reader = SampledReader(io.BytesIO(self.data[:2000]), len(self.data), ranges)
+        self.assertEqual(_read_all(reader, 64 * 1024), self.data[:1000])
+
+    def test_policies(self) -> None:
+        with tempfile.NamedTemporaryFile("w", suffix=".json", delete=False) as policy_file:
+            json.dump([{"glob": "*.sqlite", "max_size": 1 << 30}, {"glob": "/var/log/*", "tail": 1 << 26}], policy_file)
+        try:
+            policies = load_policies(policy_file.name)
+        finally:
+            os.unlink(policy_file.name)
+        self.assertEqual(_policy("/data/app.sqlite", policies).max_size, 1 << 30)
+        self.assertEqual(_policy("/var/log/syslog", policies).tail, 1 << 26)
+        self.assertIsNone(policy_for("/usr/bin/python3", policies))
+        # Reading the whole of every large file to hash it is opt-in
+        self.assertFalse(_policy("/usr/bin/python3", DEFAULT_POLICIES).hash)
+
+
+if __name__ == "__main__":
+    unittest.main()
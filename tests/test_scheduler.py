@@ -0,0 +1,72 @@
+import threading
+import time
+import unittest
+from typing import List
+
+from varc_core.utils.scheduler import CollectorScheduler
+
+
+class TestCollectorScheduler(unittest.TestCase):
+
+    def test_dependencies_run_first(self) -> None:
+        order: List[str] = []
+        scheduler = CollectorScheduler()
+        scheduler.register("processes", lambda: order.append("processes"))
+        scheduler.register("open_files", lambda: order.append("open_files"), ["processes"])
+        scheduler.register("index", lambda: order.append("index"), ["open_files"])
+        scheduler.run()
+        self.assertEqual(order, ["processes", "open_files", "index"])
+
+    def test_independent_collectors_run_concurrently(self) -> None:
+        # Each collector waits for the other, so this only finishes if both run at once
+        barrier = threading.Barrier(2, timeout=5)
+        scheduler = CollectorScheduler(max_workers=2)
+        scheduler.register("network", barrier.wait)
+        scheduler.register("screenshot", barrier.wait)
+        started = time.monotonic()
+        scheduler.run()
+        self.assertLess(time.monotonic() - started, 5)
+        self.assertEqual(set(scheduler.durations), {"network", "screenshot"})
+
+    def test_returns_results(self) -> None:
+        scheduler = CollectorScheduler()
+        scheduler.register("network", lambda: ["line"])
+        self.assertEqual(scheduler.run(), {"network": ["line"]})
+
+    def test_iter_run_yields_as_collectors_finish(self) -> None:
+        release = threading.Event()
+        scheduler = CollectorScheduler(max_workers=2)
+        scheduler.register("open_files", lambda: release.wait(5))
+        scheduler.register("processes", lambda: "rows")
+        collectors = scheduler.iter_run()
+        self.assertEqual(next(collectors), ("processes", "rows"))
+        self.assertFalse(release.is_set())
+        release.set()
+        self.assertEqual(list(collectors), [("open_files", True)])
+
+    def test_failure_skips_dependents(self) -> None:
+        ran: List[str] = []
+
+        def fail() -> None:
+            raise RuntimeError("collector failed")
+
+        scheduler = CollectorScheduler()
+        scheduler.register("processes", fail)
+        scheduler.register("open_files", lambda: ran.append("open_files"), ["processes"])
+        with self.assertRaises(RuntimeError):
+            scheduler.run()
+        self.assertEqual(ran, [])
+
+    def test_register_errors(self) -> None:
+        scheduler = CollectorScheduler()
+        scheduler.register("processes", lambda: None)
+        with self.assertRaises(ValueError):
+            scheduler.register("processes", lambda: None)
+        with self.assertRaises(ValueError):
+            scheduler.register("open_files", lambda: None, ["containers"])
+        self.assertIn("processes", scheduler)
+        self.assertNotIn("open_files", scheduler)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+import json
+import os
+import tempfile
+import unittest
+import zipfile
+
+from varc_core.capture import CAPTURE_INDEX_MEMBER, CaptureReader, build_index
+from varc_core.utils.shards import ShardWriter, manifest_path, shard_path, write_manifest
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.capture_path = os.path.join(self.tmp_dir.name, "capture.zip")
+        self.dump_sizes = [300000, 100000, 250000, 50000, 600000, 150000]
+        self.dumps = []
+        writer = ShardWriter(self.capture_path, 400000, workers=2)
+        for pid, size in enumerate(self.dump_sizes, 1):
+            dump_path = os.path.join(self.tmp_dir.name, f"{pid}.dump")
+            with open(dump_path, "wb") as dump_out:
+                dump_out.write(bytes([pid]) * size)
+            member = f"process_dumps/python_{pid}.mem"
+            dump_entry = {"Process ID": pid, "Name": "python", "Member": member, "Regions": [[0x1000, 0, size]]}
+            self.dumps.append(dump_entry)
+            writer.submit(open(dump_path, "rb"), member, dump_entry, zipfile.ZIP_STORED,
+                          remove_path=dump_path)
+        self.shard_paths = writer.close()
+        with zipfile.ZipFile(self.capture_path, "w") as capture:
+            capture.writestr(CAPTURE_INDEX_MEMBER, json.dumps(build_index([], self.dumps)))
+
+    def tearDown(self) -> None:
+        self.tmp_dir.cleanup()
+
+    def test_shards_bounded_and_complete(self) -> None:
+        self.assertEqual(self.shard_paths[0], shard_path(self.capture_path, 1))
+        self.assertEqual(os.path.basename(self.shard_paths[0]), "capture.001.zip")
+        members = []
+        for path in self.shard_paths:
+            with zipfile.ZipFile(path) as shard:
+                self.assertIsNone(shard.testzip())
+                index = json.loads(shard.read(CAPTURE_INDEX_MEMBER))
+                shard_members = [dump["Member"] for dump in index["dumps"]]
+                members += shard_members
+                dumped = sum(shard.getinfo(member).file_size for member in shard_members)
+                # Only a dump larger than the shard size goes over it
+                self.assertTrue(dumped <= 400000 or len(shard_members) == 1)
+        self.assertEqual(sorted(members), sorted(dump["Member"] for dump in self.dumps))
+        # Temporary dumps are removed once written
+        self.assertFalse([name for name in os.listdir(self.tmp_dir.name) if name.endswith(".dump")])
+
+    def test_read_through_manifest(self) -> None:
+        path = write_manifest(self.capture_path, self.shard_paths, self.dumps)
+        self.assertEqual(path, manifest_path(self.capture_path))
+        with open(path) as manifest_in:
+            manifest = json.load(manifest_in)
+        self.assertEqual(manifest["capture"], "capture.zip")
+        self.assertEqual(sum(len(shard["Dumps"]) for shard in manifest["shards"]), len(self.dumps))
+        with CaptureReader(path) as reader:
+            self.assertEqual(reader.shard_names(), sorted(os.path.basename(shard) for shard in self.shard_paths))
+            self.assertEqual(reader.read_memory(5, 0x1000 + 599999, 10), b"\x05")
+            for pid, size in enumerate(self.dump_sizes, 1):
+                with reader.member_view(f"process_dumps/python_{pid}.mem") as view:
+                    self.assertEqual(len(view), size)
+
+    def test_pending_bytes_bounded(self) -> None:
+        writer = ShardWriter(os.path.join(self.tmp_dir.name, "bounded.zip"), 400000, workers=8, max_pending=400000)
+        reserve = writer._reserve
+        pending = []
+
+        def record_pending(size: int) -> object:
+            pending.append(writer._pending)
+            return reserve(size)
+
+        writer._reserve = record_pending  # type: ignore
+        for pid, size in enumerate(self.dump_sizes, 1):
+            dump_path = os.path.join(self.tmp_dir.name, f"{pid}.bounded")
+            with open(dump_path, "wb") as dump_out:
+                dump_out.write(bytes(size))
+            writer.submit(open(dump_path, "rb"), f"process_dumps/python_{pid}.mem", {"Process ID": pid, "Name": "python",
+                          "Member": f"process_dumps/python_{pid}.mem"}, remove_path=dump_path)
+        writer.close()
+        # However many workers, queued dumps only go over the bound when one is larger than it
+        self.assertEqual(len(pending), len(self.dump_sizes))
+        self.assertTrue(all(queued <= 400000 or queued in self.dump_sizes for queued in pending))
+        self.assertEqual(writer._pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,36 @@
+import unittest
+
+from varc_core.utils.strings_index import StringsIndex, StringsIndexBuilder, tokens
+
+
+class TestStringsIndex(unittest.TestCase):
+
+    def setUp(self) -> None:
+        builder = StringsIndexBuilder()
+        builder.add_dump("process_dumps/nginx_10.mem", 10, [(4096, b"connect 10.0.0.1:443 GET http://Evil.example/x")])
+        builder.add_dump("process_dumps/nginx_11.mem", 11, [(0, b"token=deadbeef 10.0.0.1")])
+        self.index = StringsIndex(memoryview(builder.to_bytes()))
+
+    def test_tokens(self) -> None:
+        found = dict(tokens(b"to user@example.com."))
+        self.assertEqual(found, {b"user@example.com": 3, b"user": 3, b"example.com": 8})
+
+    def test_search(self) -> None:
+        hits = self.index.search("10.0.0.1")
+        self.assertEqual(sorted((hit.pid, hit.offset) for hit in hits), [(10, 4104), (11, 15)])
+        self.assertEqual([hit.member for hit in self.index.search("EVIL.EXAMPLE")], ["process_dumps/nginx_10.mem"])
+        self.assertEqual([hit.pid for hit in self.index.search("deadbeef")], [11])
+        self.assertEqual(self.index.search("10.0.0"), [])
+
+    def test_prefix_search(self) -> None:
+        self.assertEqual({hit.token for hit in self.index.search("10.0.0", prefix=True)}, {"10.0.0.1", "10.0.0.1:443"})
+
+    def test_dedupes_tokens(self) -> None:
+        # Each distinct token is stored once, however many dumps hold it
+        tokens_list = [self.index._tokens[position] for position in range(len(self.index))]
+        self.assertEqual(len(tokens_list), len(set(tokens_list)))
+        self.assertEqual(tokens_list, sorted(tokens_list))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import os.path
+import tempfile
+import unittest
+
+try:
+    import yara
+    from varc_core.utils.yara_rules import YaraRulesError, load_rules, rule_sources
+    _YARA_AVAILABLE = True
+except ImportError:
+    _YARA_AVAILABLE = False
+
+_RULE = 'rule {name} {{ strings: $a = "{string}" condition: $a }}'
+
+
+@unittest.skipUnless(_YARA_AVAILABLE, "yara-python is not installed")
+class TestLoadRules(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.rules_dir = os.path.join(self.temp_dir.name, "rules")
+        self.cache_dir = os.path.join(self.temp_dir.name, "cache")
+        os.makedirs(os.path.join(self.rules_dir, "linux"))
+        self._write("mimikatz.yar", _RULE.format(name="mimikatz", string="sekurlsa::"))
+        self._write("linux/miner.yara", _RULE.format(name="miner", string="stratum+tcp://"))
+
+    def tearDown(self) -> None:
+        self.temp_dir.cleanup()
+
+    def _write(self, name: str, content: str) -> None:
+        with open(os.path.join(self.rules_dir, name), "w") as rule_file:
+            rule_file.write(content)
+
+    def test_namespaces(self) -> None:
+        self.assertEqual(list(rule_sources(self.rules_dir)), ["linux/miner", "mimikatz"])
+        matches = load_rules(self.rules_dir, self.cache_dir).match(data=b"stratum+tcp://pool")
+        self.assertEqual([(match.namespace, match.rule) for match in matches], [("linux/miner", "miner")])
+
+    def test_cached(self) -> None:
+        load_rules(self.rules_dir, self.cache_dir)
+        cached = os.listdir(self.cache_dir)
+        self.assertEqual(len(cached), 1)
+        # Loading again uses the cache rather than compiling a new entry
+        load_rules(self.rules_dir, self.cache_dir)
+        self.assertEqual(os.listdir(self.cache_dir), cached)
+        # Changing a source changes the key
+        self._write("mimikatz.yar", _RULE.format(name="mimikatz", string="kerberos::"))
+        rules = load_rules(self.rules_dir, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertTrue(rules.match(data=b"kerberos::list"))
+
+    def test_cache_keyed_by_includes(self) -> None:
+        common_path = os.path.join(self.temp_dir.name, "common.inc")
+        with open(common_path, "w") as common_file:
+            common_file.write(_RULE.format(name="common", string="first"))
+        self._write("included.yar", 'include "../common.inc"')
+        self.assertTrue(load_rules(self.rules_dir, self.cache_dir).match(data=b"first"))
+        # Editing only the included file changes the key, rather than loading stale rules
+        with open(common_path, "w") as common_file:
+            common_file.write(_RULE.format(name="common", string="second"))
+        rules = load_rules(self.rules_dir, self.cache_dir)
+        self.assertEqual(len(os.listdir(self.cache_dir)), 2)
+        self.assertTrue(rules.match(data=b"second"))
+
+    def test_compiled_file(self) -> None:
+        compiled_path = os.path.join(self.temp_dir.name, "rules.yarac")
+        yara.compile(source=_RULE.format(name="compiled", string="evil")).save(compiled_path)
+        self.assertTrue(load_rules(compiled_path, self.cache_dir).match(data=b"evil"))
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_broken_namespace_skipped(self) -> None:
+        self._write("broken.yar", "rule broken { condition: }")
+        rules = load_rules(self.rules_dir, self.cache_dir)
+        self.assertTrue(rules.match(data=b"sekurlsa::logonpasswords"))
+
+    def test_errors(self) -> None:
+        with self.assertRaises(YaraRulesError):
+            load_rules(os.path.join(self.temp_dir.name, "missing.yar"), self.cache_dir)
+        empty_dir = os.path.join(self.temp_dir.name, "empty")
+        os.makedirs(empty_dir)
+        with self.assertRaises(YaraRulesError):
+            load_rules(empty_dir, self.cache_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,13 @@
 import argparse
 import logging
+import multiprocessing
+import sys
 
 from varc_core.systems import acquire_system
 
 if __name__ == "__main__":
+    # YARA rules are checked in worker processes, which needs this in a compiled binary
+    multiprocessing.freeze_support()
     logging_level = logging.INFO
     logging.basicConfig(
         format='[%(asctime)s]:[%(levelname)s] - %(message)s',
@@ -33,18 +37,203 @@ if __name__ == "__main__":
         dest="extract_dumps",
         help="Extract process memory dumps, which can be slow",
     )
+    parser.add_argument(
+        "--store-dumps",
+        action="store_true",
+        dest="store_dumps",
+        help="Store process memory dumps uncompressed, which is faster to extract and read but larger",
+    )
+    parser.add_argument(
+        "--dedupe-pages",
+        action="store_true",
+        dest="dedupe_pages",
+        help="Store each unique memory page once across all process dumps (Linux only)",
+    )
+    parser.add_argument(
+        "--resident-only",
+        action="store_true",
+        dest="resident_only",
+        help="Only dump memory pages that are resident, skipping unpopulated and swapped out pages (Linux only)",
+    )
+    parser.add_argument(
+        "--freeze",
+        action="store_true",
+        dest="freeze",
+        help="Freeze each process while its memory is copied, for a consistent snapshot (Linux only)",
+    )
+    parser.add_argument(
+        "--process-events",
+        action="store_true",
+        dest="process_events",
+        help="Record processes starting and exiting during collection, and dump those still running (Linux only)",
+    )
     parser.add_argument(
         "--yara-scan",
         action="store",
         dest="yara_scan",
-        help="Scan process memory using compiled YARA rule file, which can be slow.",
+        help="Scan process memory using YARA rules, which can be slow. Accepts a compiled rule file, a source rule file or a directory of source rule files",
+    )
+    parser.add_argument(
+        "--sample-policy",
+        action="store",
+        dest="sample_policy_file",
+        help="JSON file of per path glob policies for sampling open files too large to collect whole",
+    )
+    parser.add_argument(
+        "--shard-size",
+        action="store",
+        dest="shard_size",
+        type=int,
+        help="Split process dumps across zips of at most this many MB next to the capture, for parallel upload and analysis",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        dest="resume",
+        help="Continue an interrupted collection into the --output capture, skipping the files, processes and stages it completed",
+    )
+    parser.add_argument(
+        "--ioc-file",
+        action="store",
+        dest="ioc_file",
+        help="Match the SHA-256 of collected files and carved artifacts against the hashes in this file",
+    )
+    parser.add_argument(
+        "--triage",
+        action="store_true",
+        dest="triage",
+        help="Only run YARA and IOC checks first, and collect everything else only if they hit",
+    )
+    parser.add_argument(
+        "--containers",
+        action="store_true",
+        dest="container_mode",
+        help="Group processes and open files by container (Linux only)",
+    )
+    parser.add_argument(
+        "--container-workers",
+        action="store",
+        dest="container_workers",
+        type=int,
+        default=8,
+        help="Maximum number of containers to collect from at once",
+    )
+    parser.add_argument(
+        "--output",
+        action="store",
+        dest="output_path",
+        help="Path to write the capture to, ending .zip or .tar.lz4",
+    )
+    parser.add_argument(
+        "--fleet",
+        action="store",
+        dest="fleet_targets",
+        help="Collect from every target in a JSON targets file, instead of this system",
+    )
+    parser.add_argument(
+        "--fleet-output",
+        action="store",
+        dest="fleet_output",
+        default="fleet_captures",
+        help="Directory to write fleet captures and the merged index to",
+    )
+    parser.add_argument(
+        "--fleet-workers",
+        action="store",
+        dest="fleet_workers",
+        type=int,
+        default=4,
+        help="Maximum number of fleet targets to collect from at once",
+    )
+    parser.add_argument(
+        "--fleet-retries",
+        action="store",
+        dest="fleet_retries",
+        type=int,
+        default=1,
+        help="Number of times to retry a failed fleet target",
+    )
+    parser.add_argument(
+        "--fleet-timeout",
+        action="store",
+        dest="fleet_timeout",
+        type=float,
+        help="Maximum seconds to wait for each attempt at a fleet target, by default there is no limit",
+    )
+    parser.add_argument(
+        "--watch",
+        action="store_true",
+        dest="watch",
+        help="Watch processes, connections and open files, journaling changes, instead of collecting once (Linux only)",
+    )
+    parser.add_argument(
+        "--watch-output",
+        action="store",
+        dest="watch_output",
+        default="watch_journal",
+        help="Directory to write the watch journal and triggered captures to",
+    )
+    parser.add_argument(
+        "--watch-interval",
+        action="store",
+        dest="watch_interval",
+        type=float,
+        default=5.0,
+        help="Seconds between watch samples",
+    )
+    parser.add_argument(
+        "--watch-cpu",
+        action="store",
+        dest="watch_cpu",
+        type=float,
+        default=2.0,
+        help="Percent of a CPU watching may use, the interval is stretched to stay within it",
+    )
+    parser.add_argument(
+        "--watch-rules",
+        action="store",
+        dest="watch_rules",
+        help="JSON file of rules on watched changes that trigger a full collection of the process",
     )
     # Allow other arguments - needed for unittests
     parser.add_argument('args', nargs=argparse.REMAINDER)
     args = parser.parse_args()
+    if args.fleet_targets:
+        from varc_core.fleet import collect_fleet
+        collect_fleet(args.fleet_targets, args.fleet_output, max_workers=args.fleet_workers, retries=args.fleet_retries,
+                      timeout=args.fleet_timeout)
+        sys.exit(0)
+    if args.watch:
+        if not sys.platform.startswith("linux"):
+            parser.error("--watch is only supported on Linux")
+        from varc_core.watch import watch
+        watch(args.watch_output, interval=args.watch_interval, cpu_budget=args.watch_cpu / 100,
+              rules_file=args.watch_rules, collect_options={
+                  "include_memory": args.include_memory, "include_open": args.include_open,
+                  "extract_dumps": args.extract_dumps, "yara_file": args.yara_scan, "store_dumps": args.store_dumps,
+                  "ioc_file": args.ioc_file, "dedupe_pages": args.dedupe_pages, "freeze": args.freeze,
+                  "sample_policy_file": args.sample_policy_file, "resident_only": args.resident_only})
+        sys.exit(0)
+    if args.triage and not (args.yara_scan or args.ioc_file):
+        parser.error("--triage needs --yara-scan or --ioc-file to decide whether to collect")
+    if args.resume and not args.output_path:
+        parser.error("--resume needs the --output path of the interrupted collection")
     acquire_system(
         include_memory=args.include_memory,
         include_open=args.include_open,
         extract_dumps=args.extract_dumps,
-        yara_file=args.yara_scan
+        yara_file=args.yara_scan,
+        container_mode=args.container_mode,
+        container_workers=args.container_workers,
+        output_path=args.output_path,
+        store_dumps=args.store_dumps,
+        ioc_file=args.ioc_file,
+        triage=args.triage,
+        dedupe_pages=args.dedupe_pages,
+        freeze=args.freeze,
+        process_events=args.process_events,
+        sample_policy_file=args.sample_policy_file,
+        shard_size=args.shard_size * 1024 * 1024 if args.shard_size else None,
+        resume=args.resume,
+        resident_only=args.resident_only
     )
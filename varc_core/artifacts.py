@@ -0,0 +1,76 @@
+"""Typed artifacts yielded by BaseSystem.iter_artifacts
+
+Collection can be consumed as a stream of artifacts, e.g. by an agent feeding its own pipeline,
+instead of as a capture on disk. Writing a capture is just one consumer of the same stream.
+
+    system = acquire_system(collect=False)
+    for artifact in system.iter_artifacts():
+        if isinstance(artifact, MemoryChunk):
+            ...
+"""
+from typing import IO, NamedTuple, Union
+
+
+class ProcessRow(NamedTuple):
+    """A row of the processes table"""
+    row: dict
+
+
+class ContainerRow(NamedTuple):
+    """A row of the containers table"""
+    row: dict
+
+
+class NetworkLine(NamedTuple):
+    """A line of netstat.log"""
+    line: str
+
+
+class Screenshot(NamedTuple):
+    name: str
+    png: bytes
+
+
+class OpenFile(NamedTuple):
+    """A file that is open or mapped by a process, read when the consumer opens it
+
+    :param path: Path to read the file from
+    :param listed_path: Path of the file as seen by the process
+    :param arcname: Path of the file in a capture
+    """
+    path: str
+    listed_path: str
+    arcname: str
+
+    def open(self) -> IO[bytes]:
+        return open(self.path, "rb")
+
+
+class MemoryChunk(NamedTuple):
+    """Memory read from a process, starting at virtual address {address}"""
+    pid: int
+    name: str
+    address: int
+    data: bytes
+
+
+class CarvedFile(NamedTuple):
+    """A file carved from the memory of a process, as extract_dumps carves from its dump
+
+    :param pid: The process id
+    :param name: The process name
+    :param file_name: Name of the carved file, e.g. python_1234_1.log
+    :param data: Contents of the carved file
+    """
+    pid: int
+    name: str
+    file_name: str
+    data: bytes
+
+
+class YaraHit(NamedTuple):
+    """A YARA match in process memory, as in yara_results.json"""
+    hit: dict
+
+
+Artifact = Union[ProcessRow, ContainerRow, NetworkLine, Screenshot, OpenFile, MemoryChunk, CarvedFile, YaraHit]
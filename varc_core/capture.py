@@ -0,0 +1,373 @@
+"""Random access reader for varc captures
+
+Uses the capture_index.json member written at collection time to find process dumps, memory
+regions and collected files without scanning or decompressing the whole archive.
+Members that were stored uncompressed are memory-mapped directly from the capture, compressed
+members are decompressed once to a temporary file and memory-mapped from there. Dumps stored as
+page tables are reconstructed to a temporary file the same way. Reading a member from start to
+end with iter_member needs no temporary file, except for the page store of de-duplicated dumps
+if it was compressed.
+
+A sharded capture is opened from its capture.zip or capture.manifest.json, and dumps are read
+from the shard each is in.
+
+Can also be run from the command line:
+    python -m varc_core.capture capture.zip regions 1234 0x7f0000001000
+    python -m varc_core.capture capture.zip strings 10.0.0.1
+"""
+import argparse
+import bisect
+import json
+import mmap
+import os
+import shutil
+import struct
+import sys
+import zipfile
+from tempfile import TemporaryDirectory
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from varc_core.utils.page_store import PAGE_STORE_MEMBER, PAGE_TABLE_SUFFIX, iter_dump, reconstruct_dump
+from varc_core.utils.strings_index import STRINGS_INDEX_MEMBER, StringsIndex
+
+CAPTURE_INDEX_MEMBER = "capture_index.json"
+MANIFEST_SUFFIX = ".manifest.json"
+
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_COPY_CHUNK = 1024 * 1024
+
+
+def build_index(members: List[str], dumps: List[dict], file_hashes: Optional[List[dict]] = None,
+                sampled: Optional[List[dict]] = None) -> dict:
+    """Returns a capture index
+
+    :param members: Members of the capture, excluding the index
+    :param dumps: The dump manifest - e.g. [{'Process ID': 1, 'Name': 'bash', 'Member': '...', 'Regions': [...]}]
+    :param file_hashes: Hashes of the collected files - e.g. [{'File': '/bin/sh', 'Member': '...', 'SHA256': '...'}]
+    :param sampled: Open files that were sampled rather than collected whole
+    """
+    processes: Dict[str, dict] = {}
+    for dump in dumps:
+        process = processes.setdefault(str(dump["Process ID"]), {"Name": dump["Name"], "Dumps": []})
+        process["Dumps"].append(dump["Member"])
+    files: Dict[str, List[str]] = {}
+    for file_hash in file_hashes or []:
+        files.setdefault(file_hash["SHA256"], []).append(file_hash["Member"])
+    return {
+        "format": "VarcCaptureIndex",
+        "version": 1,
+        "members": members,
+        "processes": processes,
+        "dumps": dumps,
+        "files": files,
+        "sampled": sampled or [],
+    }
+
+
+def read_manifest(path: str) -> dict:
+    """Reads the manifest of a sharded capture
+
+    :raises ValueError: If {path} isn't a shard manifest
+    """
+    with open(path, "r") as manifest_in:
+        manifest = json.load(manifest_in)
+    if manifest.get("format") != "VarcShardManifest":
+        raise ValueError(f"Not a shard manifest: {path}")
+    return manifest
+
+
+class CaptureReader:
+    """Opens a capture for lazy, memory-mapped access to its members
+
+    :param path: Path to the capture zip, or the manifest of a sharded capture
+    """
+
+    def __init__(self, path: str) -> None:
+        if path.endswith(MANIFEST_SUFFIX):
+            path = os.path.join(os.path.dirname(path), read_manifest(path)["capture"])
+        self.path = path
+        self._zip = zipfile.ZipFile(path, "r")
+        self._file = open(path, "rb")
+        self._mmap: Optional[mmap.mmap] = None
+        self._spill_dir: Optional[TemporaryDirectory] = None
+        self._spilled: Dict[str, mmap.mmap] = {}
+        self._spill_count = 0
+        self._index: Optional[dict] = None
+        self._strings_index: Optional[StringsIndex] = None
+        self._dump_offsets: Optional[Dict[str, List[Tuple[int, int, int]]]] = None
+        self._shards: Dict[str, "CaptureReader"] = {}
+        self._dump_shards: Optional[Dict[str, str]] = None
+
+    def __enter__(self) -> "CaptureReader":
+        return self
+
+    def __exit__(self, type: Any, value: Any, traceback: Any) -> None:
+        self.close()
+
+    def close(self) -> None:
+        for shard in self._shards.values():
+            shard.close()
+        self._shards.clear()
+        if self._strings_index:
+            self._strings_index.release()
+            self._strings_index = None
+        for spilled in self._spilled.values():
+            spilled.close()
+        self._spilled.clear()
+        if self._mmap:
+            self._mmap.close()
+        if self._spill_dir:
+            self._spill_dir.cleanup()
+        self._file.close()
+        self._zip.close()
+
+    @property
+    def index(self) -> dict:
+        """The capture index, built from the member list if the capture doesn't have one"""
+        if self._index is None:
+            if CAPTURE_INDEX_MEMBER in self._zip.NameToInfo:
+                self._index = json.loads(self._zip.read(CAPTURE_INDEX_MEMBER))
+            else:
+                self._index = {"format": "VarcCaptureIndex", "version": 0, "members": self._zip.namelist(),
+                               "processes": {}, "dumps": [], "files": {}}
+            for dump in self._index["dumps"]:
+                dump["Regions"].sort()
+        return self._index
+
+    def members(self) -> List[str]:
+        return self._zip.namelist()
+
+    @property
+    def dump_shards(self) -> Dict[str, str]:
+        """Maps each dump written to a shard to the shard, e.g. {'process_dumps/bash_1.mem': 'capture.001.zip'}"""
+        if self._dump_shards is None:
+            self._dump_shards = {dump["Member"]: dump["Shard"] for dump in self.index["dumps"] if "Shard" in dump}
+        return self._dump_shards
+
+    def shard(self, name: str) -> "CaptureReader":
+        """Returns a reader for a shard of this capture, e.g. capture.001.zip"""
+        if name not in self._shards:
+            self._shards[name] = CaptureReader(os.path.join(os.path.dirname(self.path), name))
+        return self._shards[name]
+
+    def shard_names(self) -> List[str]:
+        """Returns the shards process dumps were written to, if the capture is sharded"""
+        return sorted(set(self.dump_shards.values()))
+
+    def dump_members(self) -> List[str]:
+        """Returns the names of all process memory dumps in this zip, including those stored as page tables"""
+        dumps = []
+        for member in self._zip.namelist():
+            if member.startswith("process_dumps") and member.endswith(".mem"):
+                dumps.append(member)
+            elif member.startswith("process_dumps") and member.endswith(".mem" + PAGE_TABLE_SUFFIX):
+                dumps.append(member[:-len(PAGE_TABLE_SUFFIX)])
+        return dumps
+
+    def member_view(self, name: str) -> memoryview:
+        """Returns a read-only, memory-mapped view of a member's contents
+
+        :param name: The member name
+        :return: memoryview of the member
+        """
+        if name not in self._zip.NameToInfo:
+            shard = self.dump_shards.get(name)
+            if shard:
+                return self.shard(shard).member_view(name)
+        if name not in self._zip.NameToInfo and name + PAGE_TABLE_SUFFIX in self._zip.NameToInfo:
+            if name not in self._spilled:
+                self._spilled[name] = self._spill_reconstructed(name + PAGE_TABLE_SUFFIX)
+            return memoryview(self._spilled[name])[:len(self._spilled[name])]
+        info = self._zip.getinfo(name)
+        if info.compress_type == zipfile.ZIP_STORED:
+            if self._mmap is None:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            data_offset = self._data_offset(info)
+            return memoryview(self._mmap)[data_offset:data_offset + info.file_size]
+        if name not in self._spilled:
+            self._spilled[name] = self._spill(info)
+        return memoryview(self._spilled[name])[:info.file_size]
+
+    def iter_member(self, name: str, chunk_size: int = _COPY_CHUNK) -> Iterator[bytes]:
+        """Yields a member's contents in order, decompressing or rebuilding it as it's read rather than to a temporary file
+
+        :param name: The member name
+        :param chunk_size: Size of each chunk, all but the last are this size
+        """
+        if name not in self._zip.NameToInfo:
+            shard = self.dump_shards.get(name)
+            if shard:
+                yield from self.shard(shard).iter_member(name, chunk_size)
+                return
+        if name not in self._zip.NameToInfo and name + PAGE_TABLE_SUFFIX in self._zip.NameToInfo:
+            pending = bytearray()
+            with self.member_view(PAGE_STORE_MEMBER) as page_store:
+                for page in iter_dump(self._zip.read(name + PAGE_TABLE_SUFFIX), page_store):
+                    pending += page
+                    if len(pending) >= chunk_size:
+                        yield bytes(pending[:chunk_size])
+                        del pending[:chunk_size]
+            if pending:
+                yield bytes(pending)
+            return
+        with self._zip.open(name) as member_in:
+            for chunk in iter(lambda: member_in.read(chunk_size), b""):
+                yield chunk
+
+    def _data_offset(self, info: zipfile.ZipInfo) -> int:
+        self._file.seek(info.header_offset)
+        header = _LOCAL_HEADER.unpack(self._file.read(_LOCAL_HEADER.size))
+        filename_length, extra_length = header[-2], header[-1]
+        return info.header_offset + _LOCAL_HEADER.size + filename_length + extra_length
+
+    def _spill_path(self) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = TemporaryDirectory(prefix="varc_capture_")
+        self._spill_count += 1
+        return os.path.join(self._spill_dir.name, str(self._spill_count))
+
+    def _spill(self, info: zipfile.ZipInfo) -> mmap.mmap:
+        spill_path = self._spill_path()
+        with self._zip.open(info) as member_in, open(spill_path, "w+b") as spill_out:
+            shutil.copyfileobj(member_in, spill_out, _COPY_CHUNK)
+            spill_out.flush()
+            if not info.file_size:
+                return mmap.mmap(-1, 1)
+            return mmap.mmap(spill_out.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _spill_reconstructed(self, page_table_member: str) -> mmap.mmap:
+        spill_path = self._spill_path()
+        with self.member_view(PAGE_STORE_MEMBER) as page_store, open(spill_path, "w+b") as spill_out:
+            dump_length = reconstruct_dump(self._zip.read(page_table_member), page_store, spill_out)
+            spill_out.flush()
+            if not dump_length:
+                return mmap.mmap(-1, 1)
+            return mmap.mmap(spill_out.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def table(self, name: str) -> List[dict]:
+        """Returns the rows of a JSON table e.g. "processes"
+
+        :param name: The table name, with or without .json
+        """
+        member = name if name.endswith(".json") else f"{name}.json"
+        return json.loads(self._zip.read(member))["rows"]
+
+    def dumps(self, pid: int) -> List[dict]:
+        """Returns the dump manifest entries of a process"""
+        return [dump for dump in self.index["dumps"] if dump["Process ID"] == pid]
+
+    def regions_containing(self, pid: int, address: int) -> List[dict]:
+        """Returns the dumped regions of process {pid} containing {address}
+
+        :return: List of regions - e.g. [{'Member': 'process_dumps/a_1.mem', 'Address': 4096, 'Offset': 0, 'Length': 4096}]
+        """
+        found = []
+        for dump in self.dumps(pid):
+            regions = dump["Regions"]
+            position = bisect.bisect_right(regions, [address, float("inf")]) - 1
+            if position >= 0:
+                region_address, region_offset, region_length = regions[position][:3]
+                if region_address <= address < region_address + region_length:
+                    found.append({"Member": dump["Member"], "Address": region_address,
+                                  "Offset": region_offset, "Length": region_length})
+        return found
+
+    def read_memory(self, pid: int, address: int, size: int) -> Optional[bytes]:
+        """Reads dumped process memory by virtual address
+
+        :param pid: The process id
+        :param address: The virtual address to read from
+        :param size: Number of bytes to read, truncated at the end of the region
+        :return: The bytes, or None if the address wasn't dumped
+        """
+        for region in self.regions_containing(pid, address):
+            start = region["Offset"] + address - region["Address"]
+            end = min(start + size, region["Offset"] + region["Length"])
+            with self.member_view(region["Member"]) as view:
+                return bytes(view[start:end])
+        return None
+
+    def files_with_hash(self, sha256: str) -> List[str]:
+        """Returns the members of collected files with the given SHA-256"""
+        return self.index["files"].get(sha256.lower(), [])
+
+    def address_of(self, member: str, offset: int) -> Optional[int]:
+        """Returns the virtual address an offset in a dump was read from, or None if it isn't in a region"""
+        if self._dump_offsets is None:
+            self._dump_offsets = {}
+            for dump in self.index["dumps"]:
+                self._dump_offsets[dump["Member"]] = sorted((region[1], region[0], region[2]) for region in dump["Regions"])
+        regions = self._dump_offsets.get(member, [])
+        position = bisect.bisect_right(regions, (offset, float("inf"))) - 1
+        if position >= 0:
+            region_offset, region_address, region_length = regions[position]
+            if offset < region_offset + region_length:
+                return region_address + offset - region_offset
+        return None
+
+    def search_strings(self, token: str, prefix: bool = False) -> List[dict]:
+        """Finds the processes whose memory held a string, using the strings index built by dump carving
+
+        :param token: The token, e.g. an IP, domain or word, matched case insensitively
+        :param prefix: Also match every token starting with {token}
+        :return: List of hits - e.g. [{'Token': '10.0.0.1', 'Process ID': 42, 'Member': '...', 'Offset': 0, 'Address': 4096}]
+        """
+        # Each shard has the strings index of its own dumps
+        hits = [hit for shard in self.shard_names() for hit in self.shard(shard).search_strings(token, prefix)]
+        if self._strings_index is None:
+            if STRINGS_INDEX_MEMBER not in self._zip.NameToInfo:
+                return hits
+            self._strings_index = StringsIndex(self.member_view(STRINGS_INDEX_MEMBER))
+        return [{"Token": hit.token, "Process ID": hit.pid, "Member": hit.member, "Offset": hit.offset,
+                 "Address": self.address_of(hit.member, hit.offset)}
+                for hit in self._strings_index.search(token, prefix)] + hits
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m varc_core.capture", description="Query a varc capture")
+    parser.add_argument("capture", help="Path to the capture zip, or the manifest of a sharded capture")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("members", help="List members")
+    table_parser = commands.add_parser("table", help="Print a JSON table")
+    table_parser.add_argument("name")
+    regions_parser = commands.add_parser("regions", help="Dumped regions of a process containing an address")
+    regions_parser.add_argument("pid", type=int)
+    regions_parser.add_argument("address", type=lambda value: int(value, 0))
+    read_parser = commands.add_parser("read", help="Write dumped process memory to stdout")
+    read_parser.add_argument("pid", type=int)
+    read_parser.add_argument("address", type=lambda value: int(value, 0))
+    read_parser.add_argument("size", type=lambda value: int(value, 0))
+    hash_parser = commands.add_parser("hash", help="Collected files with a SHA-256")
+    hash_parser.add_argument("sha256")
+    strings_parser = commands.add_parser("strings", help="Processes whose memory held a string, if dumps were carved")
+    strings_parser.add_argument("token")
+    strings_parser.add_argument("--prefix", action="store_true", help="Match every string starting with the token")
+    reconstruct_parser = commands.add_parser("reconstruct", help="Write a flat process memory dump, rebuilding it if de-duplicated")
+    reconstruct_parser.add_argument("member")
+    reconstruct_parser.add_argument("output")
+    args = parser.parse_args(argv)
+
+    with CaptureReader(args.capture) as reader:
+        if args.command == "members":
+            print("\n".join(reader.members()))
+        elif args.command == "table":
+            print(json.dumps(reader.table(args.name), indent=1))
+        elif args.command == "regions":
+            print(json.dumps(reader.regions_containing(args.pid, args.address), indent=1))
+        elif args.command == "read":
+            data = reader.read_memory(args.pid, args.address, args.size)
+            if data is None:
+                return 1
+            sys.stdout.buffer.write(data)
+        elif args.command == "hash":
+            print("\n".join(reader.files_with_hash(args.sha256)))
+        elif args.command == "strings":
+            print(json.dumps(reader.search_strings(args.token, args.prefix), indent=1))
+        elif args.command == "reconstruct":
+            with reader.member_view(args.member) as dump, open(args.output, "wb") as dump_out:
+                dump_out.write(dump)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""Fleet collection - runs varc against many targets and merges the results
+
+Each target is a command which runs a varc agent, for example inside a chroot, a container
+(docker exec ...) or as a local subprocess. If the command contains "{output}" it is replaced with
+the path the capture should be written to, otherwise the agent must write the capture to stdout
+and it is streamed back into the output directory.
+
+Targets file format:
+    [{"name": "web-1", "command": ["chroot", "/srv/web-1", "python3", "varc.py", "--output", "{output}"]}]
+"""
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+from varc_core.utils.string_manips import remove_special_characters
+
+_STREAM_CHUNK = 1024 * 1024
+
+
+def load_targets(targets_file: str) -> List[dict]:
+    """Loads fleet targets from a JSON file
+
+    :param targets_file: Path to a JSON list of {"name": ..., "command": [...]}
+    :return: List of targets
+    """
+    with open(targets_file, "r") as targets_in:
+        targets = json.load(targets_in)
+    for target in targets:
+        if "name" not in target or "command" not in target:
+            raise ValueError(f"Fleet target is missing a name or command: {target}")
+    return targets
+
+
+def local_agent_command(*varc_args: str) -> List[str]:
+    """Returns a command that runs a varc agent as a local subprocess
+
+    :param varc_args: Extra arguments to pass to varc
+    :return: The command, writing its capture to "{output}"
+    """
+    varc_script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "varc.py")
+    return [sys.executable, varc_script, "--output", "{output}", *varc_args]
+
+
+class FleetCoordinator:
+    """Fans out acquisitions to many targets and aggregates their captures
+
+    :param targets: List of {"name": ..., "command": [...]} targets
+    :param output_dir: Directory captures and the merged index are written to
+    :param max_workers: Maximum number of targets to collect from at once
+    :param retries: Number of times to retry a failed target
+    :param timeout: Maximum seconds to wait for each attempt at a target
+    :raises ValueError: If two targets would write to the same capture, e.g. "web-1" and "web1"
+    """
+
+    def __init__(
+        self,
+        targets: List[dict],
+        output_dir: str,
+        max_workers: int = 4,
+        retries: int = 1,
+        timeout: Optional[float] = None
+    ) -> None:
+        capture_names: Dict[str, str] = {}
+        for target in targets:
+            capture_name = remove_special_characters(target["name"])
+            if capture_name in capture_names:
+                raise ValueError(f"Fleet targets {capture_names[capture_name]} and {target['name']} "
+                                 f"would both be written to {capture_name}.zip, rename one of them")
+            capture_names[capture_name] = target["name"]
+        self.targets = targets
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+        self.retries = retries
+        self.timeout = timeout
+        self.results: List[dict] = []
+
+    def run(self) -> List[dict]:
+        """Collects from every target then builds the merged index
+
+        :return: List of per target results - e.g. [{'Target': 'web-1', 'Status': 'collected'}]
+        """
+        os.makedirs(self.output_dir, exist_ok=True)
+        logging.info(f"Collecting from {len(self.targets)} targets, {self.max_workers} at a time")
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            self.results = list(executor.map(self.collect_target, self.targets))
+        self.build_index()
+        return self.results
+
+    def collect_target(self, target: dict) -> dict:
+        """Runs the agent for one target, retrying on failure
+
+        :param target: The target to collect from
+        :return: Dict of the outcome
+        """
+        name = remove_special_characters(target["name"])
+        capture_path = os.path.join(self.output_dir, f"{name}.zip")
+        started = time.time()
+        error = ""
+        for attempt in range(1, self.retries + 2):
+            if os.path.exists(capture_path):
+                os.remove(capture_path)
+            try:
+                self._run_agent(target["command"], capture_path)
+                if zipfile.is_zipfile(capture_path):
+                    logging.info(f"Collected {name} (attempt {attempt})")
+                    return {"Target": name, "Status": "collected", "Attempts": attempt, "Capture": capture_path,
+                            "Duration": round(time.time() - started, 3), "Error": ""}
+                error = "Agent did not produce a valid capture"
+            except subprocess.TimeoutExpired:
+                error = f"Timed out after {self.timeout} seconds"
+            except (subprocess.CalledProcessError, OSError) as agent_error:
+                error = str(agent_error)
+            logging.warning(f"Failed to collect {name} (attempt {attempt}): {error}")
+        if os.path.exists(capture_path):
+            os.remove(capture_path)
+        return {"Target": name, "Status": "failed", "Attempts": self.retries + 1, "Capture": "",
+                "Duration": round(time.time() - started, 3), "Error": error}
+
+    def _run_agent(self, command: List[str], capture_path: str) -> None:
+        if any("{output}" in arg for arg in command):
+            agent_command = [arg.replace("{output}", os.path.abspath(capture_path)) for arg in command]
+            subprocess.run(agent_command, check=True, timeout=self.timeout, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            return
+        # Stream the capture back from the agent's stdout, on a thread so the timeout applies while it's copied
+        with open(capture_path, "wb") as capture_out:
+            agent = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+            copier = threading.Thread(target=shutil.copyfileobj, args=(agent.stdout, capture_out, _STREAM_CHUNK),
+                                      name="varc_fleet_stream", daemon=True)
+            copier.start()
+            try:
+                return_code = agent.wait(timeout=self.timeout)
+            except subprocess.TimeoutExpired:
+                agent.kill()
+                agent.wait()
+                raise
+            finally:
+                # The copy ends once the agent's stdout is closed, which killing it does
+                copier.join()
+                agent.stdout.close()  # type: ignore
+        if return_code:
+            raise subprocess.CalledProcessError(return_code, command)
+
+    def build_index(self) -> Dict[str, str]:
+        """Merges the process, hash, IOC match and YARA tables of all collected captures
+
+        :return: Dict of index table name to the path it was written to
+        """
+        tables: Dict[str, List[dict]] = {
+            "fleet_targets": self.results, "fleet_processes": [], "fleet_hashes": [], "fleet_ioc_matches": [],
+            "fleet_yara_hits": []
+        }
+        for result in self.results:
+            if result["Status"] != "collected":
+                continue
+            try:
+                with zipfile.ZipFile(result["Capture"]) as capture:
+                    members = set(capture.namelist())
+                    if "processes.json" in members:
+                        for row in json.loads(capture.read("processes.json"))["rows"]:
+                            tables["fleet_processes"].append({"Target": result["Target"], **row})
+                    if "hashes.json" in members:
+                        for row in json.loads(capture.read("hashes.json"))["rows"]:
+                            tables["fleet_hashes"].append({"Target": result["Target"], "File": row["Member"], "SHA256": row["SHA256"]})
+                    else:
+                        # Captures from older agents aren't hashed during collection
+                        for member in sorted(members):
+                            if member.startswith("collected_files/") or "/collected_files/" in member:
+                                tables["fleet_hashes"].append({
+                                    "Target": result["Target"], "File": member, "SHA256": _member_sha256(capture, member)
+                                })
+                    if "ioc_matches.json" in members:
+                        for row in json.loads(capture.read("ioc_matches.json"))["rows"]:
+                            tables["fleet_ioc_matches"].append({"Target": result["Target"], **row})
+                    if "yara_results.json" in members:
+                        for row in json.loads(capture.read("yara_results.json"))["rows"]:
+                            tables["fleet_yara_hits"].append({"Target": result["Target"], **row})
+            except (zipfile.BadZipFile, KeyError, ValueError) as index_error:
+                logging.warning(f"Could not index capture {result['Capture']}: {index_error}")
+
+        written = {}
+        for table_name, rows in tables.items():
+            table_path = os.path.join(self.output_dir, f"{table_name}.json")
+            with open(table_path, "w") as table_out:
+                json.dump({"format": "CadoJsonTable", "rows": rows}, table_out, sort_keys=False, indent=1)
+            written[table_name] = table_path
+        logging.info(f"Fleet index written to {self.output_dir}")
+        return written
+
+
+def _member_sha256(capture: zipfile.ZipFile, member: str) -> str:
+    sha256 = hashlib.sha256()
+    with capture.open(member) as member_in:
+        for chunk in iter(lambda: member_in.read(_STREAM_CHUNK), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def collect_fleet(
+    targets_file: str,
+    output_dir: str,
+    max_workers: int = 4,
+    retries: int = 1,
+    timeout: Optional[float] = None
+) -> List[dict]:
+    """Collects from every target in a targets file and merges the results
+
+    :return: List of per target results
+    """
+    coordinator = FleetCoordinator(load_targets(targets_file), output_dir, max_workers, retries, timeout)
+    return coordinator.run()
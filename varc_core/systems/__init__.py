@@ -11,22 +11,56 @@ def acquire_system(
     include_open: bool = True,
     extract_dumps: bool = False,
     yara_file: Optional[str] = None,
-    output_path: Optional[str] = None
+    output_path: Optional[str] = None,
+    container_mode: bool = False,
+    container_workers: int = 8,
+    store_dumps: bool = False,
+    ioc_file: Optional[str] = None,
+    triage: bool = False,
+    dedupe_pages: bool = False,
+    resident_only: bool = False,
+    freeze: bool = False,
+    process_events: bool = False,
+    sample_policy_file: Optional[str] = None,
+    shard_size: Optional[int] = None,
+    resume: bool = False,
+    process_id: Optional[int] = None,
+    collect: bool = True
 ) -> BaseSystem:
     """Returns the either a windows or linux system or osx system
 
+    :param process_events: Record processes starting and exiting during the collection, and dump those still running (Linux only)
+    :param sample_policy_file: JSON file of policies for sampling open files too large to collect whole
+    :param shard_size: Split process dumps across zip shards of at most this many bytes, tied together by a manifest
+    :param resume: Continue an interrupted collection into output_path, skipping what it completed
+    :param process_id: Only collect this process, e.g. one that triggered a watch rule
+    :param collect: Run the collection straight away. If False, call run() or iter_artifacts() on the system
+
     :return: Returns the system object for the OS
     :rtype WindowsSystem or LinuxSystem or OsxSystem
     """  
     logging.info(f"Operating System is: {platform}")
     if platform == "linux" or platform == "linux2":
         from varc_core.systems.linux import LinuxSystem
-        return LinuxSystem(include_memory, include_open, extract_dumps, yara_file, output_path=output_path)
-    elif platform == "darwin":
+        return LinuxSystem(
+            include_memory, include_open, extract_dumps, yara_file, output_path=output_path,
+            container_mode=container_mode, container_workers=container_workers, store_dumps=store_dumps,
+            ioc_file=ioc_file, triage=triage, dedupe_pages=dedupe_pages,
+            resident_only=resident_only, freeze=freeze, process_events=process_events, sample_policy_file=sample_policy_file, shard_size=shard_size,
+            resume=resume, process_id=process_id, collect=collect
+        )
+    if container_mode:
+        logging.warning("Container mode is only supported on Linux, collecting without it")
+    if dedupe_pages or resident_only or freeze or process_events:
+        logging.warning("Page de-duplication, resident only dumping, freezing and process events are only supported on Linux, collecting without them")
+    if platform == "darwin":
         from varc_core.systems.osx import OsxSystem
-        return OsxSystem(include_memory, include_open, extract_dumps, output_path=output_path)
+        return OsxSystem(include_memory, include_open, extract_dumps, output_path=output_path, ioc_file=ioc_file, triage=triage,
+                         sample_policy_file=sample_policy_file, resume=resume, process_id=process_id, collect=collect)
     elif platform == "win32":
         from varc_core.systems.windows import WindowsSystem
-        return WindowsSystem(include_memory, include_open, extract_dumps, yara_file, output_path=output_path)
+        return WindowsSystem(include_memory, include_open, extract_dumps, yara_file, output_path=output_path, store_dumps=store_dumps,
+                             ioc_file=ioc_file, triage=triage, sample_policy_file=sample_policy_file, shard_size=shard_size,
+                             resume=resume, process_id=process_id, collect=collect)
     else:
         raise MissingOperatingSystemInfo()
\ No newline at end of file
@@ -7,36 +7,61 @@ Try to keep functions working cross-platform where possible
 If it can't work cross-platform, put any platform specific code in the class that inherits this base
     e.g. In linux.py
 """
+import asyncio
 import io
+import itertools
 import json
 import logging
 import os
 import os.path
+import shutil
 import socket
 import tarfile
 import time
 import zipfile
 from base64 import b64encode
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
-from typing import Any, List, Optional, Union
+from pathlib import Path
+from tempfile import SpooledTemporaryFile
+from typing import (IO, Any, AsyncIterator, Deque, Dict, Iterable, Iterator, List, Optional, Set, Tuple,
+                    Union)
 
 import lz4.frame  # type: ignore
 import mss
 import psutil
 from tqdm import tqdm
+from varc_core.artifacts import (Artifact, CarvedFile, ContainerRow, MemoryChunk, NetworkLine, OpenFile, ProcessRow,
+                                 Screenshot, YaraHit)
+from varc_core.capture import CAPTURE_INDEX_MEMBER, build_index
+from varc_core.utils import checkpoint, containers
+from varc_core.utils.checkpoint import CheckpointJournal
+from varc_core.utils.hashing import HashingReader, sha256_file
+from varc_core.utils.ioc import IocIndex
+from varc_core.utils.process_records import PROCESS_ATTRS, PathTable, ProcessRecord
+from varc_core.utils.sampling import (DEFAULT_POLICIES, SampledReader, SamplePolicy, load_policies, policy_for,
+                                      sample_ranges)
+from varc_core.utils.scheduler import CollectorScheduler
+from varc_core.utils.shards import ShardWriter, write_manifest
 from varc_core.utils.string_manips import remove_special_characters, strip_drive
 
 try:
     import yara
+    from varc_core.utils.yara_rules import YaraRulesError, load_rules
     _YARA_AVAILABLE = True
 
 except ImportError:
     _YARA_AVAILABLE = False
 
 _MAX_OPEN_FILE_SIZE = 10000000  # 10 Mb max dumped filesize
+# Collectors registered by register_volatile
+VOLATILE_COLLECTORS = ["processes", "network", "screenshot", "open_files", "containers"]
+_COPY_CHUNK = 1024 * 1024
 
 
 class _TarLz4Wrapper:
+    """A tar.lz4 capture, written in one session as reopening it truncates it. Leaving a with block doesn't close it"""
 
     def __init__(self, path: str) -> None:
         self._lz4 = lz4.frame.open(path, 'wb')
@@ -50,10 +75,18 @@ class _TarLz4Wrapper:
     def write(self, path: str, arcname: str) -> None:
         self._tar.add(path, arcname)
 
+    def writestream(self, path: str, file_object: Any, size: int) -> None:
+        info = tarfile.TarInfo(path)
+        info.size = size
+        self._tar.addfile(info, file_object)
+
     def __enter__(self) -> "_TarLz4Wrapper":
         return self
 
     def __exit__(self, type: Any, value: Any, traceback: Any) -> None:
+        pass
+
+    def close(self) -> None:
         self._tar.close()
         self._lz4.close()
 
@@ -67,8 +100,21 @@ class BaseSystem:
     :param include_memory: 
     :param include_open: 
     :param extract_dumps: 
+    :param yara_file: Compiled YARA rule file, source rule file or directory of source rule files to scan processes with
+    :param container_mode: Group processes and open files by the container they run in
+    :param container_workers: Maximum number of containers to collect files from at once
+    :param store_dumps: Store process memory dumps uncompressed, so they can be memory-mapped from the capture
+    :param ioc_file: File of SHA-256 hashes to match collected files against
+    :param sample_policy_file: JSON file of policies for sampling open files too large to collect whole
+    :param triage: Only snapshot processes and run YARA and IOC checks, collecting everything else only if they hit
+    :param shard_size: Split process dumps across zip shards of at most this many bytes next to the capture, see shards
+    :param resume: Continue the collection into output_path from where a killed run stopped, using its journal
+    :param collect: Run the collection and write the capture straight away. If False, call run() or consume iter_artifacts()
     """
 
+    # Process attributes collected with psutil, subclasses can drop any they collect themselves
+    process_attrs = PROCESS_ATTRS
+
     def __init__(
             self,
             process_name: Optional[str] = None,
@@ -78,7 +124,16 @@ class BaseSystem:
             include_open: bool = True,
             extract_dumps: bool = False,
             yara_file: Optional[str] = None,
-            output_path: Optional[str] = None
+            output_path: Optional[str] = None,
+            container_mode: bool = False,
+            container_workers: int = 8,
+            store_dumps: bool = False,
+            ioc_file: Optional[str] = None,
+            triage: bool = False,
+            sample_policy_file: Optional[str] = None,
+            shard_size: Optional[int] = None,
+            resume: bool = False,
+            collect: bool = True
     ) -> None:
         self.todays_date = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         logging.info(f'Acquiring system: {self.get_machine_name()}, at {self.todays_date}')
@@ -92,27 +147,231 @@ class BaseSystem:
         self.yara_file = yara_file
         self.yara_results: List[dict] = []
         self.yara_hit_pids: List[int] = []
+        self.dump_manifest: List[dict] = []
+        self.file_hashes: List[dict] = []
+        self.ioc_matches: List[dict] = []
+        self.ioc_index = IocIndex.from_file(ioc_file) if ioc_file else None
+        self.sample_policies = load_policies(sample_policy_file) if sample_policy_file else DEFAULT_POLICIES
+        self.sampled_files: List[dict] = []
         self.output_path = output_path or os.path.join("", f"{self.get_machine_name()}-{self.timestamp}.zip")
+        self.container_mode = container_mode
+        self.container_workers = container_workers
+        self.dump_compression = zipfile.ZIP_STORED if store_dumps else zipfile.ZIP_DEFLATED
+        self.shard_size = shard_size
+        self.shard_paths: List[str] = []
+        self.container_files: Dict[str, List[Tuple[str, str]]] = {}
+        self.triage = triage
+        self.scan_workers = os.cpu_count() or 4
+        # Set False by triage when nothing was found, subclasses skip further collection
+        self.full_collection = True
+        self.yara_rules: Any = None
+        self.process_info: List[ProcessRecord] = []
+        self.network_log: List[str] = []
+        self.dumped_files: List[str] = []
+        self.container_rows: List[dict] = []
+        self.screenshot_image: Optional[bytes] = None
+        self._yara_scanned = False
+        self._process_records: Optional[List[ProcessRecord]] = None
+        self._tar_output: Optional[_TarLz4Wrapper] = None
+        # Stages, files and process dumps completed by a killed run being resumed
+        self.completed_stages: Dict[str, dict] = {}
+        self.resumed_files: Set[str] = set()
+        self.resumed_dumps: Set[Tuple[int, str]] = set()
+        self.journal: Optional[CheckpointJournal] = None
+        self.resume = resume
+        if resume:
+            self._restore(checkpoint.resume(self.output_path))
 
         if self.process_name and self.process_id:
             raise ValueError(
                 "Only one of Process name or Process ID (PID) can be used. Please re-run using one or the other.")
-        
-        self.acquire_volatile()
 
         if self.yara_file:
             if not _YARA_AVAILABLE:
                 logging.error("YARA not available. yara-python is required and is either not installed or not functioning correctly.")
             else:
                 try:
-                    yara_rules = yara.load(self.yara_file)
-                    self.yara_rules = yara_rules
-                except:
-                    logging.error("Unable to load YARA rules.")
+                    self.yara_rules = load_rules(self.yara_file)
+                except YaraRulesError as e:
+                    logging.error(f"Unable to load YARA rules: {e}")
 
         if self.yara_file and not self.include_memory and _YARA_AVAILABLE:
             logging.info("YARA hits will be recorded only since include_memory is not selected.")
 
+        if self.triage and not self.yara_rules and not self.ioc_index:
+            # Nothing could ever hit, so triage would always skip the collection
+            logging.error("Triage needs YARA rules or an IOC file to check, collecting everything instead")
+            self.triage = False
+
+        if collect:
+            self.run()
+
+    def _restore(self, state: Optional[checkpoint.ResumeState]) -> None:
+        """Restores the work completed by a killed run, so it isn't repeated"""
+        if state is None:
+            logging.info(f"No journal found for {self.output_path}, collecting from the start")
+            return
+        self.completed_stages = state.stages
+        self.resumed_files = state.files
+        self.resumed_dumps = {(dump["Process ID"], dump["Name"]) for dump in state.dumps}
+        self.dump_manifest += state.dumps
+        self.sampled_files += state.sampled
+        self.record_hashes(state.hashes)
+        if "yara" in state.stages:
+            self.yara_hit_pids = state.stages["yara"]["Pids"]
+            self._yara_scanned = True
+        if "memory" in state.stages:
+            self.shard_paths = state.stages["memory"].get("Shards", [])
+
+    def checkpoint_stage(self, stage: str, **data: Any) -> None:
+        """Records that a stage of the collection has completed, so a resumed run skips it
+
+        :param stage: The stage, e.g. "memory"
+        :param data: Anything needed to skip the stage when resuming
+        """
+        if self.journal:
+            self.journal.stage(stage, **data)
+
+    def _open_shards(self) -> Optional[ShardWriter]:
+        """Returns a writer for process dumps if the capture is sharded, otherwise None"""
+        if not self.shard_size:
+            return None
+        if self.output_path.endswith(".tar.lz4"):
+            logging.warning("Sharding is only supported for zip output, writing process dumps to the capture")
+            return None
+        return ShardWriter(self.output_path, self.shard_size, self.scan_workers, self.dump_compression)
+
+    def carve_dumps(self) -> List[dict]:
+        """Carves the process dumps in the capture and each of its shards
+
+        :return: List of carved file hashes, with the "Shard" of those carved from a shard
+        """
+        from varc_core.utils import dumpfile_extraction
+        carved_hashes = dumpfile_extraction.extract_dumps(Path(self.output_path), self.dump_manifest)
+        for path in self.shard_paths:
+            carved_hashes += [{**carved, "Shard": os.path.basename(path)}
+                              for carved in dumpfile_extraction.extract_dumps(Path(path))]
+        return carved_hashes
+
+    def _write_volatile(self) -> None:
+        if "volatile" in self.completed_stages:
+            return
+        self.write_artifacts(self._volatile_artifacts())
+        self.checkpoint_stage("volatile")
+
+    def _write_index(self) -> None:
+        self.write_capture_index()
+        if self.journal:
+            # The capture is complete, there's nothing left to resume
+            self.journal.remove()
+            self.journal = None
+
+    def run(self) -> None:
+        """Runs the whole collection, writing the capture to output_path
+
+        Collectors run concurrently where they don't depend on each other, e.g. YARA scans process
+        memory while open files are copied into the capture.
+        """
+        if self.triage:
+            self.full_collection = self.triage_scan()
+        if not self.full_collection:
+            self._close_output()
+            return
+        if not self.output_path.endswith(".tar.lz4"):
+            self.journal = CheckpointJournal(self.output_path, append=self.resume)
+        scheduler = CollectorScheduler(max_workers=self.scan_workers)
+        self.register_volatile(scheduler)
+        scheduler.register("write_volatile", self._write_volatile, VOLATILE_COLLECTORS)
+        last_write = "write_volatile"
+        if self.include_memory:
+            memory_depends = [last_write]
+            if self.yara_rules:
+                scheduler.register("yara", self._yara_scan_all, ["processes"])
+                memory_depends.append("yara")
+            scheduler.register("memory", self.acquire_memory, memory_depends)
+            last_write = "memory"
+        last_write = self.register_timeline(scheduler, last_write) or last_write
+        scheduler.register("index", self._write_index, [last_write])
+        scheduler.run()
+
+    def acquire_memory(self) -> None:
+        """Scans, dumps and carves process memory into the capture, for systems that support it"""
+        pass
+
+    def register_timeline(self, scheduler: CollectorScheduler, last_write: str) -> Optional[str]:
+        """Registers a collector writing the events recorded in the background during the run, for systems that record them
+
+        :param scheduler: The scheduler running the collection
+        :param last_write: The last collector to write to the capture, which the timeline is written after
+        :return: The name of the collector, or None if nothing was registered
+        """
+        return None
+
+    def iter_artifacts(self) -> Iterator[Artifact]:
+        """Yields artifacts as they are collected, instead of writing a capture
+
+        Collection only advances as artifacts are consumed, so a slow consumer holds back collection
+        rather than artifacts building up in memory. With extract_dumps, the files carved from each
+        process's memory follow its memory chunks. Triage only applies to captures.
+        """
+        yield from self.iter_volatile()
+        if self.include_memory:
+            if self.yara_rules:
+                self._yara_scan_all()
+                for yara_hit in self.yara_results:
+                    yield YaraHit(self.yara_hit_readable(yara_hit))
+            if self.extract_dumps:
+                yield from self._carve_memory(self.iter_memory())
+            else:
+                yield from self.iter_memory()
+
+    def _carve_memory(self, chunks: Iterable[MemoryChunk]) -> Iterator[Union[MemoryChunk, CarvedFile]]:
+        """Yields memory chunks, and the files carved from them as each process's memory is read"""
+        from varc_core.utils import dumpfile_extraction
+        batch_size = dumpfile_extraction.READ_AMOUNT * dumpfile_extraction._WINDOWS_PER_BATCH
+        carved: List[CarvedFile] = []
+        for (pid, name), process_chunks in itertools.groupby(chunks, key=lambda chunk: (chunk.pid, chunk.name)):
+            file_counter = itertools.count(1)
+            # Named as extract_dumps names the files carved from the dump {name}_{pid}.mem
+            output_prefix = f"{name}_{pid}".split(".")[0]
+
+            def write_carved(data_bytes: bytes, is_text: bool, pid: int = pid, name: str = name,
+                             output_prefix: str = output_prefix, file_counter: Iterator[int] = file_counter) -> None:
+                for file_name, content in dumpfile_extraction.carve_outputs(next(file_counter), data_bytes, output_prefix, is_text):
+                    carved.append(CarvedFile(pid, name, file_name, content))
+
+            carver = dumpfile_extraction.DumpCarver(write_carved)
+            pending = bytearray()
+            for chunk in process_chunks:
+                yield chunk
+                pending += chunk.data
+                if len(pending) >= batch_size:
+                    whole_windows = len(pending) - len(pending) % dumpfile_extraction.READ_AMOUNT
+                    carver.feed(bytes(pending[:whole_windows]))
+                    del pending[:whole_windows]
+                    yield from carved
+                    carved.clear()
+            carver.feed(bytes(pending))
+            carver.finish()
+            yield from carved
+            carved.clear()
+
+    async def aiter_artifacts(self) -> AsyncIterator[Artifact]:
+        """Async version of iter_artifacts, collecting in a worker thread so the event loop isn't blocked"""
+        loop = asyncio.get_running_loop()
+        artifacts = self.iter_artifacts()
+        finished = object()
+        while True:
+            artifact = await loop.run_in_executor(None, next, artifacts, finished)
+            if artifact is finished:
+                return
+            yield artifact  # type: ignore
+
+    def iter_memory(self) -> Iterator[MemoryChunk]:
+        """Yields the memory of each process, for systems that support it"""
+        logging.info("Streaming process memory is not supported on this system")
+        return iter(())
+
     def get_network(self) -> List[str]:
         """Get active network connections
             
@@ -142,94 +401,105 @@ class BaseSystem:
 
         return network
 
-    def get_processes_dict(self) -> List[dict]:
-        """Get processes on system, potentially filtered
+    def get_mapped_files(self, pid: int) -> Optional[List[str]]:
+        """Returns the paths of the files a process maps, or None to use psutil's memory_maps
+
+        :param pid: The process id
+        """
+        return None
+
+    def get_process_records(self) -> List[ProcessRecord]:
+        """Get processes on system, potentially filtered. The snapshot is taken once and shared by every stage
 
-        :return: List of processes as dicts
+        :return: List of process records
         """
+        if self._process_records is not None:
+            return self._process_records
         if self.process_id:
-            return [psutil.Process(self.process_id).as_dict()]
-        elif self.process_name:
-            process_choice = []
-            for proc in psutil.process_iter():
-                proc_dict = proc.as_dict()
-                if proc_dict["name"].lower() == self.process_name.lower():
-                    process_choice.append(proc_dict)
-            return process_choice
+            processes = [psutil.Process(self.process_id)]
         else:
-            return [proc.as_dict() for proc in psutil.process_iter()]
+            processes = list(psutil.process_iter())
+
+        paths = PathTable()
+        process_choice = []
+        for proc in processes:
+            try:
+                proc_dict = proc.as_dict(attrs=self.process_attrs)
+            except psutil.NoSuchProcess:
+                # Exited since we listed it
+                continue
+            if self.process_name and proc_dict["name"].lower() != self.process_name.lower():
+                continue
+            process_choice.append(ProcessRecord(proc_dict, paths, self.get_mapped_files(proc_dict["pid"])))
+
+        if self.container_mode:
+            host_mnt_ns = containers.read_namespace(1, "mnt")
+            for record in process_choice:
+                record.container = containers.get_container_info(record.pid, host_mnt_ns=host_mnt_ns)
+        self._process_records = process_choice
+        return process_choice
 
     def dump_loaded_files(self) -> List[str]:
         """Collects files that are open
 
         :return: List of filepaths that were collected
         """
-
-        process_choice = self.get_processes_dict()
-
-        open_files: List[str] = []
-        mapped_filepaths: List[str] = []
-        exe_paths: List[str] = []
-
-        for process in process_choice:
-            proc_open_files = process.get("open_files", [])
-            if proc_open_files:
-                open_files += [open_file.path for open_file in proc_open_files]
-            proc_memory_maps = process.get("memory_maps", [])
-            if proc_memory_maps:
-                mapped_filepaths += [path.path for path in proc_memory_maps]
-            proc_exe = process.get("exe", [])
-            if proc_exe:
-                exe_paths += proc_exe
-
-        # Combine and unique
-        paths = list(set(open_files + mapped_filepaths + exe_paths))
+        paths = set()
+        for process in self.get_process_records():
+            paths.update(process.open_files)
+            paths.update(process.mapped_files)
+            if process.exe:
+                paths.add(process.exe)
         # only return paths that exist
         return [path for path in paths if (len(path) > 1 and os.path.exists(path) and os.path.getsize(path))]
 
+    def dump_container_files(self) -> Dict[str, List[Tuple[str, str]]]:
+        """Collects files that are open, as seen from inside the container of each process
+
+        Each container is resolved by a separate worker, reading files through /proc/<pid>/root, and the
+        files are read ahead on the same number of workers while they're written, see _read_ahead
+
+        :return: Dict of container id to (path to read, path in container) tuples
+        """
+        container_pid_paths: Dict[str, List[Tuple[int, str]]] = {}
+        for container_id, processes in containers.group_by_container(self.get_process_records()).items():
+            pid_paths = container_pid_paths.setdefault(container_id, [])
+            for process in processes:
+                paths = process.open_files + process.mapped_files
+                if process.exe:
+                    paths.append(process.exe)
+                pid_paths += [(process.pid, path) for path in paths]
+        return containers.resolve_all_container_files(container_pid_paths, max_workers=self.container_workers)
+
+    def get_containers(self) -> List[dict]:
+        """Get the containers running on the system, from the process snapshot
+
+        :return: List of containers - e.g. [{'Container ID': 'host'}]
+        """
+        container_data: List[dict] = []
+        for container_id, processes in containers.group_by_container(self.get_process_records()).items():
+            info = processes[0].container or {}
+            connection_count = sum(process.connection_count for process in processes)
+            container_data.append({"Container ID": container_id, "Cgroup": info.get("Cgroup", ""),
+                                   "PID Namespace": info.get("PID Namespace", ""),
+                                   "Mount Namespace": info.get("Mount Namespace", ""),
+                                   "Process IDs": ",".join(str(process.pid) for process in processes),
+                                   "Connections": connection_count,
+                                   "Open Files": len(self.container_files.get(container_id, []))
+                                   })
+        return container_data
+
     def get_processes(self) -> List[dict]:
         """Get running process(es) 
 
         :return: List of running processes - e.g. [{'pid': 1}]
         """
         process_data: List[dict] = []
-
-        process_choice = self.get_processes_dict()
-
-        for process in process_choice:
-            creation_time = datetime.utcfromtimestamp(process["create_time"]).strftime('%Y-%m-%d %H:%M:%S')
-            open_files_raw = process["open_files"]
-            open_files = []
-            if open_files_raw:
-                for open_file in open_files_raw:
-                    open_files.append(open_file.path)
-            open_files_str = " ".join(open_files)
-            cmd_line = ""
-            # Windows
-            if isinstance(process["cmdline"], str):
-                cmd_line = process["cmdline"]
-            # Linux, OSX
-            if isinstance(process["cmdline"], List):
-                cmd_line = " ".join(process["cmdline"])
-            connections = []
-            if "connections" in process:
-                if process["connections"]:
-                    for conn in process["connections"]:
-                        if conn.laddr and conn.raddr:
-                            log_line = f"{time.time()} {conn.laddr.ip} {conn.laddr.port} {conn.raddr.ip} {conn.raddr.port}"
-                            connections.append(log_line)
-
-            memory_maps = process.get("memory_maps", [])
-            mapped_filepaths = []
-            if memory_maps:
-                mapped_filepaths = [path.path for path in memory_maps]
-
-            process_data.append({"Process ID": process["pid"], "Name": process["name"], "Username": process["username"],
-                                 "Status": process["status"], "Executable Path": process["exe"], "Command": cmd_line,
-                                 "Parent ID": process["ppid"], "Creation Time": creation_time,
-                                 "Open Files": open_files_str, "Connections": "\r\n".join(connections),
-                                 "Mapped Filepaths": ",".join(mapped_filepaths)
-                                 })
+        connection_time = time.time()
+        for process in self.get_process_records():
+            process_data.append(process.to_row(connection_time))
+            if self.container_mode:
+                process_data[-1]["Container ID"] = process.container_id or containers.HOST_CONTAINER_ID
         return process_data
 
     def dict_to_json(self, rows: List[dict]) -> str:
@@ -305,72 +575,335 @@ class BaseSystem:
         """Acquire volatile data into a zip file
         This is called by all OS's
         """
-        self.process_info = self.get_processes()
-        self.network_log = self.get_network()
-        self.dumped_files = self.dump_loaded_files() if self.include_open else []
-        table_data = {}
-        table_data["processes"] = self.dict_to_json(self.process_info)
-        open_files_dict = [{"Open File": open_file} for open_file in self.dumped_files]
-        table_data["open_files"] = self.dict_to_json(open_files_dict)
-        if self.screenshot:
-            screenshot_image = self.take_screenshot()
-        else:
-            screenshot_image = None
+        self.write_artifacts(self.iter_volatile())
 
-        with self._open_output() as output_file:
-            if screenshot_image:
-                output_file.writestr(f"{self.get_machine_name()}-{self.timestamp}.png", screenshot_image)
-            for key, value in table_data.items():
-                output_file.writestr(f"{key}.json", value.encode())
-            if self.network_log:
-                logging.info("Adding Netstat Data")
-                output_file.writestr("netstat.log", "\r\n".join(self.network_log).encode())
-            if self.include_open and self.dumped_files:
-                for file_path in self.dumped_files:
-                    logging.info(f"Adding open file {file_path}")
-                    try:
-                        if os.path.getsize(file_path) > _MAX_OPEN_FILE_SIZE:
-                            logging.warning(f"Skipping file as too large {file_path}")
-                        else:
-                            try:
-                                output_file.write(file_path, strip_drive(f"./collected_files/{file_path}"))
-                            except PermissionError:
-                                logging.warn(f"Permission denied copying {file_path}")
-                    except FileNotFoundError:
-                        logging.warning(f"Could not open {file_path} for reading")
+    def register_volatile(self, scheduler: CollectorScheduler) -> None:
+        """Registers the collectors of volatile data, most volatile first
+
+        :param scheduler: The scheduler to register VOLATILE_COLLECTORS with
+        """
+        def collect_processes() -> None:
+            self.process_info = self.get_process_records()
+
+        def collect_network() -> None:
+            self.network_log = self.get_network()
+
+        def collect_screenshot() -> None:
+            self.screenshot_image = self.take_screenshot() if self.screenshot else None
+
+        def collect_open_files() -> None:
+            if self.container_mode and self.include_open:
+                self.container_files = self.dump_container_files()
+                self.dumped_files = [path for files in self.container_files.values() for _, path in files]
+            else:
+                self.dumped_files = self.dump_loaded_files() if self.include_open else []
+
+        def collect_containers() -> None:
+            self.container_rows = self.get_containers() if self.container_mode else []
+
+        scheduler.register("processes", collect_processes)
+        scheduler.register("network", collect_network)
+        scheduler.register("screenshot", collect_screenshot)
+        scheduler.register("open_files", collect_open_files, ["processes"])
+        scheduler.register("containers", collect_containers, ["processes", "open_files"])
+
+    def iter_volatile(self) -> Iterator[Artifact]:
+        """Yields the volatile data - processes, network connections, open files and a screenshot
+
+        Each collector's artifacts are yielded as soon as it finishes, e.g. process rows while open
+        files are still being copied.
+        """
+        scheduler = CollectorScheduler(max_workers=self.scan_workers)
+        self.register_volatile(scheduler)
+        for name, _ in scheduler.iter_run():
+            yield from self._collector_artifacts(name)
+
+    def _volatile_artifacts(self) -> Iterator[Artifact]:
+        """Yields the volatile data collected by the collectors from register_volatile"""
+        for name in VOLATILE_COLLECTORS:
+            yield from self._collector_artifacts(name)
+
+    def _collector_artifacts(self, name: str) -> Iterator[Artifact]:
+        """Yields the volatile data collected by one of the collectors from register_volatile
+
+        :param name: Name of the collector, which must have finished
+        """
+        if name == "processes":
+            for row in self.get_processes():
+                yield ProcessRow(row)
+        elif name == "network":
+            for line in self.network_log:
+                yield NetworkLine(line)
+        elif name == "containers":
+            for row in self.container_rows:
+                yield ContainerRow(row)
+        elif name == "screenshot" and self.screenshot_image:
+            yield Screenshot(f"{self.get_machine_name()}-{self.timestamp}.png", self.screenshot_image)
+        elif name == "open_files" and self.include_open and self.container_files:
+            for container_id, files in self.container_files.items():
+                prefix = "" if container_id == containers.HOST_CONTAINER_ID else f"containers/{container_id}/"
+                for source_path, file_path in files:
+                    yield OpenFile(source_path, file_path, strip_drive(f"./{prefix}collected_files/{file_path}"))
+        elif name == "open_files" and self.include_open:
+            for file_path in self.dumped_files:
+                yield OpenFile(file_path, file_path, strip_drive(f"./collected_files/{file_path}"))
+
+    def write_artifacts(self, artifacts: Iterable[Artifact]) -> None:
+        """Writes artifacts to the capture
+
+        :param artifacts: The artifacts, e.g. from iter_volatile
+        """
+        tables: Dict[str, List[dict]] = {"processes": [], "open_files": []}
+        if self.container_mode:
+            tables["containers"] = []
+        network_log: List[str] = []
+        try:
+            with self._open_output() as output_file:
+                for artifact, read_ahead in self._read_ahead(artifacts):
+                    if isinstance(artifact, ProcessRow):
+                        tables["processes"].append(artifact.row)
+                    elif isinstance(artifact, ContainerRow):
+                        tables["containers"].append(artifact.row)
+                    elif isinstance(artifact, NetworkLine):
+                        network_log.append(artifact.line)
+                    elif isinstance(artifact, Screenshot):
+                        output_file.writestr(artifact.name, artifact.png)
+                    elif isinstance(artifact, OpenFile):
+                        tables["open_files"].append({"Open File": artifact.listed_path})
+                        self._add_open_file(output_file, artifact.path, artifact.arcname, artifact.listed_path,
+                                            read_ahead.result() if read_ahead else None)
+                for key, rows in tables.items():
+                    output_file.writestr(f"{key}.json", self.dict_to_json(rows).encode())
+                if network_log:
+                    logging.info("Adding Netstat Data")
+                    output_file.writestr("netstat.log", "\r\n".join(network_log).encode())
+        finally:
+            self._close_output()
+
+    def _read_ahead(self, artifacts: Iterable[Artifact]) -> Iterator[Tuple[Artifact, Optional[Future]]]:
+        """Yields artifacts, in container mode with open files read a few ahead on container_workers threads
+
+        Files are read through /proc/<pid>/root, which is often slow overlay or network storage, while
+        the capture can only be written one member at a time, so reading ahead keeps both busy.
+
+        :return: Iterator of each artifact and, for open files being read ahead, the future of _read_whole
+        """
+        if not self.container_mode:
+            for artifact in artifacts:
+                yield artifact, None
+            return
+        pending: Deque[Tuple[OpenFile, Future]] = deque()
+        with ThreadPoolExecutor(max_workers=self.container_workers, thread_name_prefix="varc_read_ahead") as executor:
+            try:
+                for artifact in artifacts:
+                    if not isinstance(artifact, OpenFile):
+                        yield artifact, None
+                        continue
+                    pending.append((artifact, executor.submit(self._read_whole, artifact.path, artifact.listed_path)))
+                    if len(pending) > 2 * self.container_workers:
+                        yield pending.popleft()
+                while pending:
+                    yield pending.popleft()
+            finally:
+                for _, read_ahead in pending:
+                    read_ahead.cancel()
+
+    def _read_whole(self, file_path: str, listed_path: str) -> Optional[Tuple[IO[bytes], HashingReader]]:
+        """Reads a file that will be copied whole into a spooled temporary file, hashing it in the same pass
+
+        :return: The rewound temporary file and the reader that hashed it, or None if the file will be sampled,
+            skipped or can't be read, which _add_open_file handles as usual
+        """
+        if file_path in self.resumed_files:
+            return None
+        try:
+            policy = policy_for(listed_path, self.sample_policies)
+            if os.path.getsize(file_path) > (policy.max_size if policy else _MAX_OPEN_FILE_SIZE):
+                return None
+            spool = SpooledTemporaryFile(max_size=_COPY_CHUNK)
+            with open(file_path, "rb") as file_in:
+                reader = HashingReader(file_in)
+                shutil.copyfileobj(reader, spool, _COPY_CHUNK)
+        except OSError:
+            return None
+        spool.seek(0)
+        return spool, reader
+
+    def _add_open_file(self, output_file: Union[zipfile.ZipFile, _TarLz4Wrapper], file_path: str, arcname: str,
+                       listed_path: Optional[str] = None,
+                       read_ahead: Optional[Tuple[IO[bytes], HashingReader]] = None) -> None:
+        if file_path in self.resumed_files:
+            return
+        logging.info(f"Adding open file {file_path}")
+        hash_count, sampled_count = len(self.file_hashes), len(self.sampled_files)
+        try:
+            size = os.path.getsize(file_path)
+            policy = policy_for(listed_path or file_path, self.sample_policies)
+            try:
+                if read_ahead:
+                    self._copy_read_ahead(output_file, file_path, arcname, *read_ahead)
+                elif size <= (policy.max_size if policy else _MAX_OPEN_FILE_SIZE):
+                    self._copy_hashed(output_file, file_path, arcname)
+                elif policy:
+                    self._copy_sampled(output_file, file_path, arcname, size, policy)
+                else:
+                    logging.warning(f"Skipping file as too large {file_path}")
+            except PermissionError:
+                logging.warn(f"Permission denied copying {file_path}")
+        except FileNotFoundError:
+            logging.warning(f"Could not open {file_path} for reading")
+        if self.journal and isinstance(output_file, zipfile.ZipFile):
+            self.journal.record(output_file, "file", File=file_path, Hashes=self.file_hashes[hash_count:],
+                                Sampled=self.sampled_files[sampled_count:])
+
+    def _copy_hashed(self, output_file: Union[zipfile.ZipFile, _TarLz4Wrapper], file_path: str, arcname: str) -> None:
+        """Copies a file into the output archive, hashing it in the same pass"""
+        with open(file_path, "rb") as file_in:
+            reader = HashingReader(file_in)
+            if isinstance(output_file, zipfile.ZipFile):
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = output_file.compression
+                member = zinfo.filename
+                with output_file.open(zinfo, "w") as member_out:
+                    shutil.copyfileobj(reader, member_out, _COPY_CHUNK)  # type: ignore
+            else:
+                member = os.path.normpath(arcname)
+                output_file.writestream(member, reader, os.fstat(file_in.fileno()).st_size)
+        self.record_hashes([{"File": file_path, "Member": member, "SHA256": reader.hexdigest(), "Size": reader.bytes_read}])
+
+    def _copy_read_ahead(self, output_file: Union[zipfile.ZipFile, _TarLz4Wrapper], file_path: str, arcname: str,
+                         spool: IO[bytes], reader: HashingReader) -> None:
+        """Copies a file already read and hashed by _read_whole into the output archive"""
+        with spool:
+            if isinstance(output_file, zipfile.ZipFile):
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = output_file.compression
+                member = zinfo.filename
+                with output_file.open(zinfo, "w") as member_out:
+                    shutil.copyfileobj(spool, member_out, _COPY_CHUNK)
+            else:
+                member = os.path.normpath(arcname)
+                output_file.writestream(member, spool, reader.bytes_read)
+        self.record_hashes([{"File": file_path, "Member": member, "SHA256": reader.hexdigest(), "Size": reader.bytes_read}])
+
+    def _copy_sampled(self, output_file: Union[zipfile.ZipFile, _TarLz4Wrapper], file_path: str, arcname: str,
+                      size: int, policy: SamplePolicy) -> None:
+        """Copies samples of a file too large to collect whole into the output archive, hashing the whole file
+        in the same pass if the policy says to. The sampled ranges are recorded in the capture index.
+        """
+        ranges = sample_ranges(size, policy)
+        logging.info(f"Sampling {sum(length for _, length in ranges)} of {size} bytes of {file_path}")
+        with open(file_path, "rb", buffering=0) as file_in:
+            reader = SampledReader(file_in, size, ranges, hash_all=policy.hash)
+            if isinstance(output_file, zipfile.ZipFile):
+                zinfo = zipfile.ZipInfo.from_file(file_path, arcname)
+                zinfo.compress_type = output_file.compression
+                member = zinfo.filename
+                with output_file.open(zinfo, "w") as member_out:
+                    shutil.copyfileobj(reader, member_out, _COPY_CHUNK)  # type: ignore
+            else:
+                member = os.path.normpath(arcname)
+                output_file.writestream(member, reader, sum(length for _, length in ranges))
+        self.sampled_files.append({"File": file_path, "Member": member, "Size": size,
+                                   "Ranges": [[offset, length] for offset, length in ranges]})
+        sha256 = reader.hexdigest()
+        if sha256:
+            self.record_hashes([{"File": file_path, "Member": member, "SHA256": sha256, "Size": reader.bytes_read}])
+
+    def record_hashes(self, file_hashes: List[dict]) -> None:
+        """Records the hashes of collected files and carved artifacts, checking them against the IOC index
+
+        :param file_hashes: List of hashes - e.g. [{'File': '/bin/sh', 'Member': 'collected_files/bin/sh', 'SHA256': '...'}]
+        """
+        self.file_hashes += file_hashes
+        if not self.ioc_index:
+            return
+        for file_hash in file_hashes:
+            if file_hash["SHA256"] in self.ioc_index:
+                logging.warning(f"IOC hash match: {file_hash['File']} ({file_hash['SHA256']})")
+                self.ioc_matches.append(file_hash)
+
+    def write_capture_index(self) -> None:
+        """Writes an index of the capture, so readers can find process dumps, memory regions and files
+        without scanning the archive, along with the hash and IOC match tables. Called once collection has finished.
+        """
+        if self.output_path.endswith(".tar.lz4"):
+            logging.info("Capture index is only written to zip output")
+            return
+        with zipfile.ZipFile(self.output_path, "a", compression=zipfile.ZIP_DEFLATED) as zip_file:
+            members = [member for member in zip_file.namelist() if member != CAPTURE_INDEX_MEMBER]
+            index = build_index(members, self.dump_manifest, self.file_hashes, self.sampled_files)
+            zip_file.writestr(CAPTURE_INDEX_MEMBER, json.dumps(index))
+            zip_file.writestr("hashes.json", self.dict_to_json(self.file_hashes))
+            if self.ioc_index:
+                zip_file.writestr("ioc_matches.json", self.dict_to_json(self.ioc_matches))
+                logging.info(f"{len(self.ioc_matches)} IOC hash matches written to ioc_matches.json in output archive.")
+        logging.info(f"Capture index written to {CAPTURE_INDEX_MEMBER} in output archive.")
+        if self.shard_paths:
+            write_manifest(self.output_path, self.shard_paths, self.dump_manifest)
 
     def _open_output(self) -> Union[zipfile.ZipFile, _TarLz4Wrapper]:
         if self.output_path.endswith('.tar.lz4'):
-            return _TarLz4Wrapper(self.output_path)
+            # Triage and the volatile artifacts share one tar, until _close_output
+            if not self._tar_output:
+                self._tar_output = _TarLz4Wrapper(self.output_path)
+            return self._tar_output
         else:
             return zipfile.ZipFile(self.output_path, 'a', compression=zipfile.ZIP_DEFLATED)
 
-    def yara_scan(self) -> None:
+    def _close_output(self) -> None:
+        """Finishes the tar of a tar.lz4 capture. Anything written later, e.g. process dumps, is appended as a zip"""
+        if self._tar_output:
+            self._tar_output.close()
+            self._tar_output = None
+
+    def _yara_scan_process(self, proc: ProcessRecord) -> List[dict]:
+        """Scans the memory of one process with YARA
+
+        :param proc: The process record
+        :return: List of YARA matches, with the process id and name added
+        """
+        hits: List[dict] = []
+
         def yara_hit_callback(hit: dict) -> Any:
-            self.yara_results.append(hit)
+            hits.append(hit)
             if self.include_memory:
                 logging.info(f"YARA rule {hit['rule']} triggered. Process will be dumped.")
             else:
                 logging.info(f"YARA rule {hit['rule']} was triggered.")
             return yara.CALLBACK_CONTINUE
-        
-        if not _YARA_AVAILABLE:
+
+        pid = proc.pid
+        logging.info(f"Scanning pid {pid} with YARA")
+        try:
+            self.yara_rules.match(pid=pid, callback=yara_hit_callback, which_callbacks=yara.CALLBACK_MATCHES, timeout=30)
+        except Exception as yerr:
+            logging.error(f"Error scanning process with YARA: {yerr}")
+        for hit in hits:
+            hit['pid'] = pid
+            hit['proc_name'] = proc.name
+        return hits
+
+    def _yara_scan_all(self) -> None:
+        """Scans every process with YARA, several at once as matching releases the GIL"""
+        if self._yara_scanned:
+            return
+        self._yara_scanned = True
+        with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+            scans = executor.map(self._yara_scan_process, self.process_info)
+            for proc, hits in zip(self.process_info, tqdm(scans, total=len(self.process_info), desc="YARA scan progess", unit=" procs")):
+                if hits:
+                    self.yara_hit_pids.append(proc.pid)
+                    self.yara_results += hits
+
+    def yara_scan(self) -> None:
+        if not _YARA_AVAILABLE or not self.yara_rules:
             return None
 
         archive_out = self.output_path
-        for proc in tqdm(self.process_info, desc="YARA scan progess", unit=" procs"):
-            pid = proc["Process ID"]
-            p_name = proc["Name"]
-            logging.info(f"Scanning pid {pid} with YARA")
-            try:
-                matches = self.yara_rules.match(pid=pid, callback=yara_hit_callback, which_callbacks=yara.CALLBACK_MATCHES, timeout=30)
-                if matches:
-                    self.yara_hit_pids.append(pid)
-                    self.yara_results[-1]['pid'] = pid
-                    self.yara_results[-1]['proc_name'] = p_name
-            except Exception as yerr:
-                logging.error(f"Error scanning process with YARA: {yerr}")
-            
+        # Processes have already been scanned if triage found something, or while open files were copied
+        self._yara_scan_all()
+
         if self.yara_results:
             combined_yara_results = []
             for yara_hit in self.yara_results:
@@ -381,3 +914,44 @@ class BaseSystem:
         else:
             logging.info("No YARA rules were triggered. Nothing will be written to the output archive.")
 
+    def triage_scan(self) -> bool:
+        """Decides if a system is worth collecting from, before any bulk I/O
+
+        Takes the process snapshot then runs YARA over process memory and checks process executables
+        against the IOC index, in parallel. A small verdict document is written to triage.json.
+
+        :return: True if anything was found and full collection should run
+        """
+        started = time.time()
+        self.process_info = self.get_process_records()
+        if self.yara_rules:
+            self._yara_scan_all()
+
+        ioc_hits: List[dict] = []
+        if self.ioc_index:
+            exe_paths = sorted({proc.exe for proc in self.process_info if proc.exe})
+            with ThreadPoolExecutor(max_workers=self.scan_workers) as executor:
+                for exe_path, sha256 in zip(exe_paths, executor.map(sha256_file, exe_paths)):
+                    if sha256 and sha256 in self.ioc_index:
+                        logging.warning(f"IOC hash match: {exe_path} ({sha256})")
+                        pids = [proc.pid for proc in self.process_info if proc.exe == exe_path]
+                        ioc_hits.append({"File": exe_path, "SHA256": sha256, "Process IDs": pids})
+
+        interesting = bool(self.yara_results or ioc_hits)
+        verdict = {
+            "format": "VarcTriageVerdict",
+            "hostname": self.get_machine_name(),
+            "time": self.todays_date,
+            "interesting": interesting,
+            "processes_scanned": len(self.process_info),
+            "yara_hits": [{"rule": hit["rule"], "pid": hit["pid"], "proc_name": hit["proc_name"]} for hit in self.yara_results],
+            "ioc_matches": ioc_hits,
+            "duration": round(time.time() - started, 3),
+        }
+        with self._open_output() as output_file:
+            output_file.writestr("triage.json", json.dumps(verdict, indent=1).encode())
+        if interesting:
+            logging.info("Triage found YARA or IOC hits, running full collection")
+        else:
+            logging.info(f"Triage found nothing, skipping full collection. Verdict written to {self.output_path}")
+        return interesting
@@ -1,14 +1,30 @@
 import ctypes
 import logging
-import re
+import os
+import queue
+import time
 import zipfile
+from array import array
 from os import getpid, sep
-from pathlib import Path
 from tempfile import NamedTemporaryFile
-from typing import Any, List, Optional, Tuple
+from typing import IO, Any, Callable, Dict, Iterator, List, Optional, Set, Tuple
 
+import psutil
 from tqdm import tqdm
+from varc_core.artifacts import MemoryChunk
 from varc_core.systems.base_system import BaseSystem
+from varc_core.utils.freezer import ProcessFreezer
+from varc_core.utils.page_store import PAGE_SIZE, PAGE_STORE_MEMBER, PAGE_TABLE_SUFFIX, PageStore, page_table
+from varc_core.utils.proc_events import ProcessMonitor, start_monitor
+from varc_core.utils.proc_maps import MemoryRegion, mapped_files, parse_maps
+from varc_core.utils.process_records import PROCESS_ATTRS, PathTable, ProcessRecord
+from varc_core.utils.scheduler import CollectorScheduler
+
+# /proc/<pid>/pagemap entry flags, see https://www.kernel.org/doc/Documentation/vm/pagemap.txt
+_PAGEMAP_PRESENT = 1 << 63
+_PAGEMAP_SWAPPED = 1 << 62
+# Number of pagemap entries read at a time
+_PAGEMAP_BATCH_PAGES = 65536
 
 # based on https://stackoverflow.com/questions/48897687/why-does-the-syscall-process-vm-readv-sets-errno-to-success and PymemLinux library
 
@@ -19,16 +35,28 @@ class IOVec(ctypes.Structure):
     ]
 
 class LinuxSystem(BaseSystem):
-    
+    # Mapped files are read from /proc/<pid>/maps, rather than psutil's much slower /proc/<pid>/smaps
+    process_attrs = [attr for attr in PROCESS_ATTRS if attr != "memory_maps"]
+
     def __init__(
         self,
         include_memory: bool,
         include_open: bool,
         extract_dumps: bool,
         yara_file: Optional[str],
+        dedupe_pages: bool = False,
+        resident_only: bool = False,
+        freeze: bool = False,
+        process_events: bool = False,
+        procfs_root: str = "/proc",
         **kwargs: Any
     ) -> None:
-        super().__init__(include_memory=include_memory, include_open=include_open, extract_dumps=extract_dumps, yara_file=yara_file, **kwargs)
+        self.procfs_root = procfs_root
+        self.process_events = process_events
+        self.process_monitor: Optional[ProcessMonitor] = None
+        self.dedupe_pages = dedupe_pages
+        self.resident_only = resident_only
+        self.freeze = freeze
         self.libc = ctypes.CDLL("libc.so.6")
         self.process_vm_readv = self.libc.process_vm_readv
         self.process_vm_readv.args = [ # type: ignore
@@ -40,40 +68,72 @@ class LinuxSystem(BaseSystem):
             ctypes.c_ulong
         ]
         self.process_vm_readv.restype = ctypes.c_ssize_t
-        if self.include_memory:
-            self._MAX_VIRTUAL_PAGE_CHUNK = 256 * 1000**2 # set max number of megabytes that will be read at a time
-            self.own_pid = getpid()
-            if self.yara_file:
-                self.yara_scan()
+        self._MAX_VIRTUAL_PAGE_CHUNK = 256 * 1000**2 # set max number of megabytes that will be read at a time
+        self.own_pid = getpid()
+        super().__init__(include_memory=include_memory, include_open=include_open, extract_dumps=extract_dumps, yara_file=yara_file, **kwargs)
+
+    def run(self) -> None:
+        if self.process_events:
+            self.process_monitor = start_monitor(self.procfs_root)
+        try:
+            super().run()
+        finally:
+            if self.process_monitor:
+                self.process_monitor.stop()
+
+    def register_timeline(self, scheduler: CollectorScheduler, last_write: str) -> Optional[str]:
+        if not self.process_monitor:
+            return None
+
+        def write_process_events() -> None:
+            monitor = self.process_monitor
+            monitor.stop()  # type: ignore
+            # Written after the process dumps, so appended to the zip holding them for tar.lz4 captures
+            with zipfile.ZipFile(self.output_path, "a", compression=zipfile.ZIP_DEFLATED) as zip_file:
+                zip_file.writestr("process_events.json", self.dict_to_json(monitor.rows()))  # type: ignore
+            logging.info("Process events written to process_events.json in output archive.")
+
+        scheduler.register("process_events", write_process_events, [last_write])
+        return "process_events"
+
+    def acquire_memory(self) -> None:
+        # Stages completed by a resumed run are skipped
+        if self.yara_file and "yara" not in self.completed_stages:
+            self.yara_scan()
+            self.checkpoint_stage("yara", Pids=self.yara_hit_pids)
+        if "memory" not in self.completed_stages:
             self.dump_processes()
-            if self.extract_dumps:
-                from varc_core.utils import dumpfile_extraction
-                dumpfile_extraction.extract_dumps(Path(self.output_path))
+            # De-duplicated dumps share the page store written at the end and sharded dumps are written in
+            # parallel, so either are only checkpointed together
+            self.checkpoint_stage("memory", Dumps=self.dump_manifest if self.dedupe_pages or self.shard_paths else [],
+                                  Shards=self.shard_paths)
+        if self.extract_dumps and "extract" not in self.completed_stages:
+            carved_hashes = self.carve_dumps()
+            self.record_hashes(carved_hashes)
+            self.checkpoint_stage("extract", Hashes=carved_hashes)
 
-    def parse_mem_map(self, pid: int, p_name: str) -> List[Tuple[int, int]]:
-        """Returns a list of (start address, end address) tuples of the regions of process memory that are mapped
-        
-        
+    def parse_mem_map(self, pid: int, p_name: str) -> List[MemoryRegion]:
+        """Returns the readable regions of process memory that are mapped
+
+        :param pid: The process id
+        :param p_name: The process name, for logging
         """
-        map_addresses = []
-        mem_map_path = Path(f"/proc/{pid}/maps")
         try:
-            with mem_map_path.open(mode="r") as mem_map:
-                map_content = mem_map.readlines()
-                for line in map_content:
-                    line_groups = re.match(r"([a-fA-F0-9]+)-([a-fA-F0-9]+)\s(r|-)" , line)
-                    if line_groups.group(3) == "r": # type: ignore # Only collecting pages that are readable
-                        page_start = int(line_groups.group(1), 16) # type: ignore
-                        page_end = int(line_groups.group(2), 16) # type: ignore
-                        map_addresses.append((page_start, page_end))
-        except FileNotFoundError:
-            logging.warning(f"Could not parse memory map for {p_name} (pid {pid}). Cannot dump this process.")
-            return map_addresses
+            regions = parse_maps(pid, self.procfs_root)
         except PermissionError:
             logging.warning(f"Permission denied parsing memory map for {p_name} (pid {pid}). Cannot dump this process.")
-            return map_addresses
+            return []
+        except OSError:
+            logging.warning(f"Could not parse memory map for {p_name} (pid {pid}). Cannot dump this process.")
+            return []
+        # Only collecting pages that are readable
+        return [region for region in regions if region.readable]
 
-        return map_addresses
+    def get_mapped_files(self, pid: int) -> Optional[List[str]]:
+        try:
+            return mapped_files(parse_maps(pid, self.procfs_root))
+        except OSError:
+            return []
 
     def read_bytes(self, pid: int, address: int, byte: int) -> Optional[bytes]:
         """Reads {byte} bytes from the base memory address {address} in the virtual memory space of process {pid}
@@ -82,7 +142,7 @@ class LinuxSystem(BaseSystem):
         :param address: int of the addrss
         :param byte: int of current bytre
 
-        :return: Bytes from memory location
+        :return: Bytes from memory location, shorter than {byte} if the read stopped at an unreadable page
         :rtype: bytes
         """
 
@@ -95,52 +155,320 @@ class LinuxSystem(BaseSystem):
         if linux_syscall == -1:
             return None
 
-        return buff.raw
+        return buff.raw[:linux_syscall]
+
+    @staticmethod
+    def _pread_mem(mem_fd: Optional[int], address: int, byte: int) -> Optional[bytes]:
+        """Reads from /proc/<pid>/mem, which can read some pages process_vm_readv can't e.g. PROT_NONE guard pages"""
+        if mem_fd is None:
+            return None
+        buff = bytearray(byte)
+        try:
+            read = os.preadv(mem_fd, [buff], address)
+        except (OSError, OverflowError):
+            return None
+        return bytes(buff[:read])
+
+    def read_range(
+        self, pid: int, address: int, length: int, mem_fd: Optional[int] = None
+    ) -> Tuple[List[Tuple[int, bytes]], List[Tuple[int, int]]]:
+        """Reads a range of process memory, recovering everything readable around unreadable pages
+
+        Ranges are read whole with process_vm_readv, falling back to /proc/<pid>/mem. A short read
+        continues from where it stopped, and a failed read is split in half (on a page boundary) until
+        the unreadable pages are isolated, so a single bad page costs a handful of extra reads rather
+        than the whole range.
+
+        :param pid: The process id
+        :param address: Start address of the range
+        :param length: Length of the range
+        :param mem_fd: Open file descriptor of /proc/<pid>/mem, if available
+        :return: The (address, bytes) segments that were read and the (address, length) holes that couldn't be, in address order
+        """
+        segments: List[Tuple[int, bytes]] = []
+        holes: List[Tuple[int, int]] = []
+        # Processed depth first, lowest address first, so segments and holes come out in address order
+        pending = [(address, length)]
+        while pending:
+            start, size = pending.pop()
+            content = self.read_bytes(pid, start, size) or self._pread_mem(mem_fd, start, size)
+            if content:
+                segments.append((start, content))
+                if len(content) < size:
+                    pending.append((start + len(content), size - len(content)))
+                continue
+            if size <= PAGE_SIZE:
+                if holes and holes[-1][0] + holes[-1][1] == start:
+                    holes[-1] = (holes[-1][0], holes[-1][1] + size)
+                else:
+                    holes.append((start, size))
+                continue
+            half = max(PAGE_SIZE, (size // 2) // PAGE_SIZE * PAGE_SIZE)
+            pending.append((start + half, size - half))
+            pending.append((start, half))
+        return segments, holes
+
+    def read_ranges(self, pid: int, start: int, end: int, skipped: Dict[str, int]) -> Iterator[Tuple[int, int]]:
+        """Returns the (address, length) ranges to read for a mapped region, at most _MAX_VIRTUAL_PAGE_CHUNK long
+
+        If resident_only is set, /proc/{pid}/pagemap is used to skip pages that aren't present in memory
+        or are swapped out, rather than faulting them in, and contiguous runs of present pages are
+        coalesced into one read. Skipped pages are counted in {skipped}. If the page map can't be read
+        for part of the region, that part is read whole.
+
+        :param pid: The process id
+        :param start: Start address of the mapped region
+        :param end: End address of the mapped region
+        :param skipped: Dict of page counts to add skipped "not_present" and "swapped" pages to
+        """
+        if not self.resident_only:
+            yield from self._chunked_ranges(start, end)
+            return
+        try:
+            pagemap = open(os.path.join(self.procfs_root, str(pid), "pagemap"), "rb", buffering=0)
+        except (FileNotFoundError, PermissionError, ProcessLookupError):
+            logging.warning(f"Could not read page map for pid {pid}, reading all pages")
+            yield from self._chunked_ranges(start, end)
+            return
+
+        run_start: Optional[int] = None
+        run_end = 0
+        # Where the page map stopped being readable, if it did before the end of the region
+        unmapped_start: Optional[int] = None
+        with pagemap:
+            for batch_start in range(start, end, _PAGEMAP_BATCH_PAGES * PAGE_SIZE):
+                batch_pages = (min(end, batch_start + _PAGEMAP_BATCH_PAGES * PAGE_SIZE) - batch_start) // PAGE_SIZE
+                entries = array("Q")
+                try:
+                    pagemap.seek((batch_start // PAGE_SIZE) * entries.itemsize)
+                    entries.frombytes(pagemap.read(batch_pages * entries.itemsize))
+                except (OSError, ValueError) as pagemap_error:
+                    logging.warning(f"Error reading page map for pid {pid}: {pagemap_error}, reading the rest of the region")
+                    unmapped_start = batch_start
+                    break
+                for page_number, entry in enumerate(entries):
+                    address = batch_start + page_number * PAGE_SIZE
+                    if entry & _PAGEMAP_PRESENT:
+                        if run_start is not None and address - run_start >= self._MAX_VIRTUAL_PAGE_CHUNK:
+                            yield run_start, run_end - run_start
+                            run_start = None
+                        if run_start is None:
+                            run_start = address
+                        run_end = address + PAGE_SIZE
+                        continue
+                    skipped["swapped" if entry & _PAGEMAP_SWAPPED else "not_present"] += 1
+                    if run_start is not None:
+                        yield run_start, run_end - run_start
+                        run_start = None
+                if len(entries) < batch_pages:
+                    # Page map ended early, the process has probably exited
+                    unmapped_start = batch_start + len(entries) * PAGE_SIZE
+                    break
+        if run_start is not None:
+            yield run_start, run_end - run_start
+        if unmapped_start is not None:
+            yield from self._chunked_ranges(unmapped_start, end)
+
+    def _chunked_ranges(self, start: int, end: int) -> Iterator[Tuple[int, int]]:
+        for chunk_start in range(start, end, self._MAX_VIRTUAL_PAGE_CHUNK):
+            yield chunk_start, min(self._MAX_VIRTUAL_PAGE_CHUNK, end - chunk_start)
+
+    @staticmethod
+    def _add_region(regions: List[List[int]], address: int, offset: int, length: int) -> None:
+        """Records that {length} bytes from {address} were written at {offset} in a dump, merging contiguous regions"""
+        if regions:
+            last_address, last_offset, last_length = regions[-1]
+            if last_address + last_length == address and last_offset + last_length == offset:
+                regions[-1][2] += length
+                return
+        regions.append([address, offset, length])
+
+    def _read_process(
+        self, pid: int, maps: List[MemoryRegion], mem_fd: Optional[int], skipped: Dict[str, int],
+        write_segment: Callable[[int, bytes], None]
+    ) -> List[List[int]]:
+        """Reads every mapped region of a process, passing each segment read to {write_segment}
+
+        :return: The [address, length] holes that couldn't be read, merged where contiguous
+        """
+        holes: List[List[int]] = []
+        for segment_start, mem_page_content in self._iter_segments(pid, maps, mem_fd, skipped, holes):
+            write_segment(segment_start, mem_page_content)
+        return holes
+
+    def _iter_segments(
+        self, pid: int, maps: List[MemoryRegion], mem_fd: Optional[int], skipped: Dict[str, int], holes: List[List[int]]
+    ) -> Iterator[Tuple[int, bytes]]:
+        """Yields the (address, bytes) segments read from every mapped region of a process, adding unreadable ranges to {holes}"""
+        for region in maps:
+            for chunk_start, chunk_len in self.read_ranges(pid, region.start, region.end, skipped):
+                segments, chunk_holes = self.read_range(pid, chunk_start, chunk_len, mem_fd)
+                for hole_address, hole_length in chunk_holes:
+                    if holes and holes[-1][0] + holes[-1][1] == hole_address:
+                        holes[-1][1] += hole_length
+                    else:
+                        holes.append([hole_address, hole_length])
+                yield from segments
+
+    def _open_mem(self, pid: int) -> Optional[int]:
+        try:
+            return os.open(os.path.join(self.procfs_root, str(pid), "mem"), os.O_RDONLY)
+        except OSError:
+            return None
+
+    def _dump_targets(self) -> Iterator[Tuple[int, str, List[MemoryRegion]]]:
+        """Yields the (pid, name, readable regions) of each process to dump"""
+        for proc in self.process_info:
+            # If scanning with YARA, only dump processes if they triggered a rule
+            if self.yara_hit_pids:
+                if proc.pid not in self.yara_hit_pids or proc.pid == self.own_pid:
+                    continue
+            if (proc.pid, proc.name) in self.resumed_dumps:
+                continue
+            maps = self.parse_mem_map(proc.pid, proc.name)
+            if maps:
+                yield proc.pid, proc.name, maps
+        yield from self._started_targets({proc.pid for proc in self.process_info})
+
+    def _started_targets(self, seen: Set[int]) -> Iterator[Tuple[int, str, List[MemoryRegion]]]:
+        """Yields the processes started since the snapshot that are still running, as recorded by the process monitor"""
+        if not self.process_monitor or self.process_id:
+            return
+        while True:
+            try:
+                pid = self.process_monitor.started.get_nowait()
+            except queue.Empty:
+                return
+            if pid in seen or pid == self.own_pid:
+                continue
+            seen.add(pid)
+            try:
+                proc = ProcessRecord(psutil.Process(pid).as_dict(attrs=self.process_attrs), PathTable())
+            except psutil.Error:
+                # Exited already, the process events table still has it
+                continue
+            if self.process_name and proc.name.lower() != self.process_name.lower():
+                continue
+            if self.yara_hit_pids:
+                # Only dumped if it triggers a rule, like the processes in the snapshot
+                hits = self._yara_scan_process(proc) if self.yara_rules else []
+                if not hits:
+                    continue
+                self.yara_hit_pids.append(pid)
+                self.yara_results += hits
+            if (proc.pid, proc.name) in self.resumed_dumps:
+                continue
+            logging.info(f"Dumping {proc.name} (pid {pid}), started during collection")
+            maps = self.parse_mem_map(pid, proc.name)
+            if maps:
+                yield pid, proc.name, maps
+
+    def iter_memory(self) -> Iterator[MemoryChunk]:
+        for pid, p_name, maps in self._dump_targets():
+            mem_fd = self._open_mem(pid)
+            try:
+                for address, content in self._iter_segments(pid, maps, mem_fd, {"not_present": 0, "swapped": 0}, []):
+                    yield MemoryChunk(pid, p_name, address, content)
+            except OSError as oserror:
+                logging.warning(f"Error reading process memory for {p_name} (pid {pid}). Error was {oserror}.")
+            finally:
+                if mem_fd is not None:
+                    os.close(mem_fd)
+
+    def _dedupe_spooled(self, spool: IO[bytes], spooled_regions: List[List[int]], page_store: PageStore, page_indexes: array) -> List[List[int]]:
+        """Adds a dump spooled to {spool} to the page store, returning its regions with page table offsets"""
+        regions: List[List[int]] = []
+        for address, offset, length in spooled_regions:
+            for piece_start in range(0, length, self._MAX_VIRTUAL_PAGE_CHUNK):
+                piece_length = min(self._MAX_VIRTUAL_PAGE_CHUNK, length - piece_start)
+                spool.seek(offset + piece_start)
+                self._add_region(regions, address + piece_start, len(page_indexes) * PAGE_SIZE, piece_length)
+                page_indexes.extend(page_store.add(spool.read(piece_length)))
+        return regions
 
     def dump_processes(self) -> None:
         """Dumps all processes to temp files, adds temp file to output archive then removes the temp file"""
         archive_out = self.output_path
+        # Unique pages shared by all dumps, if de-duplicating
+        store_file = NamedTemporaryFile(mode="w+b", delete=True) if self.dedupe_pages else None
+        page_store = PageStore(store_file) if store_file else None
+        # De-duplicated dumps are page tables into the page store, so stay in the capture with it
+        shards = None if page_store else self._open_shards()
+        freezer = ProcessFreezer(self.own_pid, self.procfs_root) if self.freeze else None
+        frozen_seconds: List[float] = []
         with zipfile.ZipFile(archive_out, "a", compression=zipfile.ZIP_DEFLATED) as zip_file:
             try:
-                for proc in tqdm(self.process_info, desc="Process dump progess", unit=" procs"):
-                    # If scanning with YARA, only dump processes if they triggered a rule
-                    if self.yara_hit_pids:
-                        if proc["Process ID"] not in self.yara_hit_pids or proc["Process ID"] == self.own_pid:
-                            continue
-                    pid = proc["Process ID"]
-                    p_name = proc["Name"]
-                    maps = self.parse_mem_map(pid, p_name)
-                    if not maps:
-                        continue
+                for pid, p_name, maps in tqdm(self._dump_targets(), total=len(self.process_info), desc="Process dump progess", unit=" procs"):
+                    mem_fd = self._open_mem(pid)
                     with NamedTemporaryFile(mode="w+b", buffering=0, delete=True) as tmpfile:
+                        regions: List[List[int]] = []
+                        page_indexes = array("I")
+                        skipped = {"not_present": 0, "swapped": 0}
+
+                        def write_segment(address: int, content: bytes, regions: List[List[int]] = regions,
+                                          page_indexes: "array[int]" = page_indexes, tmpfile: IO[bytes] = tmpfile) -> None:
+                            if page_store and not freezer:
+                                self._add_region(regions, address, len(page_indexes) * PAGE_SIZE, len(content))
+                                page_indexes.extend(page_store.add(content))
+                            else:
+                                self._add_region(regions, address, tmpfile.tell(), len(content))
+                                tmpfile.write(content)
+
                         try:
-                            for map in maps:
-                                page_start = map[0]
-                                page_len = map[1] - map[0]
-                                if page_len > self._MAX_VIRTUAL_PAGE_CHUNK:
-                                    sub_chunk_count, final_chunk_size = divmod(page_len, self._MAX_VIRTUAL_PAGE_CHUNK)
-                                    page_len = int(page_len / sub_chunk_count)
-                                    for sc in range(0, sub_chunk_count):
-                                        mem_page_content = self.read_bytes(pid, page_start, page_len)
-                                        if mem_page_content:
-                                            tmpfile.write(mem_page_content)
-                                        page_start = page_start + self._MAX_VIRTUAL_PAGE_CHUNK
-                                    mem_page_content = self.read_bytes(pid, page_start, final_chunk_size)
-                                    if mem_page_content:
-                                        tmpfile.write(mem_page_content)
-                                else:
-                                    mem_page_content = self.read_bytes(pid, page_start, page_len)
-                                    if mem_page_content:
-                                        tmpfile.write(mem_page_content)
-                            zip_file.write(tmpfile.name, f"process_dumps{sep}{p_name}_{pid}.mem")
+                            freeze_entry: Optional[Dict[str, Any]] = None
+                            if freezer:
+                                # Only copy memory while frozen, de-duplicating and compressing once thawed
+                                freeze_started = time.monotonic()
+                                with freezer.frozen(pid) as freeze_method:
+                                    holes = self._read_process(pid, maps, mem_fd, skipped, write_segment)
+                                freeze_entry = {"Method": freeze_method, "Seconds": round(time.monotonic() - freeze_started, 6)}
+                                if page_store:
+                                    regions = self._dedupe_spooled(tmpfile, regions, page_store, page_indexes)
+                            else:
+                                holes = self._read_process(pid, maps, mem_fd, skipped, write_segment)
+                            member = f"process_dumps{sep}{p_name}_{pid}.mem"
+                            dump_entry: Dict[str, Any] = {"Process ID": pid, "Name": p_name, "Member": member, "Regions": regions}
+                            if holes:
+                                dump_entry["Holes"] = holes
+                            if self.resident_only:
+                                dump_entry["Skipped Pages"] = skipped
+                            if freeze_entry:
+                                dump_entry["Freeze"] = freeze_entry
+                                if freeze_entry["Method"]:
+                                    frozen_seconds.append(freeze_entry["Seconds"])
+                            if page_store:
+                                dump_entry["Page Table"] = member + PAGE_TABLE_SUFFIX
+                                zip_file.writestr(dump_entry["Page Table"], page_table(page_indexes, len(page_indexes) * PAGE_SIZE))
+                            elif shards:
+                                # Opened again so the dump outlives the temporary file until it's written
+                                shards.submit(open(tmpfile.name, "rb"), member, dump_entry, self.dump_compression)
+                            else:
+                                zip_file.write(tmpfile.name, member, compress_type=self.dump_compression)
+                                if self.journal:
+                                    self.journal.record(zip_file, "dump", Dump=dump_entry)
+                            self.dump_manifest.append(dump_entry)
                         except PermissionError:
                             logging.warning(f"Permission denied opening process memory for {p_name} (pid {pid}). Cannot dump this process.")
                             continue
                         except OSError as oserror:
                             logging.warning(f"Error opening process memory page for {p_name} (pid {pid}). Error was {oserror}. Dump may be incomplete.")
                             pass
+                        finally:
+                            if mem_fd is not None:
+                                os.close(mem_fd)
             except MemoryError:
                 logging.warning("Exceeded available memory, skipping further memory collection")
-                        
+            finally:
+                if shards:
+                    self.shard_paths = shards.close()
+
+            if store_file and page_store:
+                store_file.flush()
+                zip_file.write(store_file.name, PAGE_STORE_MEMBER, compress_type=self.dump_compression)
+                store_file.close()
+                logging.info(f"De-duplicated {page_store.total_pages} pages to {page_store.unique_pages} unique pages")
+
+        if frozen_seconds:
+            logging.info(f"Froze {len(frozen_seconds)} processes for at most {max(frozen_seconds):.3f} seconds, {sum(frozen_seconds):.3f} seconds in total")
 
         logging.info(f"Dumping processing has completed. Output file is located: {archive_out}")
\ No newline at end of file
@@ -3,11 +3,11 @@ import tempfile
 import zipfile
 from os import remove as del_file
 from os import sep
-from pathlib import Path
 from sys import platform
-from typing import Any, Optional, Tuple
+from typing import Any, Iterator, List, Optional, Tuple
 
 from tqdm import tqdm
+from varc_core.artifacts import MemoryChunk
 from varc_core.systems.base_system import BaseSystem
 
 if platform == "win32": # dont try to import on linux
@@ -28,14 +28,19 @@ class WindowsSystem(BaseSystem):
         **kwargs: Any
     ) -> None:
         super().__init__(include_memory=include_memory, include_open=include_open, extract_dumps=extract_dumps, yara_file=yara_file, **kwargs)
-        if self.include_memory:
-            if self.yara_file:
-                self.yara_scan()
-            self.dump_processes()
 
-            if self.extract_dumps:
-                from varc_core.utils import dumpfile_extraction
-                dumpfile_extraction.extract_dumps(Path(self.output_path))
+    def acquire_memory(self) -> None:
+        # Stages completed by a resumed run are skipped
+        if self.yara_file and "yara" not in self.completed_stages:
+            self.yara_scan()
+            self.checkpoint_stage("yara", Pids=self.yara_hit_pids)
+        if "memory" not in self.completed_stages:
+            self.dump_processes()
+            self.checkpoint_stage("memory", Dumps=self.dump_manifest if self.shard_paths else [], Shards=self.shard_paths)
+        if self.extract_dumps and "extract" not in self.completed_stages:
+            carved_hashes = self.carve_dumps()
+            self.record_hashes(carved_hashes)
+            self.checkpoint_stage("extract", Hashes=carved_hashes)
 
     def read_process(self, handle: int, address: int) -> Tuple[Optional[bytes], int]:
         """ Read a process. Based on pymems pattern module
@@ -64,21 +69,17 @@ class WindowsSystem(BaseSystem):
             logging.warning("Failed to read a memory page")
         return page_bytes, next_region
     
-    def dump_processes(self) -> None:
-        """
-        Based on pymem's 'Pattern' module
-        """
-        archive_out = self.output_path
-        for proc in tqdm(self.process_info, desc="Process dump progess", unit=" procs"):
+    def _open_targets(self) -> Iterator[Tuple[int, str, Any]]:
+        """Yields the (pid, name, open pymem process) of each process to dump"""
+        for proc in self.process_info:
             # If scanning with YARA, only dump processes if they triggered a rule
             if self.yara_hit_pids:
-                if proc["Process ID"] not in self.yara_hit_pids:
+                if proc.pid not in self.yara_hit_pids:
                     continue
-            pid = proc["Process ID"]
-            p_name = proc["Name"]
-
-            # Set upper limits on memory address to read
-            user_space_limit = 0x7FFFFFFF0000 if maxsize > 2**32 else 0x7fff0000
+            if (proc.pid, proc.name) in self.resumed_dumps:
+                continue
+            pid = proc.pid
+            p_name = proc.name
 
             # Open handle to process memory for reading
             try:
@@ -90,15 +91,51 @@ class WindowsSystem(BaseSystem):
             except pymem.exception.WinAPIError:
                 logging.warning(f"API error attempting to open process {p_name} (pid {pid}) for reading. Cannot dump this process.")
                 continue
-            
+            yield pid, p_name, p
+
+    def _iter_regions(self, handle: int) -> Iterator[Tuple[int, bytes]]:
+        """Yields the (address, bytes) of every readable region in the process virtual address space"""
+        # Set upper limits on memory address to read
+        user_space_limit = 0x7FFFFFFF0000 if maxsize > 2**32 else 0x7fff0000
+        next_region = 0
+        while next_region < user_space_limit:
+            region_address = next_region
+            proc_page_bytes, next_region = self.read_process(handle, next_region)
+            if proc_page_bytes:
+                yield region_address, proc_page_bytes
+
+    def iter_memory(self) -> Iterator[MemoryChunk]:
+        for pid, p_name, p in self._open_targets():
+            for region_address, proc_page_bytes in self._iter_regions(p.process_handle):
+                yield MemoryChunk(pid, p_name, region_address, proc_page_bytes)
+
+    def dump_processes(self) -> None:
+        """
+        Based on pymem's 'Pattern' module
+        """
+        archive_out = self.output_path
+        shards = self._open_shards()
+        for pid, p_name, p in tqdm(self._open_targets(), total=len(self.process_info), desc="Process dump progess", unit=" procs"):
             # Dump all pages the process virtual address space
-            next_region = 0
+            regions: List[List[int]] = []
             with zipfile.ZipFile(archive_out, 'a', compression=zipfile.ZIP_DEFLATED) as zip_file:
                 with tempfile.NamedTemporaryFile(mode="w+b", buffering=0, delete=False) as tmpfile:
-                    while next_region < user_space_limit:
-                        proc_page_bytes, next_region = self.read_process(p.process_handle, next_region)
-                        if proc_page_bytes:
-                            tmpfile.write(proc_page_bytes)
-                    zip_file.write(tmpfile.name, f"process_dumps{sep}{p_name}_{pid}.mem")
-                del_file(tmpfile.name)
+                    for region_address, proc_page_bytes in self._iter_regions(p.process_handle):
+                        regions.append([region_address, tmpfile.tell(), len(proc_page_bytes)])
+                        tmpfile.write(proc_page_bytes)
+                    member = f"process_dumps{sep}{p_name}_{pid}.mem"
+                    dump_entry = {"Process ID": pid, "Name": p_name, "Member": member, "Regions": regions}
+                    self.dump_manifest.append(dump_entry)
+                    if not shards:
+                        zip_file.write(tmpfile.name, member, compress_type=self.dump_compression)
+                        if self.journal:
+                            self.journal.record(zip_file, "dump", Dump=dump_entry)
+                if shards:
+                    # Submitted once closed, as the shard writer removes the temporary file when the dump is written
+                    shards.submit(open(tmpfile.name, "rb"), member, dump_entry, self.dump_compression,
+                                  remove_path=tmpfile.name)
+                else:
+                    del_file(tmpfile.name)
+        if shards:
+            self.shard_paths = shards.close()
         logging.info(f"Dumping processing has completed. Output file is located: {archive_out}")
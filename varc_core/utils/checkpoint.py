@@ -0,0 +1,223 @@
+"""Checkpoints for resuming a collection that was killed part way through
+
+A journal next to the capture, <capture>.journal, records each collected file, each process
+dump and each completed stage as a JSON line, along with how far into the archive it ends.
+Journal entries are only written once the archive data they refer to has been synced to disk,
+so the archive can always be cut back to the last journal entry and finalized.
+
+A zip is only readable once its central directory is written on close, so a capture from a
+killed run is recovered by walking the local headers of its members up to the last checkpoint
+and writing a new central directory. The journal is removed once the capture index is written.
+"""
+import json
+import logging
+import os
+import struct
+import time
+import zipfile
+from typing import IO, Any, Dict, List, NamedTuple, Optional, Set, Tuple
+
+JOURNAL_SUFFIX = ".journal"
+
+# Seconds between syncing the archive and journal to disk while members are written
+_SYNC_INTERVAL = 1.0
+_LOCAL_HEADER = struct.Struct("<4s5H3L2H")
+_LOCAL_SIGNATURE = b"PK\x03\x04"
+# Signatures that can follow a complete member
+_NEXT_SIGNATURES = (_LOCAL_SIGNATURE, b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+_ZIP64_EXTRA = 0x0001
+_DATA_DESCRIPTOR_FLAG = 0x08
+
+
+def _strip_zip64(extra: bytes) -> bytes:
+    """Removes the zip64 field from local header extra data, as the central directory needs its own"""
+    stripped = b""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_length = struct.unpack_from("<HH", extra, position)
+        if field_id != _ZIP64_EXTRA:
+            stripped += extra[position:position + 4 + field_length]
+        position += 4 + field_length
+    return stripped
+
+
+def _zip64_sizes(extra: bytes) -> Optional[Tuple[int, int]]:
+    """Returns the (compressed, uncompressed) sizes from a zip64 local header field"""
+    position = 0
+    while position + 4 <= len(extra):
+        field_id, field_length = struct.unpack_from("<HH", extra, position)
+        if field_id == _ZIP64_EXTRA and field_length >= 16:
+            file_size, compress_size = struct.unpack_from("<QQ", extra, position + 4)
+            return compress_size, file_size
+        position += 4 + field_length
+    return None
+
+
+def _local_members(archive: IO[bytes], archive_end: int) -> Tuple[List[zipfile.ZipInfo], int]:
+    """Returns the complete members of a zip with no central directory from their local headers, and where they end"""
+    members: List[zipfile.ZipInfo] = []
+    position = 0
+    while position + _LOCAL_HEADER.size <= archive_end:
+        archive.seek(position)
+        header = archive.read(_LOCAL_HEADER.size)
+        (signature, extract_version, flag_bits, compress_type, dos_time, dos_date, crc, compress_size, file_size,
+         name_length, extra_length) = _LOCAL_HEADER.unpack(header)
+        if signature != _LOCAL_SIGNATURE or flag_bits & _DATA_DESCRIPTOR_FLAG:
+            break
+        name = archive.read(name_length)
+        extra = archive.read(extra_length)
+        if compress_size == 0xFFFFFFFF or file_size == 0xFFFFFFFF:
+            sizes = _zip64_sizes(extra)
+            if sizes is None:
+                break
+            compress_size, file_size = sizes
+        if compress_size == 0 and compress_type != zipfile.ZIP_STORED:
+            # Placeholder header of a member still being written, even empty compressed members have data
+            break
+        data_end = position + _LOCAL_HEADER.size + name_length + extra_length + compress_size
+        if data_end > archive_end:
+            break
+        # A member still being written has a placeholder header, so isn't followed by another member
+        archive.seek(data_end)
+        if data_end != archive_end and archive.read(4) not in _NEXT_SIGNATURES:
+            break
+        info = zipfile.ZipInfo(name.decode("utf-8" if flag_bits & 0x800 else "cp437"),
+                               ((dos_date >> 9) + 1980, (dos_date >> 5) & 0xF, dos_date & 0x1F,
+                                dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2))
+        info.extract_version = extract_version
+        info.flag_bits = flag_bits
+        info.compress_type = compress_type
+        info.CRC = crc
+        info.compress_size = compress_size
+        info.file_size = file_size
+        info.extra = _strip_zip64(extra)
+        info.header_offset = position
+        info.external_attr = 0o600 << 16
+        members.append(info)
+        position = data_end
+    return members, position
+
+
+def recover_archive(path: str, archive_end: Optional[int] = None) -> int:
+    """Finalizes a zip left without a central directory, keeping the members that were completely written
+
+    :param path: Path to the zip
+    :param archive_end: Only keep members ending at or before this offset, e.g. the last checkpoint
+    :return: Number of members recovered
+    """
+    with open(path, "r+b") as archive:
+        file_size = archive.seek(0, os.SEEK_END)
+        members, end = _local_members(archive, file_size if archive_end is None else min(archive_end, file_size))
+        archive.truncate(end)
+        archive.seek(end)
+        with zipfile.ZipFile(archive, "w") as recovered:
+            for info in members:
+                recovered.filelist.append(info)
+                recovered.NameToInfo[info.filename] = info
+        archive.flush()
+        os.fsync(archive.fileno())
+    logging.info(f"Recovered {len(members)} members of {path}")
+    return len(members)
+
+
+class ResumeState(NamedTuple):
+    """What a previous run of the same collection completed"""
+    stages: Dict[str, dict]
+    files: Set[str]
+    dumps: List[dict]
+    hashes: List[dict]
+    sampled: List[dict]
+
+
+def read_journal(path: str) -> List[dict]:
+    """Returns the entries of a journal, ignoring a last line torn by the writer being killed"""
+    entries = []
+    with open(path, "r") as journal:
+        for line in journal:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                break
+    return entries
+
+
+def resume(archive_path: str) -> Optional[ResumeState]:
+    """Recovers a capture from a killed run using its journal, returning what it had completed
+
+    :param archive_path: Path to the capture zip
+    :return: The completed work, or None if there's nothing to resume
+    """
+    journal_path = archive_path + JOURNAL_SUFFIX
+    if not os.path.exists(archive_path) or not os.path.exists(journal_path):
+        return None
+    entries = read_journal(journal_path)
+    recover_archive(archive_path, max((entry["End"] for entry in entries), default=0))
+    state = ResumeState({}, set(), [], [], [])
+    for entry in entries:
+        if entry["Type"] == "stage":
+            state.stages[entry["Stage"]] = entry
+        elif entry["Type"] == "file":
+            state.files.add(entry["File"])
+        elif entry["Type"] == "dump":
+            state.dumps.append(entry["Dump"])
+        state.dumps.extend(entry.get("Dumps", []))
+        state.hashes.extend(entry.get("Hashes", []))
+        state.sampled.extend(entry.get("Sampled", []))
+    logging.info(f"Resuming {archive_path}: {len(state.files)} files and {len(state.dumps)} processes already "
+                 f"collected, completed stages: {', '.join(state.stages) or 'none'}")
+    return state
+
+
+class CheckpointJournal:
+    """Appends checkpoints to the journal of a capture
+
+    :param archive_path: Path to the capture zip
+    :param append: Append to an existing journal when resuming, otherwise any existing journal is replaced
+    """
+
+    def __init__(self, archive_path: str, append: bool = False) -> None:
+        self.archive_path = archive_path
+        self.path = archive_path + JOURNAL_SUFFIX
+        self._journal = open(self.path, "a" if append else "w")
+        self._pending: List[dict] = []
+        self._last_sync = time.monotonic()
+
+    def record(self, output_file: zipfile.ZipFile, entry_type: str, **data: Any) -> None:
+        """Records that a member has been completely written to an open archive
+
+        Entries are synced to disk at most every _SYNC_INTERVAL seconds, a killed run redoes what wasn't synced.
+
+        :param output_file: The open archive
+        :param entry_type: "file" or "dump"
+        """
+        self._pending.append({"Type": entry_type, "End": output_file.start_dir, **data})
+        if time.monotonic() - self._last_sync >= _SYNC_INTERVAL:
+            output_file.fp.flush()  # type: ignore
+            os.fsync(output_file.fp.fileno())  # type: ignore
+            self._write_pending()
+
+    def stage(self, stage: str, **data: Any) -> None:
+        """Records that a stage has completed, once the archive it wrote to has been closed
+
+        :param stage: The stage, e.g. "volatile"
+        """
+        with zipfile.ZipFile(self.archive_path, "r") as archive, open(self.archive_path, "rb") as archive_file:
+            os.fsync(archive_file.fileno())
+            self._pending.append({"Type": "stage", "End": archive.start_dir, "Stage": stage, **data})
+        self._write_pending()
+
+    def _write_pending(self) -> None:
+        for entry in self._pending:
+            self._journal.write(json.dumps(entry) + "\n")
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        self._pending.clear()
+        self._last_sync = time.monotonic()
+
+    def close(self) -> None:
+        self._journal.close()
+
+    def remove(self) -> None:
+        """Removes the journal once the capture is complete"""
+        self.close()
+        os.remove(self.path)
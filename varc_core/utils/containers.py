@@ -0,0 +1,180 @@
+"""Helpers for attributing processes and files to containers on Linux hosts
+
+Container runtimes (docker, containerd, cri-o) isolate workloads using cgroups and
+pid/mount namespaces, so processes are grouped on those rather than on anything runtime specific.
+Files are read through /proc/<pid>/root so overlay filesystems are resolved in the container's
+own mount namespace rather than the host's.
+"""
+import logging
+import os
+import os.path
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Set, Tuple
+
+from varc_core.utils.process_records import ProcessRecord
+
+HOST_CONTAINER_ID = "host"
+
+# docker, containerd and cri-o all use 64 hex character container ids in cgroup paths
+# e.g. /kubepods/burstable/pod<uid>/<id> or /system.slice/docker-<id>.scope
+_CONTAINER_ID_RE = re.compile(r"([0-9a-f]{64})")
+
+
+def read_cgroup(pid: int, procfs_root: str = "/proc") -> str:
+    """Returns the cgroup path of a process, preferring the unified (v2) hierarchy
+
+    :param pid: The process id
+    :param procfs_root: Root of the proc filesystem
+    :return: The cgroup path, or an empty string if it can't be read
+    """
+    try:
+        with open(os.path.join(procfs_root, str(pid), "cgroup"), "r") as cgroup_file:
+            lines = cgroup_file.read().splitlines()
+    except (FileNotFoundError, PermissionError, ProcessLookupError):
+        return ""
+    cgroup_paths = [line.split(":", 2)[2] for line in lines if line.count(":") >= 2]
+    # Any hierarchy with a container id in it identifies the container
+    for cgroup_path in cgroup_paths:
+        if _CONTAINER_ID_RE.search(cgroup_path):
+            return cgroup_path
+    for line in lines:
+        if line.startswith("0::"):
+            return line[3:]
+    return cgroup_paths[0] if cgroup_paths else ""
+
+
+def read_namespace(pid: int, namespace: str, procfs_root: str = "/proc") -> str:
+    """Returns the namespace identifier of a process e.g. "pid:[4026531836]"
+
+    :param pid: The process id
+    :param namespace: Namespace type e.g. pid, mnt
+    :param procfs_root: Root of the proc filesystem
+    :return: The namespace identifier, or an empty string if it can't be read
+    """
+    try:
+        return os.readlink(os.path.join(procfs_root, str(pid), "ns", namespace))
+    except (FileNotFoundError, PermissionError, ProcessLookupError):
+        return ""
+
+
+def container_id_from_cgroup(cgroup: str) -> Optional[str]:
+    """Extracts a container id from a cgroup path
+
+    :param cgroup: The cgroup path of a process
+    :return: The container id if the cgroup belongs to a container
+    """
+    id_match = _CONTAINER_ID_RE.findall(cgroup)
+    if id_match:
+        # The innermost id is the container, outer ones may be pods or sandboxes
+        return id_match[-1]
+    return None
+
+
+def get_container_info(pid: int, procfs_root: str = "/proc", host_mnt_ns: Optional[str] = None) -> dict:
+    """Returns which container a process belongs to
+
+    Processes without a container id in their cgroup are attributed to the host, unless they are in
+    a different mount namespace to the host in which case the namespace identifies the container.
+
+    :param pid: The process id
+    :param procfs_root: Root of the proc filesystem
+    :param host_mnt_ns: The mount namespace of the host, read from pid 1 if not provided
+    :return: Dict of container id, cgroup and namespaces
+    """
+    cgroup = read_cgroup(pid, procfs_root)
+    pid_ns = read_namespace(pid, "pid", procfs_root)
+    mnt_ns = read_namespace(pid, "mnt", procfs_root)
+    if host_mnt_ns is None:
+        host_mnt_ns = read_namespace(1, "mnt", procfs_root)
+    container_id = container_id_from_cgroup(cgroup)
+    if not container_id:
+        if mnt_ns and host_mnt_ns and mnt_ns != host_mnt_ns:
+            container_id = re.sub(r"\W+", "", mnt_ns)
+        else:
+            container_id = HOST_CONTAINER_ID
+    return {"Container ID": container_id, "Cgroup": cgroup, "PID Namespace": pid_ns, "Mount Namespace": mnt_ns}
+
+
+def group_by_container(processes: List[ProcessRecord]) -> Dict[str, List[ProcessRecord]]:
+    """Groups process records by the container they belong to
+
+    :param processes: Process records with container info as returned by get_container_info
+    :return: Dict of container id to the processes in it
+    """
+    groups: Dict[str, List[ProcessRecord]] = {}
+    for process in processes:
+        groups.setdefault(process.container_id or HOST_CONTAINER_ID, []).append(process)
+    return groups
+
+
+def container_path(pid: int, path: str, procfs_root: str = "/proc") -> str:
+    """Returns the path to read a file as seen from inside the mount namespace of a process
+
+    :param pid: The process id
+    :param path: The path as reported by the process
+    :return: The path through /proc/<pid>/root
+    """
+    return os.path.join(procfs_root, str(pid), "root", path.lstrip("/"))
+
+
+def resolve_container_files(
+    pid_paths: List[Tuple[int, str]],
+    procfs_root: str = "/proc",
+    in_host: bool = False
+) -> List[Tuple[str, str]]:
+    """Resolves the files used by the processes of one container, removing duplicates
+
+    The same file is usually mapped by many processes in a container, and the same inode can be
+    reached through several paths, so files are de-duplicated on device and inode.
+
+    :param pid_paths: List of (pid, path) tuples as reported by each process
+    :param procfs_root: Root of the proc filesystem
+    :param in_host: If the processes run in the host mount namespace, read paths directly
+    :return: List of (path to read, path as seen by the process) tuples
+    """
+    seen_inodes: Set[Tuple[int, int]] = set()
+    seen_paths: Set[str] = set()
+    resolved: List[Tuple[str, str]] = []
+    for pid, path in pid_paths:
+        if len(path) <= 1 or path in seen_paths:
+            continue
+        seen_paths.add(path)
+        source = path if in_host else container_path(pid, path, procfs_root)
+        try:
+            stat = os.stat(source)
+        except (FileNotFoundError, PermissionError, ProcessLookupError, NotADirectoryError):
+            continue
+        if not stat.st_size:
+            continue
+        inode = (stat.st_dev, stat.st_ino)
+        if inode in seen_inodes:
+            continue
+        seen_inodes.add(inode)
+        resolved.append((source, path))
+    return resolved
+
+
+def resolve_all_container_files(
+    container_pid_paths: Dict[str, List[Tuple[int, str]]],
+    procfs_root: str = "/proc",
+    max_workers: int = 8
+) -> Dict[str, List[Tuple[str, str]]]:
+    """Resolves the files of every container in parallel
+
+    :param container_pid_paths: Dict of container id to (pid, path) tuples
+    :param procfs_root: Root of the proc filesystem
+    :param max_workers: Maximum number of containers to resolve at once
+    :return: Dict of container id to (path to read, path as seen by the process) tuples
+    """
+    container_ids = list(container_pid_paths.keys())
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda container_id: resolve_container_files(
+                container_pid_paths[container_id], procfs_root, container_id == HOST_CONTAINER_ID
+            ),
+            container_ids
+        )
+        resolved = dict(zip(container_ids, results))
+    logging.info(f"Resolved open files for {len(resolved)} containers")
+    return resolved
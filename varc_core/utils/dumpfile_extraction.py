@@ -5,17 +5,30 @@ import os
 import os.path
 import shutil
 from datetime import datetime
+import hashlib
+import itertools
 import logging
-from typing import Union
-from typing import List
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
 import mimetypes
-from tempfile import TemporaryDirectory
 from pathlib import Path
-from os import listdir
-from os.path import isfile, join
 import zipfile
-import magic
 import re
+from typing import Tuple
+
+from varc_core.capture import CaptureReader
+from varc_core.utils.strings_index import STRINGS_INDEX_MEMBER, StringsIndexBuilder
+
+try:
+    import numpy as np
+    _NUMPY_AVAILABLE = True
+except ImportError:
+    _NUMPY_AVAILABLE = False
+
+try:
+    import magic
+    _MAGIC_AVAILABLE = True
+except ImportError:
+    _MAGIC_AVAILABLE = False
 
 
 # Used to extract strings
@@ -23,9 +36,20 @@ ASCII_BYTE = " !\"#\$%&'\(\)\*\+,-\./0123456789:;<=>\?@ABCDEFGHIJKLMNOPQRSTUVWXY
 n = 6
 combined_reg = "(?:[%s]\x00|[%s]){%d,}" % (ASCII_BYTE, ASCII_BYTE, n)
 combined_re = re.compile(combined_reg)
+# Printable ASCII, each optionally followed by the zero byte of a UTF-16 character
+_STRING_RUN = re.compile(rb"(?:[\t\x20-\x7e]\x00?)+")
 # Allow lines with 7+ chars
 good_line = re.compile("[ 0-9a-zA-Z\.:]{7,}")
 
+# Windows of this many bytes are classified as text or binary
+READ_AMOUNT = 10240
+# Windows with at least this many bytes of strings are text
+TEXT_THRESHOLD = 1000
+# Number of windows classified at once, bounding memory used by the vectorized pass
+_WINDOWS_PER_BATCH = 400
+# 10 MB max carved filesize - Increasing this will slow performance
+MAX_FILESIZE = 1024 * 10000
+
 # First files in the list match first
 # Used for file carving
 file_markers = [
@@ -75,6 +99,40 @@ file_markers = [
     "70 6c 69 73 74",
 ]
 
+# Extension of files starting with each of the file_markers, None for markers that aren't file types
+marker_extensions: Dict[str, Optional[str]] = {
+    "7f 45 4c 46 02 01 01": ".elf",
+    "ff d8 ff e0": ".jpg",
+    "37 7a bc af 27": ".7z",
+    "41 56 49 20": ".avi",
+    "42 5A 68": ".bz2",
+    "50 4b 03 04 14": ".docx",
+    "d0 cf 11 e0 a1": ".doc",
+    "89 50 4e 47": ".png",
+    "52 61 72 21": ".rar",
+    "50 4b 30 30": ".zip",
+    "4d 5a 90 00 03": ".exe",
+    "30 32 31 2d": None,
+    "30 32 32 2d": None,
+    "45 6c 66 43 68 6e 6b": ".evt",
+    "2a 2a 00 00": ".evtx",
+    "89 50 4e 47 0d 0a 1a 0a": ".png",
+    "d0 cf 11 e0 a1 b1": ".doc",
+    "21 42 4e a5 6f b5 a6": ".pst",
+    "3c 68 74 6d": ".html",
+    "3c 48 54 4d": ".html",
+    "4c 00 00 00 01 14 02 00 00 00 00 00 c0 00 00 00 00 00 00 46": ".lnk",
+    "70 6c 69 73 74": ".plist",
+}
+# Signatures by first byte, longest first, so only a few are compared against each carved file
+_SIGNATURES: Dict[int, List[Tuple[bytes, str]]] = {}
+for _marker, _extension in sorted(marker_extensions.items(), key=lambda item: -len(item[0])):
+    if _extension:
+        _signature = bytes.fromhex(_marker)
+        _SIGNATURES.setdefault(_signature[0], []).append((_signature, _extension))
+# Bytes found in plain text
+_TEXT_BYTES = bytes(string.printable, "ascii")
+
 
 def combined_strings_text(buf: bytes) -> str:
     """ Get strings worth indexing """
@@ -100,74 +158,224 @@ def combined_strings(buf: bytes) -> int:
     return len(combined_strings_text(buf))
 
 
-def write_file(file_count: int, data_bytes: bytes, output_dir: Path, output_prefix: str, text_mode: bool = False) -> None:
-    """Write bytes to a file as text or binary
+def _window_string_bytes(batch: bytes, window: int) -> List[int]:
+    """Counts the bytes of strings in each window of a batch, as the vectorized pass in classify_windows does"""
+    counts = [0] * -(-len(batch) // window)
+    for match in _STRING_RUN.finditer(batch):
+        start, end = match.span()
+        if end - start < n:
+            continue
+        while start < end:
+            window_end = (start // window + 1) * window
+            counts[start // window] += min(end, window_end) - start
+            start = window_end
+    return counts
+
 
-    :param file_count:
-    :param data_bytes:
-    :param output_dir:
-    :param output_prefix:
-    :param text_mode: 
+def classify_windows(view: memoryview, window: int = READ_AMOUNT) -> Tuple[List[bool], List[int]]:
+    """Classifies each {window} sized window of a dump, in large vectorized passes if NumPy is available
+
+    Strings are runs of at least {n} printable ASCII bytes, counting the zero bytes between UTF-16
+    characters, found a batch of windows at a time. Both passes count them the same way.
+
+    :param view: The dump contents
+    :param window: The window size
+    :return: For each window, whether it is all zeros and how many of its bytes are in strings
+    """
+    empty_windows: List[bool] = []
+    string_lengths: List[int] = []
+    batch_size = window * _WINDOWS_PER_BATCH
+    if not _NUMPY_AVAILABLE:
+        zero_window = bytes(window)
+        for batch_start in range(0, len(view), batch_size):
+            batch_view = view[batch_start:batch_start + batch_size]
+            for offset in range(0, len(batch_view), window):
+                data = batch_view[offset:offset + window]
+                empty_windows.append(data == zero_window[:len(data)])
+            string_lengths += _window_string_bytes(bytes(batch_view), window)
+        return empty_windows, string_lengths
+
+    for batch_start in range(0, len(view), batch_size):
+        batch = np.frombuffer(view[batch_start:batch_start + batch_size], dtype=np.uint8)
+        window_starts = np.arange(0, len(batch), window)
+        empty_windows += (np.maximum.reduceat(batch, window_starts) == 0).tolist()
+
+        # Printable ASCII, plus the zero bytes between UTF-16 characters
+        printable = ((batch >= 0x20) & (batch <= 0x7e)) | (batch == 0x09)
+        printable[1:] |= (batch[1:] == 0) & printable[:-1]
+        # Runs of at least {n} printable bytes are strings
+        edges = np.flatnonzero(np.diff(printable, prepend=False, append=False))
+        run_starts, run_ends = edges[0::2], edges[1::2]
+        long_runs = (run_ends - run_starts) >= n
+        run_starts, run_ends = run_starts[long_runs], run_ends[long_runs]
+        # Bytes of strings before each window boundary, from the runs either side of it
+        boundaries = np.append(window_starts, len(batch))
+        run_lengths_before = np.concatenate(([0], np.cumsum(run_ends - run_starts)))
+        runs_before = np.searchsorted(run_ends, boundaries, side="right")
+        string_bytes = run_lengths_before[runs_before]
+        partial = runs_before < len(run_starts)
+        partial_starts = run_starts[np.minimum(runs_before, max(len(run_starts) - 1, 0))] if len(run_starts) else boundaries
+        string_bytes += np.where(partial, np.maximum(boundaries - partial_starts, 0), 0)
+        string_lengths += np.diff(string_bytes).tolist()
+    return empty_windows, string_lengths
+
+
+def detect_extension(data_bytes: bytes, text_mode: bool = False) -> str:
+    """Returns the file extension for carved data, from its signature
+
+    Data starting with one of the file_markers is identified from marker_extensions, and plain
+    text without needing libmagic, which is only used for anything else.
+
+    :param data_bytes: The carved data
+    :param text_mode: If the data was carved as text
+    :return: The extension, e.g. ".png", or ".log" or ".bin" if unknown
     """
+    if data_bytes:
+        for signature, extension in _SIGNATURES.get(data_bytes[0], ()):
+            if data_bytes.startswith(signature):
+                return extension
+        if not data_bytes[:READ_AMOUNT].translate(None, _TEXT_BYTES):
+            return ".txt"
+    if _MAGIC_AVAILABLE:
+        mime_type = magic.from_buffer(data_bytes, mime=True)
+        if mime_type != "application/octet-stream":
+            guessed = mimetypes.guess_extension(mime_type)
+            if guessed:
+                return guessed
+    return ".log" if text_mode else ".bin"
+
+
+def split_log_entries(text_content: str, years: Tuple[str, ...]) -> List[str]:
+    """Splits text into possible log entries, each starting at one of {years}, in a single pass
+
+    :param text_content: The text
+    :param years: Years that log entries start with, e.g. ("2022", "2021")
+    :return: The text before the first entry, followed by each entry
+    """
+    year_re = re.compile("|".join(re.escape(year) for year in years))
+    starts = [match.start() for match in year_re.finditer(text_content)]
+    return [text_content[start:end] for start, end in zip([0] + starts, starts + [len(text_content)])]
 
-    file_extension = ".bin"
-    if text_mode:
-        file_extension = ".log"
 
-    mime_type = magic.from_buffer(data_bytes, mime=True)
+def carve_outputs(file_count: int, data_bytes: bytes, output_prefix: str, text_mode: bool = False) -> Iterator[Tuple[str, bytes]]:
+    """Yields the files to write for carved bytes, as text or binary
 
-    if mime_type != "application/octet-stream":
-        extension = mimetypes.guess_extension(mime_type)
-        if extension:
-            file_extension = extension
+    Text containing this or last year's date is split into a file for each possible log entry.
 
+    :param file_count: Number of the carved file, used in file names
+    :param data_bytes: The carved data
+    :param output_prefix: Prefix of file names
+    :param text_mode: If the data was carved as text
+    :return: (file name, content) tuples
+    """
+    file_extension = detect_extension(data_bytes, text_mode)
     file_name = output_prefix + str(file_count) + file_extension
-    file_path = os.path.join(output_dir, file_name)
-
-    if text_mode:
-        text_content = combined_strings_text(data_bytes)
-
-        # Sub-split the text/log file if it contains dates
-        # Into a single file for each possible log entry
-        now = datetime.utcnow()
-        current_year = str(now.year)
-        last_year = str(now.year - 1)
-        if current_year in text_content or last_year in text_content:
-            log_parts = []
-            if current_year in text_content:
-                log_parts = text_content.split(current_year)
-            if last_year in text_content:
-                log_parts = text_content.split(last_year)
-
-            # Append delimeter year at the start of each split text
-            file_extension = ".log"
-
-            for split_count, part in enumerate(log_parts):
-                text_part = part
-                if split_count != 0:
-                    text_part = current_year + part
-
-                file_name = (
-                    output_prefix
-                    + str(file_count)
-                    + "_"
-                    + str(split_count)
-                    + file_extension
-                )
-                file_path = os.path.join(output_dir, file_name)
-
-                with open(file_path, "w") as f:
-                    f.write(text_part)
 
+    if not text_mode:
+        yield file_name, data_bytes
+        return
+
+    text_content = combined_strings_text(data_bytes)
+    now = datetime.utcnow()
+    log_parts = split_log_entries(text_content, (str(now.year), str(now.year - 1)))
+    if len(log_parts) > 1:
+        for split_count, part in enumerate(log_parts):
+            if part:
+                yield f"{output_prefix}{file_count}_{split_count}.log", part.encode()
+    else:
         # Text but doesnt contain a date
-        else:
-            with open(file_path, "w") as f:
-                f.write(str(data_bytes))
+        yield file_name, str(data_bytes).encode()
 
-    else:
-        # Cant find a way to stop mypy erroring
-        with open(file_path, "wb") as f:  # type: ignore
-            f.write(data_bytes)  # type: ignore
+
+class DumpCarver:
+    """Splits a dump into text and binary files as it's fed, a batch of windows at a time
+
+    :param write_carved: Called with the contents of each carved file, and whether it was carved as text
+    :param max_filesize: Carved files are split once larger than this
+    """
+
+    def __init__(self, write_carved: Callable[[bytes, bool], None], max_filesize: int = MAX_FILESIZE) -> None:
+        self.write_carved = write_carved
+        self.max_filesize = max_filesize
+        self._text_mode = False
+        self._data_buffer = bytearray()
+        self._run_start: Optional[int] = None
+        self._run = bytearray()
+        self._offset = 0
+
+    def feed(self, batch: bytes) -> List[Tuple[int, bytes]]:
+        """Carves the next part of the dump, which must be whole windows unless it's the last
+
+        :return: (offset, bytes) of each run of consecutive text windows that ended in it
+        """
+        runs = []
+        view = memoryview(batch)
+        empty_windows, string_lengths = classify_windows(view, READ_AMOUNT)
+        for window_number, strings_length in enumerate(string_lengths):
+            data = bytes(view[window_number * READ_AMOUNT:(window_number + 1) * READ_AMOUNT])
+            if strings_length >= TEXT_THRESHOLD:
+                if self._run_start is None:
+                    self._run_start = self._offset
+                self._run += data
+            elif self._run_start is not None:
+                runs.append((self._run_start, bytes(self._run)))
+                self._run_start, self._run = None, bytearray()
+            self._offset += len(data)
+
+            if empty_windows[window_number]:
+                # Skip empty sections
+                continue
+
+            if self._text_mode:
+                # We're now looking at strings
+                if strings_length < TEXT_THRESHOLD or len(self._data_buffer) > self.max_filesize:
+                    split_point = split_buffer(data, True, file_markers)
+                    self._text_mode = False
+                    self._data_buffer += data[:split_point]
+                    self.write_carved(bytes(self._data_buffer), True)
+                    self._data_buffer = bytearray(data[split_point:])
+                    continue
+
+            else:
+                # Now we're looking at binary
+                if strings_length >= TEXT_THRESHOLD or len(self._data_buffer) > self.max_filesize:
+                    split_point = split_buffer(data, False, file_markers)
+                    self._text_mode = True
+                    self.write_carved(bytes(self._data_buffer) + data[:split_point], False)
+                    self._data_buffer = bytearray(data[split_point:])
+                    continue
+
+            self._data_buffer += data
+        return runs
+
+    def finish(self) -> List[Tuple[int, bytes]]:
+        """Carves what's left once the whole dump has been fed
+
+        :return: (offset, bytes) of the run of text windows the dump ended with, if any
+        """
+        runs = []
+        if self._run_start is not None:
+            runs.append((self._run_start, bytes(self._run)))
+            self._run_start, self._run = None, bytearray()
+        if self._data_buffer:
+            self.write_carved(bytes(self._data_buffer), self._text_mode)
+            self._data_buffer = bytearray()
+        return runs
+
+
+def carve_dump(batches: Iterable[bytes], write_carved: Callable[[bytes, bool], None],
+               max_filesize: int) -> Iterator[Tuple[int, bytes]]:
+    """Splits a dump into text and binary files a batch of windows at a time, yielding its text for indexing
+
+    :param batches: The dump contents, in batches of whole windows
+    :param write_carved: Called with the contents of each carved file, and whether it was carved as text
+    :param max_filesize: Carved files are split once larger than this
+    :return: (offset, bytes) of each run of consecutive text windows
+    """
+    carver = DumpCarver(write_carved, max_filesize)
+    for batch in batches:
+        yield from carver.feed(batch)
+    yield from carver.finish()
 
 
 def split_buffer(buffer: bytes, start_text: bool, file_markers: List[str]) -> int:
@@ -214,81 +422,55 @@ def zip_folder(dir_name: str) -> str:
     return shutil.make_archive(dir_name, "zip", dir_name)
 
 
-def extract_dumps(input_archive: Path) -> Union[str, None]:
+def _member_pid(member: str) -> int:
+    """Returns the process id from a dump member name, e.g. 42 from process_dumps/python_42.mem, or 0"""
+    stem = member.split("/")[-1].split("\\")[-1].rsplit(".", 1)[0]
+    pid = stem.rsplit("_", 1)[-1]
+    return int(pid) if pid.isdigit() else 0
+
+
+def extract_dumps(input_archive: Path, dumps: Optional[List[dict]] = None) -> List[dict]:
     """Carve process memory dump for potentially useful embedded files
-    
+
+    Dumps are read from the archive a batch of windows at a time, decompressed or rebuilt from their
+    page table as they're read, so no temporary copy of a dump is made. Only the page store of
+    de-duplicated dumps is decompressed to a temporary file, if it was compressed.
+    Carved files are written straight into the archive as they are carved, and hashed as they are added.
+    The strings in text regions are indexed into STRINGS_INDEX_MEMBER, see strings_index.
+
     :param input_archive: 
+    :param dumps: The dump manifest, for the process id of each dump. If None it's read from the capture index,
+        which a capture being collected doesn't have yet, and the process id is taken from the dump's name instead
+    :return: List of carved file hashes - e.g. [{'File': 'python_1.log', 'Member': '...', 'SHA256': '...'}]
     """
 
     logging.info("Beginning process memory dump carving")
 
-    # 10 MB max filesize - Increasing this will slow performance
-    MAX_FILESIZE = 1024 * 10000
-    # Amount to read each iteration
-    READ_AMOUNT = 10240
-
-    file_count = 0
-    text_mode = False
-    data_buffer = bytes()
-
-    with zipfile.ZipFile(input_archive, "a", zipfile.ZIP_DEFLATED) as dump_archive:
-        for proc_dump in dump_archive.namelist():
-            if proc_dump.startswith("process_dumps") and proc_dump.endswith(".mem"):
-                dump_file_name = proc_dump.split("/")[-1]
-                output_prefix = dump_file_name.split(".")[0]
-                logging.info(f"Carving process dump {dump_file_name}")
-                with dump_archive.open(proc_dump, "r") as dump:
-                    with TemporaryDirectory() as extract_dir:
-                        while True:
-                            data = dump.read(READ_AMOUNT)
-
-                            if bytearray(READ_AMOUNT) == data:
-                                # Skip empty sections
-                                pass
-                            else:
-                                just_split = False
-                                strings_length = combined_strings(data)
-                                # TODO: Remove
-                                split_point = 0
-
-                                if text_mode:
-                                    # We're now looking at strings
-                                    if strings_length < 1000 or len(data_buffer) > MAX_FILESIZE:
-                                        # logging.info("Processed " + str(mb_processed) + " Megabytes")
-                                        # logging.info("Buffer length: " + str(len(data_buffer)))
-                                        split_point = split_buffer(data, True, file_markers)
-                                        text_mode = False
-                                        file_count += 1
-                                        data_buffer += data[:split_point]
-                                        write_file(file_count, data_buffer, Path(extract_dir), output_prefix, True)
-                                        data_buffer = data[split_point:]
-                                        just_split = True
-
-                                else:
-                                    # Now we're looking at binary
-                                    if strings_length >= 1000 or len(data_buffer) > MAX_FILESIZE:
-                                        # logging.info("Processed " + str(mb_processed) + " Megabytes")
-                                        # logging.info("Buffer length: " + str(len(data_buffer)))
-                                        split_point = split_buffer(data, False, file_markers)
-                                        text_mode = True
-                                        file_count += 1
-                                        write_file(file_count, data_buffer + data[:split_point], Path(extract_dir), output_prefix, False)
-                                        data_buffer = data[split_point:]
-                                        just_split = True
-
-                                if not just_split:
-                                    data_buffer += data
-
-                            if len(data) < READ_AMOUNT:
-                                #logging.info("Less than expected data, passing")
-                                write_file(file_count, data_buffer + data[:split_point], Path(extract_dir), output_prefix, text_mode)
-                                break
-
-                        # Write each carved file into dir in zip
-                        carved_files = [file for file in listdir(extract_dir) if isfile(join(extract_dir, file))]
-                        for carved in carved_files:
-                            carved_filepath = join(extract_dir, carved)
-                            dump_archive.write(carved_filepath, f"{proc_dump}_carved/{carved}")
-
-                logging.info("Carving of process dumps complete")
-    return None
\ No newline at end of file
+    carved_hashes: List[dict] = []
+    strings_index = StringsIndexBuilder()
+    with CaptureReader(str(input_archive)) as reader, zipfile.ZipFile(input_archive, "a", zipfile.ZIP_DEFLATED) as dump_archive:
+        dump_pids = {dump["Member"]: dump["Process ID"] for dump in (reader.index["dumps"] if dumps is None else dumps)}
+        for proc_dump in reader.dump_members():
+            dump_file_name = proc_dump.split("/")[-1]
+            output_prefix = dump_file_name.split(".")[0]
+            logging.info(f"Carving process dump {dump_file_name}")
+            file_counter = itertools.count(1)
+
+            def write_carved(data_bytes: bytes, is_text: bool, proc_dump: str = proc_dump, output_prefix: str = output_prefix,
+                             file_counter: Iterator[int] = file_counter) -> None:
+                for carved, content in carve_outputs(next(file_counter), data_bytes, output_prefix, is_text):
+                    carved_member = f"{proc_dump}_carved/{carved}"
+                    dump_archive.writestr(carved_member, content)
+                    carved_hashes.append({"File": carved, "Member": carved_member,
+                                          "SHA256": hashlib.sha256(content).hexdigest(), "Size": len(content)})
+
+            batches = reader.iter_member(proc_dump, READ_AMOUNT * _WINDOWS_PER_BATCH)
+            strings_index.add_dump(proc_dump, dump_pids.get(proc_dump) or _member_pid(proc_dump),
+                                   carve_dump(batches, write_carved, MAX_FILESIZE))
+
+        if len(strings_index):
+            # Stored so it can be memory-mapped for searching
+            dump_archive.writestr(STRINGS_INDEX_MEMBER, strings_index.to_bytes(), compress_type=zipfile.ZIP_STORED)
+            logging.info(f"Indexed {len(strings_index)} distinct strings into {STRINGS_INDEX_MEMBER}")
+        logging.info("Carving of process dumps complete")
+    return carved_hashes
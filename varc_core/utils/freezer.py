@@ -0,0 +1,200 @@
+"""Freeze processes while their memory is copied, for consistent snapshots
+
+A process is frozen with the cgroup v2 freezer if it is the only process in a cgroup that can be
+frozen, so no other process is frozen along with it, otherwise with SIGSTOP. The cgroups of
+slices and of init (init.scope) are never frozen. Only the memory copy happens while frozen, the process is thawed before
+its dump is compressed or de-duplicated.
+
+The capturing process, its ancestors, its process group, processes sharing its stdin, stdout or
+stderr pipes (e.g. the rest of a pipeline it writes to) and any cgroup containing them are never
+frozen, as that could deadlock the capture.
+"""
+import os
+import os.path
+import signal
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterable, Iterator, Optional, Set
+
+FREEZE_CGROUP = "cgroup"
+FREEZE_SIGNAL = "signal"
+
+# Maximum seconds to wait for a process to report being frozen
+_FREEZE_TIMEOUT = 1.0
+_FREEZE_POLL = 0.001
+# Cgroups which hold other processes or are too critical to freeze, even if only the target is in them
+_UNFREEZABLE_SUFFIXES = (".slice", "init.scope")
+
+
+def unified_cgroup(pid: int, procfs_root: str = "/proc") -> str:
+    """Returns the cgroup v2 path of a process, or an empty string if it isn't in one
+
+    :param pid: The process id
+    :param procfs_root: Root of the proc filesystem
+    """
+    try:
+        with open(os.path.join(procfs_root, str(pid), "cgroup"), "r") as cgroup_file:
+            for line in cgroup_file:
+                if line.startswith("0::"):
+                    return line[3:].strip()
+    except (FileNotFoundError, PermissionError, ProcessLookupError):
+        pass
+    return ""
+
+
+def ancestor_pids(pid: int, procfs_root: str = "/proc") -> Set[int]:
+    """Returns the process ids of {pid} and all of its ancestors
+
+    :param pid: The process id
+    :param procfs_root: Root of the proc filesystem
+    """
+    pids = set()
+    while pid > 0 and pid not in pids:
+        pids.add(pid)
+        try:
+            with open(os.path.join(procfs_root, str(pid), "stat"), "r") as stat_file:
+                # The command name can contain spaces and brackets, the fields after it can't
+                pid = int(stat_file.read().rsplit(")", 1)[1].split()[1])
+        except (FileNotFoundError, PermissionError, ProcessLookupError, IndexError, ValueError):
+            break
+    return pids
+
+
+def _pipes(pid: int, procfs_root: str, fds: Optional[Iterable[str]] = None) -> Set[str]:
+    """Returns the pipes e.g. "pipe:[1234]" a process has open"""
+    fd_dir = os.path.join(procfs_root, str(pid), "fd")
+    pipes = set()
+    try:
+        for fd in fds if fds is not None else os.listdir(fd_dir):
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith("pipe:"):
+                pipes.add(target)
+    except OSError:
+        pass
+    return pipes
+
+
+def _process_state(pid: int, procfs_root: str) -> str:
+    try:
+        with open(os.path.join(procfs_root, str(pid), "stat"), "r") as stat_file:
+            return stat_file.read().rsplit(")", 1)[1].split()[0]
+    except (FileNotFoundError, PermissionError, ProcessLookupError, IndexError):
+        return ""
+
+
+def _wait_until(condition: Callable[[], bool]) -> bool:
+    deadline = time.monotonic() + _FREEZE_TIMEOUT
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(_FREEZE_POLL)
+    return True
+
+
+class ProcessFreezer:
+    """Freezes processes, never freezing the capture itself
+
+    :param own_pid: Process id of the capturing process
+    :param procfs_root: Root of the proc filesystem
+    :param cgroup_root: Mount point of the cgroup v2 hierarchy
+    """
+
+    def __init__(self, own_pid: int, procfs_root: str = "/proc", cgroup_root: str = "/sys/fs/cgroup") -> None:
+        self.procfs_root = procfs_root
+        self.cgroup_root = cgroup_root
+        self.protected_pids = ancestor_pids(own_pid, procfs_root)
+        self.protected_pgid = os.getpgid(own_pid)
+        self.protected_pipes = _pipes(own_pid, procfs_root, ("0", "1", "2"))
+        self.protected_cgroups = {unified_cgroup(pid, procfs_root) for pid in self.protected_pids} - {""}
+
+    def _freezable_cgroup(self, pid: int) -> Optional[str]:
+        """Returns the cgroup directory to freeze {pid} with, or None if it shares its cgroup or it can't be frozen"""
+        cgroup = unified_cgroup(pid, self.procfs_root)
+        if not cgroup or cgroup == "/" or cgroup.rstrip("/").endswith(_UNFREEZABLE_SUFFIXES):
+            return None
+        # Freezing a cgroup freezes everything below it too
+        for protected in self.protected_cgroups:
+            if protected == cgroup or protected.startswith(cgroup.rstrip("/") + "/"):
+                return None
+        cgroup_dir = os.path.join(self.cgroup_root, cgroup.lstrip("/"))
+        if not os.access(os.path.join(cgroup_dir, "cgroup.freeze"), os.W_OK) or not self._alone_in_cgroup(cgroup_dir, pid):
+            return None
+        return cgroup_dir
+
+    @staticmethod
+    def _alone_in_cgroup(cgroup_dir: str, pid: int) -> bool:
+        """Returns True if {pid} is the only process in a cgroup, with no processes in the cgroups below it"""
+        try:
+            with open(os.path.join(cgroup_dir, "cgroup.procs"), "r") as procs:
+                if procs.read().split() != [str(pid)]:
+                    return False
+            for child in os.scandir(cgroup_dir):
+                if child.is_dir(follow_symlinks=False):
+                    with open(os.path.join(child.path, "cgroup.events"), "r") as events:
+                        if "populated 0" not in events.read():
+                            return False
+        except OSError:
+            return False
+        return True
+
+    @staticmethod
+    def _cgroup_frozen(cgroup_dir: str) -> bool:
+        try:
+            with open(os.path.join(cgroup_dir, "cgroup.events"), "r") as events:
+                return "frozen 1" in events.read()
+        except OSError:
+            return False
+
+    @staticmethod
+    def _write_freeze(cgroup_dir: str, state: str) -> None:
+        with open(os.path.join(cgroup_dir, "cgroup.freeze"), "w") as freeze:
+            freeze.write(state)
+
+    @contextmanager
+    def frozen(self, pid: int) -> Iterator[Optional[str]]:
+        """Freezes a process until the context exits
+
+        :param pid: The process id
+        :return: How the process was frozen, FREEZE_CGROUP or FREEZE_SIGNAL, or None if it couldn't be
+        """
+        try:
+            protected = pid in self.protected_pids or os.getpgid(pid) == self.protected_pgid
+        except ProcessLookupError:
+            protected = True
+        if protected or (self.protected_pipes and self.protected_pipes & _pipes(pid, self.procfs_root)):
+            yield None
+            return
+
+        cgroup_dir = self._freezable_cgroup(pid)
+        if cgroup_dir:
+            try:
+                self._write_freeze(cgroup_dir, "1")
+            except OSError:
+                cgroup_dir = None
+        if cgroup_dir:
+            frozen_dir = cgroup_dir
+            try:
+                yield FREEZE_CGROUP if _wait_until(lambda: self._cgroup_frozen(frozen_dir)) else None
+            finally:
+                self._write_freeze(frozen_dir, "0")
+            return
+
+        # Leave processes that were already stopped, e.g. by a debugger, stopped afterwards
+        if _process_state(pid, self.procfs_root) in ("T", "t"):
+            yield None
+            return
+        try:
+            os.kill(pid, signal.SIGSTOP)
+        except (ProcessLookupError, PermissionError):
+            yield None
+            return
+        try:
+            yield FREEZE_SIGNAL if _wait_until(lambda: _process_state(pid, self.procfs_root) in ("T", "t")) else None
+        finally:
+            try:
+                os.kill(pid, signal.SIGCONT)
+            except ProcessLookupError:
+                pass
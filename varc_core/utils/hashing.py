@@ -0,0 +1,44 @@
+"""Hash data as it is streamed into the capture, so nothing has to be read twice
+"""
+import hashlib
+from typing import IO, Optional
+
+_READ_CHUNK = 1024 * 1024
+
+
+class HashingReader:
+    """Wraps a binary file object, hashing everything read through it
+
+    :param file_object: The file object to read from
+    """
+
+    def __init__(self, file_object: IO[bytes]) -> None:
+        self._file_object = file_object
+        self._sha256 = hashlib.sha256()
+        self.bytes_read = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._file_object.read(size)
+        self._sha256.update(data)
+        self.bytes_read += len(data)
+        return data
+
+    def hexdigest(self) -> str:
+        """Returns the SHA-256 of everything read so far
+        """
+        return self._sha256.hexdigest()
+
+
+def sha256_file(path: str) -> Optional[str]:
+    """Returns the SHA-256 of a file, or None if it can't be read
+
+    :param path: Path of the file to hash
+    """
+    sha256 = hashlib.sha256()
+    try:
+        with open(path, "rb") as file_in:
+            for chunk in iter(lambda: file_in.read(_READ_CHUNK), b""):
+                sha256.update(chunk)
+    except OSError:
+        return None
+    return sha256.hexdigest()
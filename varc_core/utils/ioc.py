@@ -0,0 +1,61 @@
+"""Match hashes against a local set of indicators of compromise (IOCs)
+
+Hashes are packed into a single sorted bytes buffer (32 bytes per SHA-256) and binary searched,
+so large threat intel lists stay compact in memory and fast to query.
+"""
+import bisect
+import logging
+import re
+from typing import Iterable
+
+_SHA256_LENGTH = 32
+_SHA256_RE = re.compile(r"\b([0-9a-fA-F]{64})\b")
+
+
+class _PackedDigests:
+    """Sequence view of a sorted, packed buffer of digests, for use with bisect"""
+
+    def __init__(self, packed: bytes) -> None:
+        self._packed = packed
+
+    def __len__(self) -> int:
+        return len(self._packed) // _SHA256_LENGTH
+
+    def __getitem__(self, position: int) -> bytes:
+        start = position * _SHA256_LENGTH
+        return self._packed[start:start + _SHA256_LENGTH]
+
+
+class IocIndex:
+    """A sorted, binary searchable set of SHA-256 hashes
+
+    :param hashes: Hex SHA-256 hashes
+    """
+
+    def __init__(self, hashes: Iterable[str]) -> None:
+        digests = sorted({bytes.fromhex(sha256) for sha256 in hashes})
+        self._digests = _PackedDigests(b"".join(digests))
+
+    @classmethod
+    def from_file(cls, ioc_file: str) -> "IocIndex":
+        """Loads every SHA-256 found in a file, e.g. one per line or CSV exports from threat intel feeds
+
+        :param ioc_file: Path to the IOC file
+        """
+        with open(ioc_file, "r", errors="ignore") as ioc_in:
+            index = cls(match.group(1) for line in ioc_in if not line.startswith("#") for match in _SHA256_RE.finditer(line))
+        logging.info(f"Loaded {len(index)} IOC hashes from {ioc_file}")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def __contains__(self, sha256: object) -> bool:
+        if not isinstance(sha256, str):
+            return False
+        try:
+            digest = bytes.fromhex(sha256)
+        except ValueError:
+            return False
+        position = bisect.bisect_left(self._digests, digest)  # type: ignore
+        return position < len(self._digests) and self._digests[position] == digest
@@ -0,0 +1,124 @@
+"""Page level de-duplication of process memory dumps
+
+Forked worker pools (gunicorn, uwsgi, nginx, php-fpm) share most of their pages with their parent,
+so each unique page is stored once in a shared page store and each dump is stored as a page table
+of references into it. reconstruct_dump rebuilds the flat dump on demand, and iter_dump yields it
+page by page without writing it anywhere.
+
+Page table format: header (magic, page size, dump length) followed by one little endian uint32 page
+store index per page of the flat dump, with ZERO_PAGE marking pages that are all zeros.
+"""
+import hashlib
+import mmap
+import struct
+from array import array
+from typing import IO, Dict, Iterator, Sequence
+
+# The host's page size, which pagemap entries are in units of. 16K or 64K on some arm64 and ppc64le kernels
+PAGE_SIZE = mmap.PAGESIZE
+ZERO_PAGE = 0xFFFFFFFF
+PAGE_STORE_MEMBER = "process_dumps/page_store.bin"
+PAGE_TABLE_SUFFIX = ".pages"
+
+_PAGE_TABLE_MAGIC = b"VPT1"
+_PAGE_TABLE_HEADER = struct.Struct("<4sIQ")
+_ZERO_PAGE_BYTES = bytes(PAGE_SIZE)
+_DIGEST_SIZE = 16
+
+
+class PageStore:
+    """Stores each unique page once, returning the index it was stored at
+
+    :param store_file: File the unique pages are appended to
+    """
+
+    def __init__(self, store_file: IO[bytes]) -> None:
+        self._store_file = store_file
+        self._page_indexes: Dict[bytes, int] = {}
+        # Whole regions are often identical across forked workers, so are checked before each page
+        self._region_indexes: Dict[bytes, array] = {}
+        self.total_pages = 0
+
+    @property
+    def unique_pages(self) -> int:
+        return len(self._page_indexes)
+
+    def add(self, data: bytes) -> array:
+        """Adds the pages of {data}, zero padding the last page
+
+        :param data: Memory read from a process
+        :return: The page store index of each page
+        """
+        if len(data) % PAGE_SIZE:
+            data += bytes(PAGE_SIZE - len(data) % PAGE_SIZE)
+        self.total_pages += len(data) // PAGE_SIZE
+        region_digest = hashlib.blake2b(data, digest_size=_DIGEST_SIZE).digest()
+        if region_digest in self._region_indexes:
+            return self._region_indexes[region_digest]
+
+        indexes = array("I")
+        view = memoryview(data)
+        for page_start in range(0, len(data), PAGE_SIZE):
+            page = view[page_start:page_start + PAGE_SIZE]
+            if page == _ZERO_PAGE_BYTES:
+                indexes.append(ZERO_PAGE)
+                continue
+            page_digest = hashlib.blake2b(page, digest_size=_DIGEST_SIZE).digest()
+            page_index = self._page_indexes.get(page_digest)
+            if page_index is None:
+                page_index = len(self._page_indexes)
+                self._page_indexes[page_digest] = page_index
+                self._store_file.write(page)
+            indexes.append(page_index)
+        self._region_indexes[region_digest] = indexes
+        return indexes
+
+
+def page_table(indexes: Sequence[int], dump_length: int) -> bytes:
+    """Returns the page table of a dump
+
+    :param indexes: The page store index of each page in the flat dump
+    :param dump_length: The length of the flat dump
+    """
+    table = array("I", indexes)
+    if table.itemsize != 4:
+        raise ValueError("Page table entries must be 32 bit")
+    return _PAGE_TABLE_HEADER.pack(_PAGE_TABLE_MAGIC, PAGE_SIZE, dump_length) + table.tobytes()
+
+
+def iter_dump(table_bytes: bytes, page_store: memoryview) -> Iterator[memoryview]:
+    """Yields the pages of the flat dump described by a page table, the last one cut to the dump length
+
+    :param table_bytes: The page table
+    :param page_store: The shared page store
+    """
+    magic, page_size, dump_length = _PAGE_TABLE_HEADER.unpack_from(table_bytes)
+    if magic != _PAGE_TABLE_MAGIC:
+        raise ValueError("Not a varc page table")
+    indexes = array("I")
+    indexes.frombytes(table_bytes[_PAGE_TABLE_HEADER.size:])
+    zero_page = memoryview(bytes(page_size))
+    position = 0
+    for page_index in indexes:
+        length = min(page_size, dump_length - position)
+        if page_index == ZERO_PAGE:
+            yield zero_page[:length]
+        else:
+            page_start = page_index * page_size
+            yield page_store[page_start:page_start + length]
+        position += length
+
+
+def reconstruct_dump(table_bytes: bytes, page_store: memoryview, output: IO[bytes]) -> int:
+    """Writes the flat dump described by a page table
+
+    :param table_bytes: The page table
+    :param page_store: The shared page store
+    :param output: File to write the flat dump to
+    :return: The length of the flat dump
+    """
+    written = 0
+    for page in iter_dump(table_bytes, page_store):
+        output.write(page)
+        written += len(page)
+    return written
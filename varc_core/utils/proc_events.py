@@ -0,0 +1,282 @@
+"""Record process fork, exec and exit events for the duration of a collection
+
+Process and network snapshots are taken once, so a process that starts and exits during a long
+collection - a dropper, a reverse shell - would otherwise never be seen. Events are read from the
+kernel proc connector, a netlink multicast of every fork, exec and exit, which costs nothing while
+the system is idle. The proc connector needs root, so without it /proc is polled for new and exited
+process ids instead, which can miss processes living less than the poll interval.
+
+Each process is described - name, executable, command line, parent and connections - as soon as
+it execs (or is first seen when polling) on a separate thread, so reading events never waits on
+/proc. Processes that fork or exec are queued in started, for the memory dump to pick up.
+"""
+import abc
+import logging
+import os
+import os.path
+import queue
+import select
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+import psutil
+
+EVENT_FORK = "fork"
+EVENT_EXEC = "exec"
+EVENT_EXIT = "exit"
+# A process first seen when polling, which may have been forked or exec'd
+EVENT_START = "start"
+
+_NETLINK_CONNECTOR = 11
+_CN_IDX_PROC = 1
+_CN_VAL_PROC = 1
+_PROC_CN_MCAST_LISTEN = 1
+_PROC_CN_MCAST_IGNORE = 2
+_NLMSG_DONE = 3
+_PROC_EVENT_FORK = 0x00000001
+_PROC_EVENT_EXEC = 0x00000002
+_PROC_EVENT_EXIT = 0x80000000
+_NLMSG_HEADER = struct.Struct("=IHHII")
+_CN_MSG = struct.Struct("=IIIIHH")
+_PROC_EVENT_HEADER = struct.Struct("=IIQ")
+_FORK_EVENT = struct.Struct("=IIII")
+_EXEC_EVENT = struct.Struct("=II")
+_EXIT_EVENT = struct.Struct("=IIII")
+# Room for bursts of events, e.g. a fork bomb, while the reader is busy
+_RECEIVE_BUFFER = 4 * 1024 * 1024
+# Seconds between checks for being stopped
+_STOP_CHECK = 0.2
+_POLL_INTERVAL = 0.1
+
+
+class ProcessEvent(NamedTuple):
+    time: float
+    event: str
+    pid: int
+    ppid: int = 0
+    exit_code: Optional[int] = None
+
+
+def _exit_code(status: int) -> int:
+    """Returns the exit code from a wait status, or minus the signal that killed the process"""
+    return -(status & 0x7F) if status & 0x7F else (status >> 8) & 0xFF
+
+
+def parse_events(data: bytes, received: float) -> Iterator[ProcessEvent]:
+    """Yields the process events in a datagram from the proc connector, ignoring threads
+
+    :param data: The datagram
+    :param received: When it was received, as the kernel timestamps events from boot
+    """
+    position = 0
+    while position + _NLMSG_HEADER.size <= len(data):
+        message_length = _NLMSG_HEADER.unpack_from(data, position)[0]
+        if message_length < _NLMSG_HEADER.size:
+            return
+        event_position = position + _NLMSG_HEADER.size + _CN_MSG.size
+        if event_position + _PROC_EVENT_HEADER.size <= len(data):
+            what = _PROC_EVENT_HEADER.unpack_from(data, event_position)[0]
+            event_data = event_position + _PROC_EVENT_HEADER.size
+            if what == _PROC_EVENT_FORK:
+                parent_pid, parent_tgid, child_pid, child_tgid = _FORK_EVENT.unpack_from(data, event_data)
+                if child_pid == child_tgid:
+                    yield ProcessEvent(received, EVENT_FORK, child_tgid, parent_tgid)
+            elif what == _PROC_EVENT_EXEC:
+                pid, tgid = _EXEC_EVENT.unpack_from(data, event_data)
+                yield ProcessEvent(received, EVENT_EXEC, tgid)
+            elif what == _PROC_EVENT_EXIT:
+                pid, tgid, status, _ = _EXIT_EVENT.unpack_from(data, event_data)
+                if pid == tgid:
+                    yield ProcessEvent(received, EVENT_EXIT, tgid, exit_code=_exit_code(status))
+        position += (message_length + 3) & ~3
+
+
+def _parent_of(pid: int, procfs_root: str) -> int:
+    try:
+        with open(os.path.join(procfs_root, str(pid), "stat"), "r") as stat_file:
+            # The command name can contain spaces and brackets, the fields after it can't
+            return int(stat_file.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def describe_process(pid: int, procfs_root: str = "/proc") -> dict:
+    """Describes a process from /proc, leaving out anything that can't be read, e.g. if it has exited
+
+    :param pid: The process id
+    :param procfs_root: Root of the proc filesystem
+    :return: The description - e.g. {'Name': 'sh', 'Executable Path': '/bin/sh', 'Command': 'sh -i', 'Parent ID': 1, 'Connections': '...'}
+    """
+    process_dir = os.path.join(procfs_root, str(pid))
+    description: dict = {}
+    try:
+        with open(os.path.join(process_dir, "comm"), "r") as comm_file:
+            description["Name"] = comm_file.read().rstrip("\n")
+        description["Executable Path"] = os.readlink(os.path.join(process_dir, "exe"))
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(process_dir, "cmdline"), "rb") as cmdline_file:
+            description["Command"] = cmdline_file.read().rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        pass
+    description["Parent ID"] = _parent_of(pid, procfs_root)
+    try:
+        # Sockets inherited over exec, e.g. by a reverse shell, are already open
+        description["Connections"] = "\r\n".join(
+            f"{conn.laddr.ip} {conn.laddr.port} {conn.raddr.ip} {conn.raddr.port}"
+            for conn in psutil.Process(pid).connections(kind="inet") if conn.laddr and conn.raddr)
+    except psutil.Error:
+        pass
+    return description
+
+
+class ProcessMonitor(abc.ABC):
+    """Records process events on a background thread until stopped
+
+    :param procfs_root: Root of the proc filesystem
+    """
+    source = ""
+
+    def __init__(self, procfs_root: str = "/proc") -> None:
+        self.procfs_root = procfs_root
+        self.events: List[ProcessEvent] = []
+        # Processes that forked or exec'd, in order, for the memory dump
+        self.started: "queue.Queue[int]" = queue.Queue()
+        self.lost = 0
+        self._descriptions: Dict[int, Future] = {}
+        self._describer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="varc_describe")
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"varc_{self.source}", daemon=True)
+
+    def start(self) -> "ProcessMonitor":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops recording, once any processes being described have been"""
+        if self._stopped.is_set():
+            return
+        self._stopped.set()
+        self._thread.join()
+        self._describer.shutdown()
+        logging.info(f"Recorded {len(self.events)} process events from {self.source}"
+                     + (f", {self.lost} bursts of events were lost" if self.lost else ""))
+
+    @abc.abstractmethod
+    def _run(self) -> None:
+        """Reads events, recording each, until stopped"""
+
+    def _record(self, event: ProcessEvent) -> None:
+        if event.event != EVENT_EXIT:
+            self.started.put(event.pid)
+        if event.event in (EVENT_EXEC, EVENT_START):
+            self._descriptions[len(self.events)] = self._describer.submit(describe_process, event.pid, self.procfs_root)
+        self.events.append(event)
+
+    def rows(self) -> List[dict]:
+        """Returns the events as rows for the process events table, call once stopped"""
+        rows = []
+        for number, event in enumerate(self.events):
+            row = {"Time": datetime.utcfromtimestamp(event.time).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                   "Event": event.event, "Process ID": event.pid, "Parent ID": event.ppid}
+            if number in self._descriptions:
+                row.update({key: value for key, value in self._descriptions[number].result().items()
+                            if value or key not in row})
+            if event.exit_code is not None:
+                row["Exit Code"] = event.exit_code
+            rows.append(row)
+        return rows
+
+
+class ProcConnectorMonitor(ProcessMonitor):
+    """Records process events multicast by the kernel proc connector
+
+    :raises OSError: If the proc connector can't be subscribed to, e.g. without root
+    """
+    source = "proc connector"
+
+    def __init__(self, procfs_root: str = "/proc") -> None:
+        super().__init__(procfs_root)
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM, _NETLINK_CONNECTOR)
+        try:
+            self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, _RECEIVE_BUFFER)
+            self._socket.bind((0, _CN_IDX_PROC))
+            self._subscribe(_PROC_CN_MCAST_LISTEN)
+        except OSError:
+            self._socket.close()
+            raise
+
+    def _subscribe(self, operation: int) -> None:
+        message = _CN_MSG.pack(_CN_IDX_PROC, _CN_VAL_PROC, 0, 0, 4, 0) + struct.pack("=I", operation)
+        self._socket.send(_NLMSG_HEADER.pack(_NLMSG_HEADER.size + len(message), _NLMSG_DONE, 0, 0, os.getpid())
+                          + message)
+
+    def _run(self) -> None:
+        try:
+            while not self._stopped.is_set():
+                if not select.select([self._socket], [], [], _STOP_CHECK)[0]:
+                    continue
+                try:
+                    data = self._socket.recv(65536)
+                except OSError as oserror:
+                    # ENOBUFS when events arrived faster than they were read, the rest are still received
+                    logging.warning(f"Process events were lost. Error was {oserror}.")
+                    self.lost += 1
+                    continue
+                for event in parse_events(data, time.time()):
+                    self._record(event)
+        finally:
+            try:
+                self._subscribe(_PROC_CN_MCAST_IGNORE)
+            except OSError:
+                pass
+            self._socket.close()
+
+
+class ProcPollMonitor(ProcessMonitor):
+    """Records processes starting and exiting by polling the process ids in /proc
+
+    :param procfs_root: Root of the proc filesystem
+    :param interval: Seconds between polls
+    """
+    source = "proc polling"
+
+    def __init__(self, procfs_root: str = "/proc", interval: float = _POLL_INTERVAL) -> None:
+        super().__init__(procfs_root)
+        self.interval = interval
+
+    def _pids(self) -> set:
+        return {int(name) for name in os.listdir(self.procfs_root) if name.isdigit()}
+
+    def _run(self) -> None:
+        known = self._pids()
+        while not self._stopped.wait(self.interval):
+            current = self._pids()
+            now = time.time()
+            for pid in sorted(current - known):
+                self._record(ProcessEvent(now, EVENT_START, pid, _parent_of(pid, self.procfs_root)))
+            for pid in sorted(known - current):
+                self._record(ProcessEvent(now, EVENT_EXIT, pid))
+            known = current
+
+
+def start_monitor(procfs_root: str = "/proc") -> ProcessMonitor:
+    """Starts recording process events, from the proc connector if possible, otherwise by polling /proc
+
+    :param procfs_root: Root of the proc filesystem, which is polled if it isn't /proc
+    """
+    monitor: ProcessMonitor
+    try:
+        if procfs_root != "/proc":
+            raise OSError(f"{procfs_root} is not the host's /proc")
+        monitor = ProcConnectorMonitor(procfs_root)
+    except OSError as oserror:
+        logging.info(f"Proc connector is unavailable ({oserror}), polling {procfs_root} for process events instead")
+        monitor = ProcPollMonitor(procfs_root)
+    return monitor.start()
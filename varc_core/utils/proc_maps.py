@@ -0,0 +1,63 @@
+"""Parser for /proc/<pid>/maps
+
+The whole file is read at once and parsed with a single compiled bytes regex, keeping every field
+of each mapping. Permissions, devices and paths repeat across mappings, so each distinct value is
+decoded once and shared between records.
+
+The procfs root can be pointed at a synthetic tree for testing and benchmarking.
+"""
+import os
+import os.path
+import re
+from typing import Dict, List, NamedTuple
+
+# start-end perms offset dev inode [path]
+_MAPS_RE = re.compile(rb"^([0-9a-f]+)-([0-9a-f]+) (\S+) ([0-9a-f]+) (\S+) (\d+) *(.*)$", re.MULTILINE)
+
+
+class MemoryRegion(NamedTuple):
+    start: int
+    end: int
+    perms: str
+    offset: int
+    device: str
+    inode: int
+    path: str
+
+    @property
+    def readable(self) -> bool:
+        return self.perms.startswith("r")
+
+    @property
+    def file_backed(self) -> bool:
+        """If the region maps a file, rather than anonymous memory or a pseudo path like [heap]"""
+        return self.inode != 0 and self.path.startswith("/")
+
+
+def parse_maps(pid: int, procfs_root: str = "/proc") -> List[MemoryRegion]:
+    """Returns every mapped region of a process
+
+    :param pid: The process id
+    :param procfs_root: Root of the proc filesystem
+    :raises OSError: If the maps file can't be read, e.g. FileNotFoundError if the process has exited
+    :return: List of regions in address order
+    """
+    with open(os.path.join(procfs_root, str(pid), "maps"), "rb") as maps_file:
+        content = maps_file.read()
+    decoded: Dict[bytes, str] = {}
+    regions = []
+    for start, end, perms, offset, device, inode, path in _MAPS_RE.findall(content):
+        for value in (perms, device, path):
+            if value not in decoded:
+                decoded[value] = os.fsdecode(value)
+        regions.append(MemoryRegion(int(start, 16), int(end, 16), decoded[perms], int(offset, 16), decoded[device],
+                                    int(inode), decoded[path]))
+    return regions
+
+
+def mapped_files(regions: List[MemoryRegion]) -> List[str]:
+    """Returns the paths of the files mapped by a process, without duplicates
+
+    :param regions: The regions of the process as returned by parse_maps
+    """
+    return list(dict.fromkeys(region.path for region in regions if region.file_backed))
@@ -0,0 +1,114 @@
+"""Compact process records, held for the whole run while memory is dumped
+
+psutil's as_dict returns every attribute of a process, including a namedtuple per memory map,
+its environment and threads. Only the attributes varc uses are collected, names are interned and
+the paths of open and mapped files are stored once per snapshot in a PathTable, with each record
+holding packed arrays of indexes into it. Rows for the processes table are built at serialization.
+"""
+import sys
+from array import array
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Attributes requested from psutil, anything else is never collected
+PROCESS_ATTRS = ["pid", "ppid", "name", "username", "status", "exe", "cmdline", "create_time", "open_files",
+                 "connections", "memory_maps"]
+
+
+def _intern(value: Optional[str]) -> str:
+    return sys.intern(value) if value else ""
+
+
+class PathTable:
+    """Stores each distinct path once, so records can refer to paths by index"""
+
+    __slots__ = ("_paths", "_indexes")
+
+    def __init__(self) -> None:
+        self._paths: List[str] = []
+        self._indexes: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def __getitem__(self, index: int) -> str:
+        return self._paths[index]
+
+    def add_all(self, paths: Iterable[str]) -> array:
+        """Adds paths to the table, keeping their order and removing duplicates
+
+        :param paths: The paths to add
+        :return: Packed array of the index of each distinct path
+        """
+        indexes = array("I")
+        seen = set()
+        for path in paths:
+            index = self._indexes.get(path)
+            if index is None:
+                index = len(self._paths)
+                self._indexes[path] = index
+                self._paths.append(_intern(path))
+            if index not in seen:
+                seen.add(index)
+                indexes.append(index)
+        return indexes
+
+
+class ProcessRecord:
+    """One process from the process snapshot
+
+    :param proc_dict: The process as returned by psutil's as_dict(attrs=PROCESS_ATTRS)
+    :param paths: The path table shared by the snapshot
+    :param mapped_files: Paths of the files the process maps, read from psutil's memory_maps if not given
+    """
+
+    __slots__ = ("pid", "ppid", "name", "username", "status", "exe", "cmdline", "create_time", "connections",
+                 "connection_count", "container", "_open_files", "_mapped_files", "_paths")
+
+    def __init__(self, proc_dict: dict, paths: PathTable, mapped_files: Optional[List[str]] = None) -> None:
+        self.pid: int = proc_dict["pid"]
+        self.ppid: int = proc_dict["ppid"] or 0
+        self.name = _intern(proc_dict["name"])
+        self.username = _intern(proc_dict["username"])
+        self.status = _intern(proc_dict["status"])
+        self.exe = _intern(proc_dict["exe"])
+        cmdline = proc_dict["cmdline"]
+        # Windows returns a string, Linux and OSX a list
+        self.cmdline: str = " ".join(cmdline) if isinstance(cmdline, list) else (cmdline or "")
+        self.create_time: float = proc_dict["create_time"] or 0.0
+        connections = proc_dict["connections"] or []
+        self.connection_count = len(connections)
+        self.connections: Tuple[str, ...] = tuple(
+            f"{conn.laddr.ip} {conn.laddr.port} {conn.raddr.ip} {conn.raddr.port}"
+            for conn in connections if conn.laddr and conn.raddr
+        )
+        self.container: Optional[dict] = None
+        self._paths = paths
+        self._open_files = paths.add_all(open_file.path for open_file in proc_dict["open_files"] or [])
+        if mapped_files is None:
+            mapped_files = [mapped.path for mapped in proc_dict.get("memory_maps") or []]
+        self._mapped_files = paths.add_all(mapped_files)
+
+    @property
+    def open_files(self) -> List[str]:
+        return [self._paths[index] for index in self._open_files]
+
+    @property
+    def mapped_files(self) -> List[str]:
+        return [self._paths[index] for index in self._mapped_files]
+
+    @property
+    def container_id(self) -> Optional[str]:
+        return self.container["Container ID"] if self.container else None
+
+    def to_row(self, connection_time: float) -> dict:
+        """Returns the row for the processes table
+
+        :param connection_time: Timestamp to record connections at
+        """
+        return {"Process ID": self.pid, "Name": self.name, "Username": self.username, "Status": self.status,
+                "Executable Path": self.exe, "Command": self.cmdline, "Parent ID": self.ppid,
+                "Creation Time": datetime.utcfromtimestamp(self.create_time).strftime('%Y-%m-%d %H:%M:%S'),
+                "Open Files": " ".join(self.open_files),
+                "Connections": "\r\n".join(f"{connection_time} {connection}" for connection in self.connections),
+                "Mapped Filepaths": ",".join(self.mapped_files)}
@@ -0,0 +1,166 @@
+"""Sample open files too large to collect whole
+
+Large logs, databases and binaries are often the most important evidence, so instead of being
+skipped they are sampled - the head, the tail and optionally a block at every stride in between.
+A policy can also hash the whole file in the same pass, so IOC matching still works on the full
+file, at the cost of reading all of it. Neither the default policy nor SampledReader hash by default.
+
+Policies are matched against the path of the file in order, the first matching glob wins:
+
+    [{"glob": "*.sqlite", "max_size": 1073741824},
+     {"glob": "/var/log/*", "head": 1048576, "tail": 67108864, "hash": true},
+     {"glob": "*", "head": 4194304, "tail": 4194304, "stride": 104857600, "stride_size": 65536}]
+
+Zip members need a CRC32 of their content and sampled files a SHA-256 of everything, so every
+byte has to pass through Python anyway and kernel zero-copy transfers can't be used. The file is
+read into a single reused buffer instead, so no memory is allocated per chunk.
+"""
+import hashlib
+import json
+from fnmatch import fnmatch
+from typing import IO, Iterator, List, NamedTuple, Optional, Tuple
+
+_MiB = 1024 * 1024
+_READ_CHUNK = 1 * _MiB
+
+
+class SamplePolicy(NamedTuple):
+    """How to collect files whose path matches {glob}
+
+    :param glob: fnmatch pattern of the paths the policy applies to
+    :param max_size: Files up to this size are collected whole, larger files are sampled
+    :param head: Bytes to collect from the start of the file
+    :param tail: Bytes to collect from the end of the file
+    :param stride: Collect a block every {stride} bytes between the head and tail, 0 for none
+    :param stride_size: Bytes in each stride block
+    :param hash: Hash the whole file while sampling, reading all of it. By default only the samples are read
+    """
+    glob: str = "*"
+    max_size: int = 10000000
+    head: int = 4 * _MiB
+    tail: int = 4 * _MiB
+    stride: int = 0
+    stride_size: int = 64 * 1024
+    hash: bool = False
+
+
+# Samples the head and tail of every file over 10MB, reading nothing else of it
+DEFAULT_POLICIES = [SamplePolicy()]
+
+
+def load_policies(policy_file: str) -> List[SamplePolicy]:
+    """Loads sampling policies from a JSON list of objects with SamplePolicy fields
+
+    :param policy_file: Path to the JSON file
+    :raises ValueError: If a policy has unknown or invalid fields
+    """
+    with open(policy_file, "r") as policy_in:
+        policies = [SamplePolicy(**policy) for policy in json.load(policy_in)]
+    for policy in policies:
+        if min(policy.max_size, policy.head, policy.tail, policy.stride, policy.stride_size) < 0:
+            raise ValueError(f"Sampling policy sizes must not be negative: {policy}")
+    return policies
+
+
+def policy_for(path: str, policies: List[SamplePolicy]) -> Optional[SamplePolicy]:
+    """Returns the first policy whose glob matches {path}, or None if none match"""
+    for policy in policies:
+        if fnmatch(path, policy.glob):
+            return policy
+    return None
+
+
+def sample_ranges(size: int, policy: SamplePolicy) -> List[Tuple[int, int]]:
+    """Returns the (offset, length) ranges to collect from a file of {size} bytes, sorted and not overlapping
+
+    :param size: Size of the file
+    :param policy: The policy for the file
+    """
+    ranges = [(0, min(policy.head, size))]
+    tail_start = max(size - policy.tail, 0)
+    if policy.stride and policy.stride_size:
+        ranges += [(offset, min(policy.stride_size, size - offset))
+                   for offset in range(policy.stride, tail_start, policy.stride)]
+    ranges.append((tail_start, size - tail_start))
+    merged: List[Tuple[int, int]] = []
+    for offset, length in ranges:
+        if not length:
+            continue
+        if merged and offset <= merged[-1][0] + merged[-1][1]:
+            last_offset, last_length = merged[-1]
+            merged[-1] = (last_offset, max(last_length, offset + length - last_offset))
+        else:
+            merged.append((offset, length))
+    return merged
+
+
+class SampledReader:
+    """Reads the sampled ranges of a file as one stream, optionally hashing the whole file in the same pass
+
+    :param file_object: The file, opened in binary mode
+    :param size: Size of the file, anything appended after this isn't read
+    :param ranges: The ranges to read, from sample_ranges
+    :param hash_all: Hash the whole file, reading all of it. Off by default like SamplePolicy.hash, so only the
+        sampled ranges are read from disk
+    """
+
+    def __init__(self, file_object: IO[bytes], size: int, ranges: List[Tuple[int, int]], hash_all: bool = False) -> None:
+        self._file_object = file_object
+        self._size = size
+        self._ranges = ranges
+        self._hash_all = hash_all
+        self._sha256 = hashlib.sha256() if hash_all else None
+        self._samples = self._iter_samples()
+        self._pending = b""
+        self.bytes_read = 0
+        self.bytes_sampled = 0
+
+    def _iter_samples(self) -> Iterator[memoryview]:
+        """Yields views of the sampled parts of each chunk, only valid until the next is yielded"""
+        view = memoryview(bytearray(_READ_CHUNK))
+        position = 0
+        range_index = 0
+        while range_index < len(self._ranges) or (self._hash_all and position < self._size):
+            read_end = self._size
+            if not self._hash_all:
+                offset, length = self._ranges[range_index]
+                if position < offset:
+                    position = self._file_object.seek(offset)
+                read_end = offset + length
+            read = self._file_object.readinto(view[:min(_READ_CHUNK, read_end - position)])  # type: ignore
+            if not read:
+                # Truncated since it was sized
+                return
+            chunk = view[:read]
+            if self._sha256:
+                self._sha256.update(chunk)
+            self.bytes_read += read
+            chunk_start, position = position, position + read
+            while range_index < len(self._ranges):
+                offset, length = self._ranges[range_index]
+                start, end = max(offset, chunk_start), min(offset + length, position)
+                if start < end:
+                    yield chunk[start - chunk_start:end - chunk_start]
+                if offset + length > position:
+                    break
+                range_index += 1
+
+    def read(self, size: int = -1) -> bytes:
+        """Returns up to {size} bytes of the samples, or all of them if negative, and b"" at the end"""
+        out = bytearray(self._pending)
+        while size < 0 or len(out) < size:
+            sample = next(self._samples, None)
+            if sample is None:
+                break
+            out += sample
+        if 0 <= size < len(out):
+            self._pending = bytes(out[size:])
+            del out[size:]
+        else:
+            self._pending = b""
+        self.bytes_sampled += len(out)
+        return bytes(out)
+
+    def hexdigest(self) -> Optional[str]:
+        """Returns the SHA-256 of the whole file once it's all been read, or None if it wasn't hashed"""
+        return self._sha256.hexdigest() if self._sha256 else None
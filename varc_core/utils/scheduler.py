@@ -0,0 +1,89 @@
+"""Runs collectors concurrently, respecting the dependencies between them
+
+Collectors are bound by different resources - the process snapshot and netstat by /proc, the
+screenshot by PNG encoding, YARA by CPU and open file copying by disk - so independent collectors
+run at the same time and total wall time approaches the longest chain of dependencies rather than
+the sum of every collector.
+"""
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Iterator, Tuple
+
+
+class CollectorScheduler:
+    """Registry of collectors and the collectors they depend on
+
+    Collectors that are ready at the same time are started in the order they were registered, so
+    registering the most volatile data first keeps the order of volatility.
+
+    :param max_workers: Maximum number of collectors to run at once
+    """
+
+    def __init__(self, max_workers: int = 4) -> None:
+        self.max_workers = max_workers
+        self._collectors: Dict[str, Tuple[Callable[[], Any], Tuple[str, ...]]] = {}
+        self.durations: Dict[str, float] = {}
+
+    def register(self, name: str, collect: Callable[[], Any], depends: Iterable[str] = ()) -> None:
+        """Registers a collector
+
+        :param name: Unique name of the collector
+        :param collect: Called with no arguments to run the collector
+        :param depends: Names of the collectors that must finish first, which must already be registered
+        """
+        depends = tuple(depends)
+        if name in self._collectors:
+            raise ValueError(f"Collector {name} is already registered")
+        unknown = [dependency for dependency in depends if dependency not in self._collectors]
+        if unknown:
+            raise ValueError(f"Collector {name} depends on unregistered collectors: {', '.join(unknown)}")
+        self._collectors[name] = (collect, depends)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._collectors
+
+    def _timed(self, name: str, collect: Callable[[], Any]) -> Any:
+        started = time.monotonic()
+        try:
+            return collect()
+        finally:
+            self.durations[name] = time.monotonic() - started
+
+    def run(self) -> Dict[str, Any]:
+        """Runs every collector, each as soon as its dependencies have finished
+
+        If a collector raises, collectors that depend on it aren't started and the exception is
+        raised once running collectors have finished.
+
+        :return: Dict of collector name to what it returned
+        """
+        return dict(self.iter_run())
+
+    def iter_run(self) -> Iterator[Tuple[str, Any]]:
+        """Runs every collector like run, yielding each as soon as it finishes
+
+        No more collectors are started while the consumer holds on to one, though those already
+        running carry on.
+
+        :return: Iterator of collector name and what it returned, in the order they finished
+        """
+        started = time.monotonic()
+        finished = set()
+        pending = dict(self._collectors)
+        running: Dict[Future, str] = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="varc_collector") as executor:
+            while pending or running:
+                for name, (collect, depends) in list(pending.items()):
+                    if all(dependency in finished for dependency in depends):
+                        del pending[name]
+                        running[executor.submit(self._timed, name, collect)] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    result = future.result()
+                    finished.add(name)
+                    yield name, result
+        total = time.monotonic() - started
+        timings = ", ".join(f"{name} {duration:.2f}s" for name, duration in self.durations.items())
+        logging.info(f"Collectors finished in {total:.2f}s ({timings})")
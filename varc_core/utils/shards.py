@@ -0,0 +1,175 @@
+"""Sharded captures, for uploading and analysing a large capture in parallel
+
+With a shard size set, process dumps are written across size bounded zips next to the capture,
+capture.001.zip, capture.002.zip and so on, while the tables, open files and capture index stay in
+capture.zip. Each shard is a complete zip with its own capture_index.json for the dumps in it, so
+shards can be carved or read on separate machines. capture.manifest.json lists the shards and the
+dumps in each, and the dump manifest in capture.zip records the shard of each dump.
+
+Dumps are compressed into different shards by parallel writers. Each dump goes to the fullest
+shard not being written to that it fits in, or a new shard if there isn't one. A dump larger than
+the shard size gets a shard to itself. Dumps waiting to be written are temporary files, so the bytes
+of those queued are bounded, by twice the shard size unless set, rather than their number.
+"""
+import json
+import logging
+import os
+import os.path
+import shutil
+import threading
+import time
+import zipfile
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import IO, Dict, List, Optional
+
+from varc_core.capture import CAPTURE_INDEX_MEMBER, MANIFEST_SUFFIX, build_index
+
+_COPY_CHUNK = 1024 * 1024
+
+
+def shard_path(output_path: str, number: int) -> str:
+    """Returns the path of shard {number} of the capture at {output_path}, e.g. capture.001.zip"""
+    stem, extension = os.path.splitext(output_path)
+    return f"{stem}.{number:03d}{extension}"
+
+
+def manifest_path(output_path: str) -> str:
+    """Returns the path of the shard manifest of the capture at {output_path}, e.g. capture.manifest.json"""
+    return os.path.splitext(output_path)[0] + MANIFEST_SUFFIX
+
+
+class _Shard:
+
+    def __init__(self, path: str, compression: int) -> None:
+        self.path = path
+        self.name = os.path.basename(path)
+        self.zip_file = zipfile.ZipFile(path, "w", compression=compression)
+        self.size = 0
+        self.busy = False
+        self.dumps: List[dict] = []
+
+
+class ShardWriter:
+    """Writes process dumps across size bounded shards of a capture, compressing into several shards at once
+
+    :param output_path: Path to the capture zip, shards are written next to it
+    :param shard_size: Maximum size of each shard in bytes, unless a single dump is larger
+    :param workers: Number of dumps to compress at once
+    :param compression: Default compression for the shards
+    :param max_pending: Maximum bytes of dumps queued or being written, twice {shard_size} if None. A dump larger than this is queued alone
+    """
+
+    def __init__(self, output_path: str, shard_size: int, workers: int = 4,
+                 compression: int = zipfile.ZIP_DEFLATED, max_pending: Optional[int] = None) -> None:
+        self.output_path = output_path
+        self.shard_size = shard_size
+        self.compression = compression
+        self._shards: List[_Shard] = []
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="varc_shard")
+        # Bounds the bytes of dumps waiting to be written, as each holds a temporary file
+        self.max_pending = max_pending if max_pending is not None else 2 * shard_size
+        self._pending = 0
+        self._pending_condition = threading.Condition()
+        self._futures: List[Future] = []
+
+    def submit(self, source: IO[bytes], member: str, dump_entry: dict, compress_type: Optional[int] = None,
+               remove_path: Optional[str] = None) -> None:
+        """Queues a dump to be written to a shard, blocking while too many bytes are queued
+
+        The shard the dump was written to is added to {dump_entry} as "Shard".
+
+        :param source: The dump, opened for reading. Closed once written
+        :param member: Member name of the dump
+        :param dump_entry: The dump manifest entry of the dump
+        :param compress_type: Compression for the dump, the shard default if None
+        :param remove_path: File to remove once the dump has been written, e.g. the temporary file {source} was opened from
+        """
+        size = os.fstat(source.fileno()).st_size
+        with self._pending_condition:
+            self._pending_condition.wait_for(lambda: not self._pending or self._pending + size <= self.max_pending)
+            self._pending += size
+        self._futures.append(self._executor.submit(self._write, source, size, member, dump_entry,
+                                                   self.compression if compress_type is None else compress_type,
+                                                   remove_path))
+
+    def _reserve(self, size: int) -> _Shard:
+        """Returns the fullest idle shard with room for {size} bytes, marked busy, opening a new shard if none have room"""
+        with self._condition:
+            fits = [shard for shard in self._shards
+                    if not shard.busy and (not shard.dumps or shard.size + size <= self.shard_size)]
+            if fits:
+                shard = max(fits, key=lambda fit: fit.size)
+            else:
+                shard = _Shard(shard_path(self.output_path, len(self._shards) + 1), self.compression)
+                self._shards.append(shard)
+            shard.busy = True
+            return shard
+
+    def _write(self, source: IO[bytes], size: int, member: str, dump_entry: dict, compress_type: int,
+               remove_path: Optional[str]) -> None:
+        try:
+            # The uncompressed size, so the shard stays under the bound whatever the dump compresses to
+            shard = self._reserve(size)
+            try:
+                info = zipfile.ZipInfo(member, time.localtime()[:6])
+                info.compress_type = compress_type
+                info.external_attr = 0o600 << 16
+                with shard.zip_file.open(info, "w", force_zip64=size > zipfile.ZIP64_LIMIT) as member_out:
+                    shutil.copyfileobj(source, member_out, _COPY_CHUNK)
+                dump_entry["Shard"] = shard.name
+                shard.dumps.append(dump_entry)
+            finally:
+                with self._condition:
+                    shard.size = shard.zip_file.start_dir
+                    shard.busy = False
+        finally:
+            source.close()
+            if remove_path:
+                os.remove(remove_path)
+            with self._pending_condition:
+                self._pending -= size
+                self._pending_condition.notify_all()
+
+    def close(self) -> List[str]:
+        """Waits for the queued dumps, then writes the capture index of each shard and closes it
+
+        :return: Paths of the shards
+        """
+        for future in self._futures:
+            try:
+                future.result()
+            except OSError as oserror:
+                logging.warning(f"Error writing process dump to shard. Error was {oserror}.")
+        self._executor.shutdown()
+        for shard in self._shards:
+            # Dumps in the shard itself have no "Shard", so the shard reads like any other capture
+            dumps = [{key: value for key, value in dump.items() if key != "Shard"} for dump in shard.dumps]
+            shard.zip_file.writestr(CAPTURE_INDEX_MEMBER, json.dumps(build_index(shard.zip_file.namelist(), dumps)))
+            shard.zip_file.close()
+            logging.info(f"Wrote {len(shard.dumps)} process dumps to shard {shard.path}")
+        return [shard.path for shard in self._shards]
+
+
+def write_manifest(output_path: str, shard_paths: List[str], dumps: List[dict]) -> str:
+    """Writes the manifest tying a capture and its shards together
+
+    :param output_path: Path to the capture zip
+    :param shard_paths: Paths of the shards
+    :param dumps: The dump manifest, with the "Shard" of each dump
+    :return: Path to the manifest
+    """
+    shard_dumps: Dict[str, List[str]] = {}
+    for dump in dumps:
+        shard_dumps.setdefault(dump.get("Shard", os.path.basename(output_path)), []).append(dump["Member"])
+    shards = []
+    for path in [output_path] + shard_paths:
+        name = os.path.basename(path)
+        shards.append({"Path": name, "Size": os.path.getsize(path), "Dumps": shard_dumps.get(name, [])})
+    manifest = {"format": "VarcShardManifest", "version": 1, "capture": os.path.basename(output_path), "shards": shards}
+    path = manifest_path(output_path)
+    with open(path, "w") as manifest_out:
+        json.dump(manifest, manifest_out, indent=1)
+    logging.info(f"Shard manifest written to {path}")
+    return path
+
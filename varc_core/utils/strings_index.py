@@ -0,0 +1,181 @@
+"""Inverted index of the strings in process memory dumps
+
+While dumps are carved, tokens - words, IPs, domains, URLs, paths, emails - are extracted from
+their text regions and mapped to the dumps and offsets they were found at, so a capture can be
+searched for e.g. an IP or token without decompressing and grepping every dump.
+
+Each distinct token is stored once however many processes hold it, with up to
+_MAX_OFFSETS_PER_DUMP offsets in each dump. Tokens are lowercased. Tokens containing ":", "/",
+"@" or "=" are also indexed by each of their parts, so "10.0.0.1:443" is found by "10.0.0.1".
+
+Format, native byte order, written uncompressed so it can be memory-mapped from the capture:
+header (magic, dump count, token count, posting count, dumps JSON length), the dumps as a JSON
+list of [member, pid] padded to 8 bytes, then the offset of each posting (uint64), the start of
+each token in the token blob and of its postings (uint32, token count + 1 each), the dump of
+each posting (uint32), and the token blob of sorted, concatenated tokens.
+"""
+import bisect
+import json
+import re
+import struct
+from array import array
+from typing import Dict, Iterable, Iterator, List, Literal, NamedTuple, Tuple
+
+STRINGS_INDEX_MEMBER = "strings_index.bin"
+
+_MAGIC = b"VSI1"
+_HEADER = struct.Struct("<4sIIII")
+_MAX_OFFSETS_PER_DUMP = 16
+_TOKEN_RE = re.compile(rb"[a-z0-9][a-z0-9_.:@/=\-]{3,127}")
+_SEPARATOR_RE = re.compile(rb"[:/@=]")
+_PART_RE = re.compile(rb"[^:/@=]{4,}")
+_TRAILING = b".:-_/@="
+
+
+class StringHit(NamedTuple):
+    token: str
+    member: str
+    pid: int
+    offset: int
+
+
+def tokens(data: bytes) -> Iterator[Tuple[bytes, int]]:
+    """Yields the lowercased tokens in {data} and their offsets
+
+    :param data: Bytes to search, e.g. a text region of a dump
+    """
+    for match in _TOKEN_RE.finditer(data.lower()):
+        token = match.group()
+        if token[-1] in _TRAILING:
+            token = token.rstrip(_TRAILING)
+            if len(token) < 4:
+                continue
+        yield token, match.start()
+        if _SEPARATOR_RE.search(token):
+            for part in _PART_RE.finditer(token):
+                part_token = part.group().strip(_TRAILING)
+                if len(part_token) >= 4 and part_token != token:
+                    yield part_token, match.start() + part.start()
+
+
+class StringsIndexBuilder:
+    """Builds a strings index, one dump at a time"""
+
+    def __init__(self) -> None:
+        self._dumps: List[Tuple[str, int]] = []
+        self._postings: Dict[bytes, List[Tuple[int, int]]] = {}
+
+    def add_dump(self, member: str, pid: int, regions: Iterable[Tuple[int, bytes]]) -> None:
+        """Indexes the text regions of a dump
+
+        :param member: The dump member
+        :param pid: The process the dump is of
+        :param regions: (offset in the dump, bytes) of each region to index
+        """
+        dump_number = len(self._dumps)
+        self._dumps.append((member, pid))
+        offsets: Dict[bytes, List[int]] = {}
+        for region_offset, data in regions:
+            for token, token_offset in tokens(data):
+                token_offsets = offsets.get(token)
+                if token_offsets is None:
+                    offsets[token] = [region_offset + token_offset]
+                elif len(token_offsets) < _MAX_OFFSETS_PER_DUMP:
+                    token_offsets.append(region_offset + token_offset)
+        for token, token_offsets in offsets.items():
+            self._postings.setdefault(token, []).extend((dump_number, offset) for offset in token_offsets)
+
+    def __len__(self) -> int:
+        return len(self._postings)
+
+    def to_bytes(self) -> bytes:
+        sorted_tokens = sorted(self._postings)
+        token_starts = array("I", [0])
+        posting_starts = array("I", [0])
+        posting_dumps = array("I")
+        posting_offsets = array("Q")
+        for token in sorted_tokens:
+            token_starts.append(token_starts[-1] + len(token))
+            for dump_number, offset in self._postings[token]:
+                posting_dumps.append(dump_number)
+                posting_offsets.append(offset)
+            posting_starts.append(len(posting_dumps))
+        dumps_json = json.dumps(self._dumps).encode()
+        dumps_json += b" " * (-(_HEADER.size + len(dumps_json)) % 8)
+        header = _HEADER.pack(_MAGIC, len(self._dumps), len(sorted_tokens), len(posting_dumps), len(dumps_json))
+        return b"".join([header, dumps_json, posting_offsets.tobytes(), token_starts.tobytes(),
+                         posting_starts.tobytes(), posting_dumps.tobytes(), b"".join(sorted_tokens)])
+
+
+class _Tokens:
+    """Sequence view of the sorted tokens, for use with bisect"""
+
+    def __init__(self, blob: memoryview, starts: memoryview) -> None:
+        self._blob = blob
+        self._starts = starts
+
+    def __len__(self) -> int:
+        return len(self._starts) - 1
+
+    def __getitem__(self, position: int) -> bytes:
+        return bytes(self._blob[self._starts[position]:self._starts[position + 1]])
+
+
+class StringsIndex:
+    """Reads a strings index without loading it, e.g. from a memory-mapped capture member
+
+    :param buffer: The index, as written by StringsIndexBuilder.to_bytes
+    :raises ValueError: If {buffer} isn't a strings index
+    """
+
+    def __init__(self, buffer: memoryview) -> None:
+        magic, dump_count, token_count, posting_count, dumps_length = _HEADER.unpack_from(buffer)
+        if magic != _MAGIC:
+            raise ValueError("Not a strings index")
+        position = _HEADER.size
+        self.dumps = [(member, pid) for member, pid in json.loads(bytes(buffer[position:position + dumps_length]))]
+        position += dumps_length
+        layout: List[Tuple[Literal["Q", "I"], int]] = [("Q", posting_count), ("I", token_count + 1),
+                                                      ("I", token_count + 1), ("I", posting_count)]
+        sections = []
+        for item_format, count in layout:
+            size = struct.calcsize(item_format) * count
+            sections.append(buffer[position:position + size].cast(item_format))
+            position += size
+        self._posting_offsets, token_starts, self._posting_starts, self._posting_dumps = sections
+        self._tokens = _Tokens(buffer[position:], token_starts)
+
+    def __len__(self) -> int:
+        return len(self._tokens)
+
+    def _hits(self, position: int) -> List[StringHit]:
+        token = self._tokens[position].decode()
+        hits = []
+        for posting in range(self._posting_starts[position], self._posting_starts[position + 1]):
+            member, pid = self.dumps[self._posting_dumps[posting]]
+            hits.append(StringHit(token, member, pid, self._posting_offsets[posting]))
+        return hits
+
+    def search(self, token: str, prefix: bool = False) -> List[StringHit]:
+        """Finds where a token was found
+
+        :param token: The token, matched case insensitively
+        :param prefix: Also match every token starting with {token}
+        :return: Hits in token order
+        """
+        query = token.lower().encode()
+        position = bisect.bisect_left(self._tokens, query)  # type: ignore
+        hits: List[StringHit] = []
+        while position < len(self._tokens):
+            found = self._tokens[position]
+            if found != query and not (prefix and found.startswith(query)):
+                break
+            hits += self._hits(position)
+            position += 1
+        return hits
+
+    def release(self) -> None:
+        """Releases the views of the buffer, so it can be closed"""
+        for view in (self._posting_offsets, self._posting_starts, self._posting_dumps,
+                     self._tokens._starts, self._tokens._blob):
+            view.release()
@@ -0,0 +1,167 @@
+"""Load YARA rules from compiled rule files, source files or directories of source files
+
+Source rules are compiled once and the compiled rules cached on disk, keyed by the SHA-256 of
+the sources, the files they include and the YARA version, so later runs load them in milliseconds. Each source file is
+compiled into a namespace named after its path relative to the rules directory.
+
+libyara builds a single ruleset from one compiler, so namespaces can't be compiled separately
+and merged. The whole set is compiled at once, and only if that fails are the namespaces
+compiled in parallel worker processes to find the broken ones, which are skipped so the rest
+of the rules are still used.
+"""
+import hashlib
+import logging
+import os
+import os.path
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Set
+
+import yara
+
+RULE_EXTENSIONS = (".yar", ".yara")
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "varc", "yara")
+# Compiled rule files start with this, source files can't
+_COMPILED_MAGIC = b"YARA"
+_INCLUDE = re.compile(rb'^[ \t]*include[ \t]+"([^"]+)"', re.MULTILINE)
+
+
+class YaraRulesError(Exception):
+    """Raised when no YARA rules could be loaded"""
+
+
+def is_compiled(path: str) -> bool:
+    """Returns True if {path} is a file of compiled rules, e.g. from yarac
+
+    :param path: Path of the rule file
+    """
+    with open(path, "rb") as rule_file:
+        return rule_file.read(len(_COMPILED_MAGIC)) == _COMPILED_MAGIC
+
+
+def rule_sources(path: str) -> Dict[str, str]:
+    """Returns the source rule files at {path}, by namespace
+
+    :param path: A source rule file, or a directory searched recursively for RULE_EXTENSIONS files
+    :return: Dict of namespace to file path, sorted by namespace
+    """
+    if not os.path.isdir(path):
+        return {os.path.splitext(os.path.basename(path))[0]: path}
+    sources = {}
+    for root, _, files in os.walk(path):
+        for file_name in files:
+            if file_name.lower().endswith(RULE_EXTENSIONS):
+                file_path = os.path.join(root, file_name)
+                namespace = os.path.splitext(os.path.relpath(file_path, path))[0].replace(os.sep, "/")
+                sources[namespace] = file_path
+    return dict(sorted(sources.items()))
+
+
+def _hash_source(sha256: "hashlib._Hash", file_path: str, included: Set[str]) -> None:
+    """Hashes a source file and, in the order they're included, every file it includes"""
+    with open(file_path, "rb") as source_file:
+        content = source_file.read()
+    sha256.update(f"\0{len(content)}\0".encode())
+    sha256.update(content)
+    for include in _INCLUDE.findall(content):
+        # Relative to the including file, as YARA resolves them
+        include_path = os.path.normpath(os.path.join(os.path.dirname(file_path), include.decode(errors="replace")))
+        sha256.update(f"\0include\0{include_path}\0".encode())
+        if include_path in included:
+            continue
+        included.add(include_path)
+        try:
+            _hash_source(sha256, include_path, included)
+        except OSError:
+            # Compiling reports it, and a file that appears later changes the key anyway
+            sha256.update(b"\0missing\0")
+
+
+def sources_digest(sources: Dict[str, str]) -> str:
+    """Returns the cache key of a set of source files, including the files they include
+
+    :param sources: Dict of namespace to file path
+    """
+    sha256 = hashlib.sha256(yara.__version__.encode())
+    for namespace, file_path in sources.items():
+        sha256.update(f"\0{namespace}".encode())
+        _hash_source(sha256, file_path, set())
+    return sha256.hexdigest()
+
+
+def _compile_error(file_path: str) -> Optional[str]:
+    """Compiles a single source file, returning the error or None if it compiles"""
+    try:
+        yara.compile(filepath=file_path)
+    except yara.Error as e:
+        return str(e)
+    return None
+
+
+def compile_rules(sources: Dict[str, str], max_workers: Optional[int] = None) -> yara.Rules:
+    """Compiles source files into a single set of rules, skipping any namespace that doesn't compile
+
+    :param sources: Dict of namespace to file path
+    :param max_workers: Maximum number of processes used to find broken namespaces
+    :raises YaraRulesError: If none of the namespaces compile
+    """
+    try:
+        return yara.compile(filepaths=sources)
+    except yara.Error as e:
+        if len(sources) == 1:
+            raise YaraRulesError(str(e))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        errors = dict(zip(sources, executor.map(_compile_error, sources.values())))
+    valid = {}
+    for namespace, file_path in sources.items():
+        if errors[namespace]:
+            logging.error(f"Skipping YARA rules {file_path}: {errors[namespace]}")
+        else:
+            valid[namespace] = file_path
+    if not valid:
+        raise YaraRulesError("None of the YARA rules compiled")
+    return yara.compile(filepaths=valid)
+
+
+def _save_cached(rules: yara.Rules, cache_path: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        partial_path = f"{cache_path}.{os.getpid()}.tmp"
+        rules.save(partial_path)
+        # Atomic, so concurrent runs never load a partly written cache
+        os.replace(partial_path, cache_path)
+    except (OSError, yara.Error) as e:
+        logging.warning(f"Unable to cache compiled YARA rules at {cache_path}: {e}")
+
+
+def load_rules(path: str, cache_dir: Optional[str] = DEFAULT_CACHE_DIR) -> yara.Rules:
+    """Loads YARA rules, compiling and caching source rules
+
+    :param path: A compiled rule file, a source rule file or a directory of source rule files
+    :param cache_dir: Directory to cache compiled source rules in, or None to always compile
+    :raises YaraRulesError: If the rules can't be read or compiled
+    :return: The rules, ready to match
+    """
+    started = time.monotonic()
+    try:
+        if os.path.isfile(path) and is_compiled(path):
+            rules = yara.load(path)
+            source = "compiled rules"
+        else:
+            sources = rule_sources(path)
+            if not sources:
+                raise YaraRulesError(f"No YARA rule files ({', '.join(RULE_EXTENSIONS)}) found in {path}")
+            cache_path = os.path.join(cache_dir, f"{sources_digest(sources)}.yarac") if cache_dir else None
+            if cache_path and os.path.isfile(cache_path):
+                rules = yara.load(cache_path)
+                source = f"{len(sources)} source files, cached"
+            else:
+                rules = compile_rules(sources)
+                source = f"{len(sources)} source files, compiled"
+                if cache_path:
+                    _save_cached(rules, cache_path)
+    except (OSError, yara.Error) as e:
+        raise YaraRulesError(str(e))
+    logging.info(f"Loaded YARA rules from {path} ({source}) in {time.monotonic() - started:.3f}s")
+    return rules
@@ -0,0 +1,449 @@
+"""Watch mode - a lightweight sidecar that journals changes to processes, connections and open files
+
+Instead of building a capture each time, the process, socket and open file state is held in
+memory and sampled every few seconds, and only what changed - processes starting and exiting,
+new sockets, newly opened files - is appended to a rolling journal of lz4 compressed JSON lines.
+Each journal segment starts with a full snapshot, so the oldest segments can be removed and any
+segment still read on its own.
+
+Sampling reads /proc directly: each process is described in full when it first appears, after
+which only its executable and command line are re-read to notice it exec'ing something else. A
+single pass over every process's file descriptors finds both its open files and which process
+owns each socket in /proc/net. Sampling is slowed down to keep the CPU time it uses under a budget.
+
+When a change matches a rule, the process is collected in full into its own capture:
+
+    [{"name": "miner", "type": "process_start", "match": {"Command": "*stratum+tcp://*"}},
+     {"name": "reverse shell", "type": "connection", "match": {"Name": "*sh", "Remote Port": "4444"}}]
+
+Every field in "match" is a glob which must match the field of the change, "type" is optional.
+A process sampled between fork and exec first starts with its parent's command line, so rules on
+what a process runs should also match "process_exec", or leave out "type".
+"""
+import glob
+import json
+import logging
+import os
+import os.path
+import signal
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from fnmatch import fnmatch
+from functools import partial
+from typing import IO, Any, Callable, Dict, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+import lz4.frame  # type: ignore
+import psutil
+
+from varc_core.utils.proc_events import describe_process
+from varc_core.utils.string_manips import remove_special_characters
+
+CHANGE_PROCESS_START = "process_start"
+CHANGE_PROCESS_EXIT = "process_exit"
+CHANGE_PROCESS_EXEC = "process_exec"
+CHANGE_CONNECTION = "connection"
+CHANGE_OPEN_FILE = "open_file"
+
+_SEGMENT_PATTERN = "watch-*.jsonl.lz4"
+_SOCKET_TABLES = ("tcp", "tcp6", "udp", "udp6")
+_TCP_STATES = {"01": "ESTABLISHED", "02": "SYN_SENT", "03": "SYN_RECV", "04": "FIN_WAIT1", "05": "FIN_WAIT2",
+               "06": "TIME_WAIT", "07": "CLOSE", "08": "CLOSE_WAIT", "09": "LAST_ACK", "0A": "LISTEN",
+               "0B": "CLOSING"}
+# Descriptors of these aren't files worth journaling
+_PSEUDO_PATHS = ("/dev/", "/proc/", "/sys/")
+
+
+class Snapshot(NamedTuple):
+    """Processes by pid, sockets by inode and the open files of each process"""
+    processes: Dict[int, dict]
+    sockets: Dict[int, dict]
+    open_files: Dict[int, Set[str]]
+
+
+def _socket_address(hex_address: str) -> Tuple[str, int]:
+    """Converts an address from /proc/net, e.g. 0100007F:0050 to ("127.0.0.1", 80)"""
+    host, port = hex_address.split(":")
+    raw = bytes.fromhex(host)
+    if sys.byteorder == "little":
+        # Each 32 bit word of the address is in host byte order
+        raw = b"".join(raw[word:word + 4][::-1] for word in range(0, len(raw), 4))
+    return socket.inet_ntop(socket.AF_INET if len(raw) == 4 else socket.AF_INET6, raw), int(port, 16)
+
+
+def read_sockets(procfs_root: str = "/proc") -> Dict[int, dict]:
+    """Returns the TCP and UDP sockets in /proc/net by inode, without their owning process
+
+    :param procfs_root: Root of the proc filesystem
+    """
+    sockets: Dict[int, dict] = {}
+    for table in _SOCKET_TABLES:
+        try:
+            with open(os.path.join(procfs_root, "net", table), "r") as table_file:
+                next(table_file, None)
+                for line in table_file:
+                    fields = line.split()
+                    inode = int(fields[9])
+                    if not inode:
+                        # TIME_WAIT sockets belong to no one
+                        continue
+                    local_address, local_port = _socket_address(fields[1])
+                    remote_address, remote_port = _socket_address(fields[2])
+                    sockets[inode] = {"Protocol": table, "Local Address": local_address, "Local Port": local_port,
+                                      "Remote Address": remote_address, "Remote Port": remote_port,
+                                      "State": _TCP_STATES.get(fields[3], "") if table.startswith("tcp") else ""}
+        except OSError:
+            continue
+    return sockets
+
+
+def scan_descriptors(pids: Set[int], procfs_root: str = "/proc") -> Tuple[Dict[int, Set[str]], Dict[int, int]]:
+    """Reads the file descriptors of every process once
+
+    :param pids: The processes
+    :param procfs_root: Root of the proc filesystem
+    :return: The open files of each process, and the process owning each socket inode
+    """
+    open_files: Dict[int, Set[str]] = {}
+    socket_owners: Dict[int, int] = {}
+    for pid in pids:
+        fd_dir = os.path.join(procfs_root, str(pid), "fd")
+        try:
+            fds = os.listdir(fd_dir)
+        except OSError:
+            continue
+        paths = set()
+        for fd in fds:
+            try:
+                target = os.readlink(os.path.join(fd_dir, fd))
+            except OSError:
+                continue
+            if target.startswith("socket:["):
+                socket_owners[int(target[8:-1])] = pid
+            elif target.startswith("/") and not target.startswith(_PSEUDO_PATHS):
+                paths.add(target)
+        open_files[pid] = paths
+    return open_files, socket_owners
+
+
+def _start_time(pid: int, procfs_root: str) -> int:
+    try:
+        with open(os.path.join(procfs_root, str(pid), "stat"), "r") as stat_file:
+            # The command name can contain spaces and brackets, the fields after it can't
+            return int(stat_file.read().rsplit(")", 1)[1].split()[19])
+    except (OSError, IndexError, ValueError):
+        return 0
+
+
+def _exec_identity(process: dict) -> Tuple[str, str]:
+    return process.get("Executable Path", ""), process.get("Command", "")
+
+
+def read_exec_identity(pid: int, procfs_root: str = "/proc") -> Tuple[str, str]:
+    """Reads what a process is running, in the same form as describe_process, to notice it exec'ing
+
+    :return: The executable path and command line, or empty strings for whatever can't be read
+    """
+    process_dir = os.path.join(procfs_root, str(pid))
+    executable = command = ""
+    try:
+        executable = os.readlink(os.path.join(process_dir, "exe"))
+    except OSError:
+        pass
+    try:
+        with open(os.path.join(process_dir, "cmdline"), "rb") as cmdline_file:
+            command = cmdline_file.read().rstrip(b"\0").replace(b"\0", b" ").decode(errors="replace")
+    except OSError:
+        pass
+    return executable, command
+
+
+def diff_snapshots(old: Snapshot, new: Snapshot) -> List[dict]:
+    """Returns what changed between two snapshots - processes starting, exec'ing and exiting, new sockets and newly opened files"""
+    changes: List[dict] = []
+    for pid in sorted(new.processes.keys() - old.processes.keys()):
+        changes.append({"Type": CHANGE_PROCESS_START, "Process ID": pid, **new.processes[pid]})
+    for pid in sorted(new.processes.keys() & old.processes.keys()):
+        if _exec_identity(new.processes[pid]) != _exec_identity(old.processes[pid]):
+            changes.append({"Type": CHANGE_PROCESS_EXEC, "Process ID": pid, **new.processes[pid]})
+    for pid in sorted(old.processes.keys() - new.processes.keys()):
+        changes.append({"Type": CHANGE_PROCESS_EXIT, "Process ID": pid, "Name": old.processes[pid].get("Name", "")})
+    for inode in sorted(new.sockets.keys() - old.sockets.keys()):
+        sock = new.sockets[inode]
+        changes.append({"Type": CHANGE_CONNECTION, **sock,
+                        "Name": new.processes.get(sock["Process ID"], {}).get("Name", "")})
+    for pid, paths in sorted(new.open_files.items()):
+        for path in sorted(paths - old.open_files.get(pid, set())):
+            changes.append({"Type": CHANGE_OPEN_FILE, "Process ID": pid,
+                            "Name": new.processes.get(pid, {}).get("Name", ""), "Path": path})
+    return changes
+
+
+def load_watch_rules(rules_file: str) -> List[dict]:
+    """Loads the rules that trigger a targeted collection from a JSON file
+
+    :param rules_file: Path to a JSON list of {"name": ..., "type": ..., "match": {field: glob}}
+    :raises ValueError: If a rule has no name or match
+    """
+    with open(rules_file, "r") as rules_in:
+        rules = json.load(rules_in)
+    for rule in rules:
+        if "name" not in rule or not rule.get("match"):
+            raise ValueError(f"Watch rule is missing a name or match: {rule}")
+    return rules
+
+
+def rule_matches(rule: dict, change: dict) -> bool:
+    if rule.get("type") and rule["type"] != change["Type"]:
+        return False
+    return all(fnmatch(str(change.get(field, "")), pattern) for field, pattern in rule["match"].items())
+
+
+class RollingJournal:
+    """Appends JSON lines to lz4 compressed segments, keeping only the newest segments
+
+    :param journal_dir: Directory to write segments to
+    :param segment_size: Bytes of JSON in each segment before starting the next
+    :param max_segments: Number of segments kept
+    """
+
+    def __init__(self, journal_dir: str, segment_size: int = 16 * 1024 * 1024, max_segments: int = 8) -> None:
+        os.makedirs(journal_dir, exist_ok=True)
+        self.journal_dir = journal_dir
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        existing = sorted(glob.glob(os.path.join(journal_dir, _SEGMENT_PATTERN)))
+        self._number = int(os.path.basename(existing[-1]).split("-")[1].split(".")[0]) if existing else 0
+        self._segment: Optional[IO[bytes]] = None
+        self._written = 0
+
+    def write(self, records: List[dict], keyframe: Callable[[], dict]) -> None:
+        """Appends records, starting a new segment with {keyframe} if the current one is full
+
+        :param records: The records
+        :param keyframe: Returns the record each segment starts with, e.g. a full snapshot
+        """
+        if self._segment is None or self._written >= self.segment_size:
+            self._roll()
+            records = [keyframe()] + records
+        if not records:
+            return
+        data = "".join(json.dumps(record) + "\n" for record in records).encode()
+        self._segment.write(data)  # type: ignore
+        # Ends the lz4 block, so everything up to here can be read if the sidecar is killed
+        self._segment.flush()  # type: ignore
+        self._written += len(data)
+
+    def _roll(self) -> None:
+        if self._segment:
+            self._segment.close()
+        self._number += 1
+        path = os.path.join(self.journal_dir, f"watch-{self._number:06d}.jsonl.lz4")
+        self._segment = lz4.frame.open(path, "wb")
+        self._written = 0
+        segments = sorted(glob.glob(os.path.join(self.journal_dir, _SEGMENT_PATTERN)))
+        for old_segment in segments[:-self.max_segments]:
+            os.remove(old_segment)
+
+    def close(self) -> None:
+        if self._segment:
+            self._segment.close()
+            self._segment = None
+
+
+def read_watch_journal(journal_dir: str) -> Iterator[dict]:
+    """Yields the records of every segment in a watch journal, oldest first, ignoring a torn last line"""
+    for path in sorted(glob.glob(os.path.join(journal_dir, _SEGMENT_PATTERN))):
+        try:
+            with lz4.frame.open(path, "rb") as segment:
+                for line in segment:
+                    yield json.loads(line)
+        except (EOFError, RuntimeError, ValueError):
+            # The segment being written when the sidecar was killed
+            continue
+
+
+class Watcher:
+    """Samples processes, connections and open files, journaling what changes
+
+    :param journal_dir: Directory the rolling journal and triggered captures are written to
+    :param interval: Seconds between samples, stretched if sampling would use more than {cpu_budget}
+    :param cpu_budget: Fraction of a CPU sampling may use, e.g. 0.02 for 2%
+    :param rules: Rules that trigger a targeted collection of a process, see load_watch_rules
+    :param collect_options: Arguments to acquire_system for targeted collections, e.g. {"include_memory": True}
+    :param segment_size: Bytes of JSON in each journal segment
+    :param max_segments: Number of journal segments kept
+    :param procfs_root: Root of the proc filesystem
+    """
+
+    def __init__(
+        self,
+        journal_dir: str,
+        interval: float = 5.0,
+        cpu_budget: float = 0.02,
+        rules: Optional[List[dict]] = None,
+        collect_options: Optional[Dict[str, Any]] = None,
+        segment_size: int = 16 * 1024 * 1024,
+        max_segments: int = 8,
+        procfs_root: str = "/proc"
+    ) -> None:
+        self.journal_dir = journal_dir
+        self.interval = interval
+        self.cpu_budget = cpu_budget
+        self.rules = rules or []
+        self.collect_options = collect_options or {}
+        self.procfs_root = procfs_root
+        self.journal = RollingJournal(journal_dir, segment_size, max_segments)
+        self.snapshot: Optional[Snapshot] = None
+        self.snapshot_time = ""
+        self.samples = 0
+        self.cpu_seconds = 0.0
+        # Keyed by pid and start time, so a reused pid is a different process
+        self.collections: Dict[Tuple[int, int], Future] = {}
+        self._collector = ThreadPoolExecutor(max_workers=1, thread_name_prefix="varc_watch_collect")
+        self._stopped = threading.Event()
+        self._own_pid = os.getpid()
+
+    def sample(self) -> Snapshot:
+        """Takes a snapshot, only describing processes that weren't in the last one or have since exec'd"""
+        pids = {int(name) for name in os.listdir(self.procfs_root) if name.isdigit()} - {self._own_pid}
+        known = self.snapshot.processes if self.snapshot else {}
+        processes = {}
+        for pid in pids:
+            process = known.get(pid)
+            if process is not None:
+                identity = read_exec_identity(pid, self.procfs_root)
+                # Nothing can be read once the process has exited, which the next sample will notice
+                if identity == _exec_identity(process) or not any(identity):
+                    processes[pid] = process
+                    continue
+            processes[pid] = describe_process(pid, self.procfs_root)
+        open_files, socket_owners = scan_descriptors(pids, self.procfs_root)
+        sockets = read_sockets(self.procfs_root)
+        for inode, sock in sockets.items():
+            sock["Process ID"] = socket_owners.get(inode, 0)
+        return Snapshot(processes, sockets, open_files)
+
+    @staticmethod
+    def _keyframe(snapshot: Snapshot, taken: str) -> dict:
+        return {"Type": "snapshot", "Time": taken,
+                "Processes": [{"Process ID": pid, **process} for pid, process in sorted(snapshot.processes.items())],
+                "Connections": list(snapshot.sockets.values()),
+                "Open Files": {str(pid): sorted(paths) for pid, paths in snapshot.open_files.items() if paths}}
+
+    def step(self) -> List[dict]:
+        """Samples once, journals the changes since the last sample and runs the rules on them
+
+        :return: The changes, and any rules they triggered
+        """
+        started = time.thread_time()
+        snapshot = self.sample()
+        previous, previous_time = self.snapshot, self.snapshot_time
+        changes = diff_snapshots(previous, snapshot) if previous else []
+        now = datetime.utcnow().strftime("%Y-%m-%d %H:%M:%S.%f")
+        self.snapshot, self.snapshot_time = snapshot, now
+        # Forget the collections of processes that have exited
+        self.collections = {key: future for key, future in self.collections.items() if key[0] in snapshot.processes}
+        triggered = []
+        for change in changes:
+            change["Time"] = now
+            for rule in self.rules:
+                if rule_matches(rule, change) and change.get("Process ID"):
+                    capture = self.collect(change["Process ID"], rule["name"])
+                    if capture:
+                        triggered.append({"Type": "rule", "Time": now, "Rule": rule["name"],
+                                          "Process ID": change["Process ID"], "Capture": capture})
+        # A new segment starts from the snapshot the changes were made to, so replaying it doesn't apply them twice
+        base, base_time = (previous, previous_time) if previous else (snapshot, now)
+        self.journal.write(changes + triggered, lambda: self._keyframe(base, base_time))
+        self.samples += 1
+        self.cpu_seconds += time.thread_time() - started
+        return changes + triggered
+
+    def collect(self, pid: int, rule_name: str) -> Optional[str]:
+        """Starts a full collection of one process in the background, unless it's already been collected
+
+        :return: Path the capture will be written to, or None if the process has already been collected
+        """
+        key = (pid, _start_time(pid, self.procfs_root))
+        if key in self.collections:
+            return None
+        machine_name = remove_special_characters(socket.gethostname())
+        capture = os.path.join(self.journal_dir, f"{machine_name}-{pid}-{int(time.time())}.zip")
+        logging.warning(f"Watch rule {rule_name} triggered for pid {pid}, collecting it to {capture}")
+        self.collections[key] = self._collector.submit(self._collect_process, pid, capture)
+        self.collections[key].add_done_callback(partial(self._collected, pid))
+        return capture
+
+    @staticmethod
+    def _collected(pid: int, collection: Future) -> None:
+        # Nothing waits on collections, so anything they raise would otherwise be lost
+        if not collection.cancelled() and collection.exception():
+            logging.error(f"Collecting pid {pid} failed", exc_info=collection.exception())
+
+    def _collect_process(self, pid: int, capture: str) -> None:
+        from varc_core.systems import acquire_system
+        try:
+            acquire_system(process_id=pid, output_path=capture, **self.collect_options)
+        except (psutil.Error, OSError, ValueError) as collect_error:
+            logging.warning(f"Could not collect pid {pid}: {collect_error}")
+
+    def run(self, duration: Optional[float] = None) -> None:
+        """Samples until stopped or for {duration} seconds, keeping within the CPU budget
+
+        :param duration: Seconds to watch for, forever if None
+        """
+        logging.info(f"Watching every {self.interval}s within {self.cpu_budget:.1%} CPU, journaling to {self.journal_dir}")
+        started = time.monotonic()
+        stretched = False
+        while not self._stopped.is_set() and (duration is None or time.monotonic() - started < duration):
+            sample_started = time.monotonic()
+            cpu_before = self.cpu_seconds
+            self.step()
+            # Sampling may only use {cpu_budget} of the time until the next sample
+            delay = max(self.interval, (self.cpu_seconds - cpu_before) / self.cpu_budget)
+            if (delay > self.interval) != stretched:
+                stretched = delay > self.interval
+                logging.info(f"Sampling interval stretched to {delay:.1f}s to stay within the CPU budget" if stretched
+                             else f"Sampling interval back to {self.interval}s")
+            self._stopped.wait(max(0.0, delay - (time.monotonic() - sample_started)))
+
+    def stop(self) -> None:
+        self._stopped.set()
+
+    def close(self) -> None:
+        """Waits for any targeted collections, then closes the journal"""
+        self._collector.shutdown()
+        self.journal.close()
+        if self.samples:
+            logging.info(f"Took {self.samples} samples using {self.cpu_seconds:.2f}s of CPU, "
+                         f"{1000 * self.cpu_seconds / self.samples:.1f}ms per sample")
+
+
+def watch(
+    journal_dir: str,
+    interval: float = 5.0,
+    cpu_budget: float = 0.02,
+    rules_file: Optional[str] = None,
+    collect_options: Optional[Dict[str, Any]] = None,
+    duration: Optional[float] = None
+) -> Watcher:
+    """Watches this system until interrupted, terminated or for {duration} seconds
+
+    :return: The watcher, once closed
+    """
+    watcher = Watcher(journal_dir, interval, cpu_budget, load_watch_rules(rules_file) if rules_file else None,
+                      collect_options)
+    if threading.current_thread() is threading.main_thread():
+        # Sidecars are stopped with SIGTERM, finish the sample being taken and close the journal
+        signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+    try:
+        watcher.run(duration)
+    except KeyboardInterrupt:
+        logging.info("Watch interrupted, stopping")
+    finally:
+        watcher.close()
+    return watcher